@@ -0,0 +1,529 @@
+"""Invoice, reminder and account statement PDF layout.
+
+Kept out of server.py because ReportLab is slow to import; the server loads
+this module on the first render (see load_pdf_rendering).
+"""
+import io
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFCatalog, PDFDate, PDFDictionary, PDFName, PDFStream, PDFString
+from reportlab.pdfbase.pdfdoc import format as pdf_format
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, KeepTogether, CondPageBreak
+
+try:
+    from PIL import ImageCms
+except ImportError:  # Pillow is optional, ZUGFeRD PDFs then lack the sRGB output intent
+    ImageCms = None
+
+# Styles, table styles and the company header/footer only depend on company
+# data, so they are built once and reused; each render only lays out the
+# invoice-specific parts. That includes the decoded logo, so a render never
+# reads or decodes the image file again.
+PDF_COMPANY_FIELDS = ('company_name', 'address', 'postal_code', 'city', 'bank_name', 'iban', 'bic', 'logo_path')
+ITEM_TABLE_HEADER = ['Pos.', 'Beschreibung', 'Menge', 'Einzelpreis', 'Gesamt']
+ITEM_COLUMN_WIDTHS = [30, 200, 60, 80, 80]
+ITEM_DESCRIPTION_WIDTH = ITEM_COLUMN_WIDTHS[1] - 12  # column width minus cell padding
+TOTALS_COLUMN_WIDTHS = [300, 100]
+FRAME_WIDTH = A4[0] - 2 * inch - 12  # SimpleDocTemplate's 1 inch margins minus the frame padding
+LOGO_BOX = (150, 50)  # points, top right corner of the first page
+
+@lru_cache(maxsize=1)
+def get_pdf_styles():
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle('ItemCell', parent=styles['Normal'], fontSize=9, leading=11))
+    return styles
+
+DETAILS_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+])
+
+ITEMS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+TOTALS_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
+])
+
+STATEMENT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+    ('FONTNAME', (0, 1), (-1, 1), 'Helvetica-Oblique'),
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+])
+
+def measure_row_heights(rows: list, col_widths: list, style: TableStyle) -> tuple:
+    sample = Table(rows, colWidths=col_widths)
+    sample.setStyle(style)
+    sample.wrap(sum(col_widths), A4[1])
+    return tuple(sample._rowHeights)
+
+@lru_cache(maxsize=1)
+def get_row_heights() -> dict:
+    """Heights of one-line table rows, measured once.
+    
+    Rows with a given height skip ReportLab's per-cell measuring, which it
+    otherwise repeats for all remaining rows at every page break.
+    """
+    item_header, item = measure_row_heights(
+        [ITEM_TABLE_HEADER, ['1', 'x', '1.00', '€1.00', '€1.00']], ITEM_COLUMN_WIDTHS, ITEMS_TABLE_STYLE
+    )
+    totals = measure_row_heights([['Zwischensumme:', '€1.00']] * 3, TOTALS_COLUMN_WIDTHS, TOTALS_TABLE_STYLE)
+    return {"item_header": item_header, "item": item, "totals": totals}
+
+class ParsedParagraph:
+    """Paragraph markup parsed once; every render gets its own Paragraph over the shared fragments.
+    
+    Parsing dominates the cost of a short Paragraph, and a laid-out Paragraph
+    keeps per-document state, so the parse result is what can be shared.
+    """
+    def __init__(self, text: str, style):
+        parsed = Paragraph(text, style)
+        self.text, self.style, self.frags = parsed.text, parsed.style, parsed.frags
+    
+    def __call__(self, text: Optional[str] = None) -> Paragraph:
+        """The parsed paragraph, or for a single-fragment one, the same formatting with plain `text`"""
+        if text is None:
+            return Paragraph(self.text, self.style, frags=self.frags)
+        frag, = self.frags
+        return Paragraph(escape(text), self.style, frags=[frag.clone(text=text)])
+
+@lru_cache(maxsize=1)
+def get_text_paragraphs() -> dict:
+    """Formatting templates for one-line plain-text paragraphs"""
+    styles = get_pdf_styles()
+    return {
+        'normal': ParsedParagraph("x", styles['Normal']),
+        'bold': ParsedParagraph("<b>x</b>", styles['Normal']),
+        'heading': ParsedParagraph("<b>x</b>", styles['Heading1']),
+    }
+
+class CompanyPdfFragments:
+    """Company-specific parts of the invoice PDF, built once per company profile"""
+    def __init__(self, company: dict):
+        def field(name, default=''):
+            return escape(str(company.get(name) or default))
+        
+        styles = get_pdf_styles()
+        self.company_name = str(company.get('company_name') or '')
+        self.header_name = f"<b>{field('company_name')}</b>"
+        self.header_address = f"{field('address')}<br/>{field('postal_code')} {field('city')}"
+        self.bank_details = (
+            f"Bank: {field('bank_name', 'N/A')}<br/>"
+            f"IBAN: {field('iban', 'N/A')}<br/>"
+            f"BIC: {field('bic', 'N/A')}<br/>"
+        )
+        self.header_name_paragraph = ParsedParagraph(self.header_name, styles['Title'])
+        self.header_address_paragraph = ParsedParagraph(self.header_address, styles['Normal'])
+        self.bank_paragraph = ParsedParagraph(self.bank_details[:-len("<br/>")], styles['Normal'])
+        # payment_footer() is two lines, the bank paragraph and one more line
+        self.payment_footer_height = (
+            3 * styles['Normal'].leading + self.bank_paragraph().wrap(FRAME_WIDTH, A4[1])[1]
+        )
+        self.logo = None
+        if company.get('logo_path'):
+            self.logo = ImageReader(company['logo_path'])
+            self.logo.getRGBData()  # decode now, not on the first render
+            width, height = self.logo.getSize()
+            scale = min(LOGO_BOX[0] / width, LOGO_BOX[1] / height)
+            self.logo_size = (width * scale, height * scale)
+    
+    def header(self) -> list:
+        return [self.header_name_paragraph(), self.header_address_paragraph(), Spacer(1, 20)]
+    
+    def payment_footer(self, due_date: str, invoice_number: str) -> list:
+        """Payment instructions; Normal has no paragraph spacing, so the static
+        bank lines can be their own (pre-parsed) paragraph"""
+        text = get_text_paragraphs()
+        return [
+            text['bold']("Zahlungshinweise:"),
+            text['normal'](f"Bitte überweisen Sie den Betrag bis zum {due_date}."),
+            self.bank_paragraph(),
+            text['normal'](f"Verwendungszweck: {invoice_number}")
+        ]
+    
+    def draw_page(self, canvas, doc):
+        """Page decoration so multi-page invoices stay identifiable"""
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawString(doc.leftMargin, 20, self.company_name)
+        canvas.drawRightString(doc.pagesize[0] - doc.rightMargin, 20, f"Seite {doc.page}")
+        canvas.restoreState()
+    
+    def draw_first_page(self, canvas, doc):
+        if self.logo is not None:
+            width, height = self.logo_size
+            canvas.drawImage(
+                self.logo,
+                doc.pagesize[0] - doc.rightMargin - width,
+                doc.pagesize[1] - (doc.topMargin + height) / 2,
+                width, height
+            )
+        self.draw_page(canvas, doc)
+
+@lru_cache(maxsize=16)
+def _build_company_pdf_fragments(company_key: tuple) -> CompanyPdfFragments:
+    return CompanyPdfFragments(dict(zip(PDF_COMPANY_FIELDS, company_key)))
+
+def get_company_pdf_fragments(company: dict) -> CompanyPdfFragments:
+    return _build_company_pdf_fragments(tuple(company.get(name) for name in PDF_COMPANY_FIELDS))
+
+def render_invoice_pdf(invoice: dict, customer: dict, company: dict, canvasmaker=Canvas) -> io.BytesIO:
+    """Lay out an invoice PDF from the cached company fragments"""
+    fragments = get_company_pdf_fragments(company)
+    styles = get_pdf_styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = []
+    
+    # Company header
+    story.extend(fragments.header())
+    
+    # Invoice title
+    text = get_text_paragraphs()
+    story.append(text['heading'](f"RECHNUNG {invoice['invoice_number']}"))
+    story.append(Spacer(1, 12))
+    
+    # Customer info, one paragraph per line so no markup has to be parsed
+    story.append(text['bold']("Rechnungsadresse:"))
+    story.append(text['normal'](customer['name']))
+    story.append(text['normal'](customer['address']))
+    story.append(text['normal'](f"{customer['postal_code']} {customer['city']}"))
+    story.append(Spacer(1, 20))
+    
+    # Invoice details
+    invoice_date = datetime.fromisoformat(invoice['invoice_date']).strftime('%d.%m.%Y')
+    due_date = datetime.fromisoformat(invoice['due_date']).strftime('%d.%m.%Y')
+    details_table = Table([
+        ['Rechnungsdatum:', invoice_date],
+        ['Fälligkeitsdatum:', due_date]
+    ], colWidths=[100, 100])
+    details_table.setStyle(DETAILS_TABLE_STYLE)
+    story.append(details_table)
+    story.append(Spacer(1, 20))
+    
+    # Line items, header row repeats on every page. Only descriptions that do
+    # not fit on one line need a (much slower to lay out) wrapping Paragraph;
+    # all other rows get their height up front.
+    item_style = styles['ItemCell']
+    row_heights = get_row_heights()
+    table_data = [ITEM_TABLE_HEADER]
+    item_row_heights = [row_heights['item_header']]
+    wrapped_rows = []
+    for i, item in enumerate(invoice['items'], 1):
+        description = item['description']
+        if '\n' in description or stringWidth(description, 'Helvetica', 9) > ITEM_DESCRIPTION_WIDTH:
+            description = Paragraph(escape(description), item_style)
+            item_row_heights.append(None)
+            wrapped_rows.append(('VALIGN', (0, i), (-1, i), 'TOP'))
+        else:
+            item_row_heights.append(row_heights['item'])
+        table_data.append([
+            str(i),
+            description,
+            f"{item['quantity']:.2f}",
+            f"€{item['unit_price']:.2f}",
+            f"€{item['total_price']:.2f}"
+        ])
+    items_table = Table(table_data, colWidths=ITEM_COLUMN_WIDTHS, rowHeights=item_row_heights, repeatRows=1)
+    items_table.setStyle(ITEMS_TABLE_STYLE)
+    if wrapped_rows:
+        items_table.setStyle(TableStyle(wrapped_rows))
+    story.append(items_table)
+    story.append(Spacer(1, 20))
+    
+    # Totals and payment footer stay together on the last page. Their height
+    # is known up front, so a conditional page break does what KeepTogether
+    # would, without laying the block out twice.
+    tax_label = f"MwSt. ({invoice.get('tax_rate', 19.0):g}%):" if invoice.get('apply_tax', True) else "MwSt. (befreit):"
+    totals_table = Table([
+        ['Zwischensumme:', f"€{invoice['subtotal']:.2f}"],
+        [tax_label, f"€{invoice['tax_amount']:.2f}"],
+        ['Gesamtbetrag:', f"€{invoice['total_amount']:.2f}"]
+    ], colWidths=TOTALS_COLUMN_WIDTHS, rowHeights=row_heights['totals'])
+    totals_table.setStyle(TOTALS_TABLE_STYLE)
+    story.append(CondPageBreak(sum(row_heights['totals']) + 30 + fragments.payment_footer_height))
+    story.append(totals_table)
+    story.append(Spacer(1, 30))
+    story.extend(fragments.payment_footer(due_date, invoice['invoice_number']))
+    
+    doc.build(story, onFirstPage=fragments.draw_first_page, onLaterPages=fragments.draw_page, canvasmaker=canvasmaker)
+    buffer.seek(0)
+    return buffer
+
+def render_dunning_pdf(invoice: dict, customer: dict, company: dict, notice: dict) -> io.BytesIO:
+    """Lay out a payment reminder for an overdue invoice"""
+    fragments = get_company_pdf_fragments(company)
+    styles = get_pdf_styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = fragments.header()
+    
+    story.append(Paragraph(
+        f"{escape(customer['name'])}<br/>{escape(customer['address'])}<br/>"
+        f"{escape(customer['postal_code'])} {escape(customer['city'])}",
+        styles['Normal']
+    ))
+    story.append(Spacer(1, 20))
+    
+    story.append(Paragraph(
+        f"<b>{escape(notice['title'].upper())} zu Rechnung {escape(invoice['invoice_number'])}</b>",
+        styles['Heading1']
+    ))
+    story.append(Spacer(1, 12))
+    
+    invoice_date = datetime.fromisoformat(invoice['invoice_date']).strftime('%d.%m.%Y')
+    due_date = datetime.fromisoformat(invoice['due_date']).strftime('%d.%m.%Y')
+    deadline = notice['payment_deadline'].strftime('%d.%m.%Y')
+    story.append(Paragraph(
+        f"Sehr geehrte Damen und Herren,<br/><br/>"
+        f"unsere Rechnung {escape(invoice['invoice_number'])} vom {invoice_date} war am {due_date} fällig. "
+        f"Bis heute konnten wir keinen Zahlungseingang feststellen. Bitte überweisen Sie den offenen "
+        f"Betrag bis zum {deadline}. Sollten Sie die Zahlung bereits veranlasst haben, "
+        f"betrachten Sie dieses Schreiben bitte als gegenstandslos.",
+        styles['Normal']
+    ))
+    story.append(Spacer(1, 20))
+    
+    totals_table = Table([
+        ['Rechnungsbetrag:', f"€{invoice['total_amount']:.2f}"],
+        ['Mahngebühren:', f"€{notice['total_fees']:.2f}"],
+        ['Offener Betrag:', f"€{notice['open_amount']:.2f}"]
+    ], colWidths=[300, 100])
+    totals_table.setStyle(TOTALS_TABLE_STYLE)
+    story.append(KeepTogether([
+        totals_table,
+        Spacer(1, 30),
+        *fragments.payment_footer(deadline, invoice['invoice_number'])
+    ]))
+    
+    doc.build(story, onFirstPage=fragments.draw_first_page, onLaterPages=fragments.draw_page)
+    buffer.seek(0)
+    return buffer
+
+def format_statement_date(value: str) -> str:
+    return datetime.fromisoformat(value).strftime('%d.%m.%Y')
+
+def render_statement_pdf(statement: dict, company: dict) -> io.BytesIO:
+    """Lay out a customer account statement; the entry table repeats its header on every page"""
+    fragments = get_company_pdf_fragments(company)
+    styles = get_pdf_styles()
+    customer = statement['customer']
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = fragments.header()
+    
+    story.append(Paragraph(
+        f"{escape(customer['name'])}<br/>{escape(customer['address'])}<br/>"
+        f"{escape(customer['postal_code'])} {escape(customer['city'])}",
+        styles['Normal']
+    ))
+    story.append(Spacer(1, 20))
+    
+    period_from = format_statement_date(statement['period_from'])
+    period_to = format_statement_date(statement['period_to'])
+    story.append(Paragraph("<b>KONTOAUSZUG</b>", styles['Heading1']))
+    story.append(Paragraph(f"Zeitraum {period_from} bis {period_to}", styles['Normal']))
+    story.append(Spacer(1, 20))
+    
+    # Descriptions are short generated strings, plain cells lay out fastest
+    table_data = [
+        ['Datum', 'Beleg', 'Buchungstext', 'Soll', 'Haben', 'Saldo'],
+        [period_from, '', 'Saldovortrag', '', '', f"€{statement['opening_balance']:.2f}"]
+    ]
+    for entry in statement['entries']:
+        table_data.append([
+            format_statement_date(entry['date']),
+            entry['reference'],
+            entry['description'],
+            f"€{entry['debit']:.2f}" if entry['debit'] else '',
+            f"€{entry['credit']:.2f}" if entry['credit'] else '',
+            f"€{entry['balance']:.2f}"
+        ])
+    table_data.append([
+        period_to, '', 'Summe / Endsaldo',
+        f"€{statement['total_debit']:.2f}",
+        f"€{statement['total_credit']:.2f}",
+        f"€{statement['closing_balance']:.2f}"
+    ])
+    entries_table = Table(table_data, colWidths=[55, 65, 145, 62, 62, 62], repeatRows=1)
+    entries_table.setStyle(STATEMENT_TABLE_STYLE)
+    story.append(entries_table)
+    story.append(Spacer(1, 30))
+    
+    closing_balance = statement['closing_balance']
+    if closing_balance > 0:
+        footer = (
+            f"<b>Offener Saldo: €{closing_balance:.2f}</b><br/>"
+            f"Bitte überweisen Sie fällige Beträge unter Angabe der Rechnungsnummer.<br/>"
+            f"{fragments.bank_details}"
+        )
+    elif closing_balance < 0:
+        footer = f"<b>Guthaben zu Ihren Gunsten: €{-closing_balance:.2f}</b>"
+    else:
+        footer = "<b>Ihr Konto ist ausgeglichen.</b>"
+    story.append(KeepTogether([Paragraph(footer, styles['Normal'])]))
+    
+    doc.build(story, onFirstPage=fragments.draw_first_page, onLaterPages=fragments.draw_page)
+    buffer.seek(0)
+    return buffer
+
+# ZUGFeRD / Factur-X (PDF/A-3 with embedded CII XML)
+FACTURX_XMP = """<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+<rdf:Description rdf:about="" xmlns:pdfaid="http://www.aiim.org/pdfa/ns/id/">
+<pdfaid:part>3</pdfaid:part><pdfaid:conformance>B</pdfaid:conformance>
+</rdf:Description>
+<rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:title><rdf:Alt><rdf:li xml:lang="x-default">{title}</rdf:li></rdf:Alt></dc:title>
+<dc:creator><rdf:Seq><rdf:li>{author}</rdf:li></rdf:Seq></dc:creator>
+<dc:description><rdf:Alt><rdf:li xml:lang="x-default">{subject}</rdf:li></rdf:Alt></dc:description>
+</rdf:Description>
+<rdf:Description rdf:about="" xmlns:pdf="http://ns.adobe.com/pdf/1.3/">
+<pdf:Producer>{producer}</pdf:Producer>
+</rdf:Description>
+<rdf:Description rdf:about="" xmlns:xmp="http://ns.adobe.com/xap/1.0/">
+<xmp:CreatorTool>{creator}</xmp:CreatorTool>
+<xmp:CreateDate>{date}</xmp:CreateDate><xmp:ModifyDate>{date}</xmp:ModifyDate>
+</rdf:Description>
+<rdf:Description rdf:about="" xmlns:pdfaExtension="http://www.aiim.org/pdfa/ns/extension/"
+  xmlns:pdfaSchema="http://www.aiim.org/pdfa/ns/schema#" xmlns:pdfaProperty="http://www.aiim.org/pdfa/ns/property#">
+<pdfaExtension:schemas><rdf:Bag><rdf:li rdf:parseType="Resource">
+<pdfaSchema:schema>Factur-X PDFA Extension Schema</pdfaSchema:schema>
+<pdfaSchema:namespaceURI>urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#</pdfaSchema:namespaceURI>
+<pdfaSchema:prefix>fx</pdfaSchema:prefix>
+<pdfaSchema:property><rdf:Seq>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>DocumentFileName</pdfaProperty:name><pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category><pdfaProperty:description>Name of the embedded XML invoice file</pdfaProperty:description></rdf:li>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>DocumentType</pdfaProperty:name><pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category><pdfaProperty:description>INVOICE</pdfaProperty:description></rdf:li>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>Version</pdfaProperty:name><pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category><pdfaProperty:description>Version of the Factur-X XML schema</pdfaProperty:description></rdf:li>
+<rdf:li rdf:parseType="Resource"><pdfaProperty:name>ConformanceLevel</pdfaProperty:name><pdfaProperty:valueType>Text</pdfaProperty:valueType><pdfaProperty:category>external</pdfaProperty:category><pdfaProperty:description>Conformance level of the embedded XML invoice</pdfaProperty:description></rdf:li>
+</rdf:Seq></pdfaSchema:property>
+</rdf:li></rdf:Bag></pdfaExtension:schemas>
+</rdf:Description>
+<rdf:Description rdf:about="" xmlns:fx="urn:factur-x:pdfa:CrossIndustryDocument:invoice:1p0#">
+<fx:DocumentType>INVOICE</fx:DocumentType><fx:DocumentFileName>factur-x.xml</fx:DocumentFileName>
+<fx:Version>1.0</fx:Version><fx:ConformanceLevel>EN 16931</fx:ConformanceLevel>
+</rdf:Description>
+</rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>"""
+
+class UnfilteredPDFStream(PDFStream):
+    """Stream written without compression, as PDF/A requires for XMP metadata"""
+    def format(self, document):
+        dictionary = PDFDictionary(self.dictionary.dict.copy())
+        dictionary["Length"] = len(self.content)
+        return pdf_format(dictionary, document) + b"\nstream\n" + self.content + b"\nendstream\n"
+
+@lru_cache(maxsize=1)
+def get_srgb_icc_profile() -> Optional[bytes]:
+    if ImageCms is None:
+        return None
+    return ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+
+class FacturXCanvas(Canvas):
+    """Canvas that attaches factur-x.xml and PDF/A-3 metadata when saved"""
+    def __init__(self, *args, facturx_xml: bytes = b"", document_info: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.facturx_xml = facturx_xml
+        self.document_info = document_info or {}
+    
+    def save(self):
+        # Set here, SimpleDocTemplate overwrites the info after creating the canvas.
+        # PDF/A requires the info dictionary to match the XMP metadata.
+        self.setTitle(self.document_info.get("title", ""))
+        self.setAuthor(self.document_info.get("author", ""))
+        self.setSubject(self.document_info.get("subject", ""))
+        self.setCreator("RechnungsManager")
+        doc = self._doc
+        info = doc.info
+        year, month, day, hour, minute, second = doc._timeStamp.YMDhms
+        xmp_date = f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}" \
+                   f"{doc._timeStamp.dhh:+03d}:{doc._timeStamp.dmm:02d}"
+        xmp = FACTURX_XMP.format(
+            title=escape(info.title), author=escape(info.author), subject=escape(info.subject),
+            producer=escape(info.producer), creator=escape(info.creator), date=xmp_date
+        )
+        
+        embedded = PDFStream(PDFDictionary({
+            "Type": PDFName("EmbeddedFile"),
+            "Subtype": b"/text#2Fxml",  # pre-encoded, PDFName would not escape the slash
+            "Params": PDFDictionary({"Size": len(self.facturx_xml), "ModDate": PDFDate(ts=doc._timeStamp)})
+        }), self.facturx_xml)
+        filespec = doc.Reference(PDFDictionary({
+            "Type": PDFName("Filespec"),
+            "F": PDFString("factur-x.xml"),
+            "UF": PDFString("factur-x.xml"),
+            "Desc": PDFString("Factur-X/ZUGFeRD invoice"),
+            "AFRelationship": PDFName("Alternative"),
+            "EF": PDFDictionary({"F": embedded, "UF": embedded})
+        }))
+        
+        catalog = doc.Catalog
+        # PDFCatalog only writes keys it knows about; AF and OutputIntents are PDF 2.0/PDF/A keys
+        catalog.__NoDefault__ = PDFCatalog.__NoDefault__ + ["AF", "OutputIntents"]
+        catalog.__Refs__ = catalog.__NoDefault__
+        catalog.AF = PDFArray([filespec])
+        catalog.Names = PDFDictionary({
+            "EmbeddedFiles": PDFDictionary({"Names": PDFArray([PDFString("factur-x.xml"), filespec])})
+        })
+        catalog.Metadata = UnfilteredPDFStream(
+            PDFDictionary({"Type": PDFName("Metadata"), "Subtype": PDFName("XML")}),
+            xmp.encode("utf-8")
+        )
+        icc_profile = get_srgb_icc_profile()
+        if icc_profile:
+            catalog.OutputIntents = PDFArray([PDFDictionary({
+                "Type": PDFName("OutputIntent"),
+                "S": PDFName("GTS_PDFA1"),
+                "OutputConditionIdentifier": PDFString("sRGB"),
+                "Info": PDFString("sRGB IEC61966-2.1"),
+                "DestOutputProfile": PDFStream(PDFDictionary({"N": 3}), icc_profile)
+            })])
+        super().save()
+
+def render_facturx_pdf(invoice: dict, customer: dict, company: dict, xml: bytes) -> io.BytesIO:
+    """Invoice PDF with the given CII XML embedded as factur-x.xml"""
+    document_info = {
+        "title": f"Rechnung {invoice['invoice_number']}",
+        "author": company.get("company_name") or "",
+        "subject": f"Rechnung {invoice['invoice_number']} an {customer['name']}"
+    }
+    
+    def canvasmaker(*args, **kwargs):
+        return FacturXCanvas(*args, facturx_xml=xml, document_info=document_info, **kwargs)
+    
+    return render_invoice_pdf(invoice, customer, company, canvasmaker=canvasmaker)
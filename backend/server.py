@@ -1,41 +1,388 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, BackgroundTasks, Request, Response, Query, Header, Depends
+from fastapi.routing import APIRoute
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne, ReplaceOne, DeleteOne, monitoring
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from contextlib import asynccontextmanager, contextmanager
 import os
 import logging
+import asyncio
+import socket
+import sys
+import threading
+import contextvars
+import uuid
+import json
+import hashlib
+import hmac
+import shutil
+import re
+import csv
+import calendar
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
-import uuid
+from typing import List, Optional, Literal, Union
+import gzip
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 import base64
 from decimal import Decimal
-import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
-from email import encoders
-from jinja2 import Environment, FileSystemLoader
+from email import encoders, message_from_string
 import io
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
+from xml.sax.saxutils import XMLGenerator
+from functools import lru_cache
 from email.utils import formataddr
 
+try:
+    import brotli
+except ImportError:  # brotli is optional, responses fall back to gzip
+    brotli = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Query statistics
+# A command listener on the client sees every command the app sends, including
+# cursor getMores and bulk writes, and groups them by query shape: collection,
+# operation, filter keys and operators (values dropped), sort and pipeline
+# stages. Each shape keeps call count, latency and documents returned.
+# Commands slower than MONGO_SLOW_QUERY_MS are logged with an explain summary
+# (at most once per shape every MONGO_EXPLAIN_INTERVAL_SECONDS).
+MONGO_SLOW_QUERY_MS = float(os.environ.get('MONGO_SLOW_QUERY_MS', 100))
+MONGO_EXPLAIN_INTERVAL_SECONDS = int(os.environ.get('MONGO_EXPLAIN_INTERVAL_SECONDS', 300))
+MONGO_QUERY_SHAPES_LIMIT = 2000
+MONGO_OPEN_CURSORS_LIMIT = 10000
+QUERY_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "insert", "update", "delete", "getMore"}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+def normalize_filter(value):
+    """Filter with every value replaced by "?", keeping fields and operators"""
+    if isinstance(value, dict):
+        return {
+            key: [normalize_filter(item) for item in item_value]
+            if key in ("$and", "$or", "$nor") and isinstance(item_value, list)
+            else normalize_filter(item_value)
+            for key, item_value in sorted(value.items())
+        }
+    return "?"
+
+def shape_text(value) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+def pipeline_shape(pipeline: list) -> str:
+    stages = []
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        if name == "$match":
+            stages.append(f"$match{shape_text(normalize_filter(spec))}")
+        elif name == "$sort":
+            stages.append(f"$sort{shape_text(spec)}")
+        elif name == "$lookup":
+            stages.append(f"$lookup({spec.get('from')})")
+        else:
+            stages.append(name)
+    return " | ".join(stages)
+
+def query_shape(command_name: str, command: dict) -> str:
+    collection = command.get(command_name)
+    details = ""
+    if command_name == "find":
+        details = f"filter={shape_text(normalize_filter(command.get('filter', {})))}"
+        if command.get("sort"):
+            details += f" sort={shape_text(command['sort'])}"
+    elif command_name == "aggregate":
+        details = pipeline_shape(command.get("pipeline", []))
+    elif command_name in ("count", "distinct"):
+        details = f"filter={shape_text(normalize_filter(command.get('query') or {}))}"
+        if command_name == "distinct":
+            details = f"key={command.get('key')} {details}"
+    elif command_name == "findAndModify":
+        details = f"filter={shape_text(normalize_filter(command.get('query', {})))}"
+        if command.get("sort"):
+            details += f" sort={shape_text(command['sort'])}"
+    elif command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        details = f"filter={shape_text(normalize_filter(statements[0].get('q', {})))}"
+    return f"{collection}.{command_name} {details}".rstrip()
+
+def find_query_planner(explain):
+    """queryPlanner section of an explain result, wherever the command put it"""
+    if isinstance(explain, dict):
+        if "queryPlanner" in explain:
+            return explain["queryPlanner"]
+        explain = list(explain.values())
+    if isinstance(explain, list):
+        for item in explain:
+            planner = find_query_planner(item)
+            if planner:
+                return planner
+    return None
+
+def plan_summary(explain: dict) -> str:
+    """Winning plan as a stage chain, e.g. "FETCH <- IXSCAN(id_1)" or "COLLSCAN" """
+    planner = find_query_planner(explain) or {}
+    plan = planner.get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)  # slot based engine wraps the classic plan
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages) or "unknown"
+
+class QueryStatsListener(monitoring.CommandListener):
+    """Per query shape statistics, fed by the driver from its worker threads"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}  # (connection, request id) -> (shape, command, getMore cursor)
+        self.cursors = {}  # open cursor id -> shape of the query that opened it
+        self.shapes = {}
+        self.explained = {}  # shape -> monotonic time of the last explain
+        self.loop = None  # set at startup, explains run on the event loop
+    
+    def reset(self):
+        with self.lock:
+            self.shapes.clear()
+            self.explained.clear()
+    
+    def started(self, event):
+        if event.command_name not in QUERY_COMMANDS:
+            return
+        command = event.command
+        cursor_id = None
+        with self.lock:
+            if event.command_name == "getMore":
+                cursor_id = command["getMore"]
+                shape = self.cursors.get(cursor_id)
+                if shape is None:
+                    return
+            else:
+                shape = query_shape(event.command_name, command)
+            explainable = event.command_name in EXPLAINABLE_COMMANDS
+            self.pending[(event.connection_id, event.request_id)] = (shape, command if explainable else None, cursor_id)
+    
+    def succeeded(self, event):
+        with self.lock:
+            entry = self.pending.pop((event.connection_id, event.request_id), None)
+        if entry is None:
+            return
+        shape, command, cursor_id = entry
+        reply = event.reply
+        returned = 0
+        cursor = reply.get("cursor")
+        if cursor:
+            returned = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        elif "values" in reply:
+            returned = len(reply["values"])
+        elif "value" in reply:
+            returned = 1 if reply["value"] else 0
+        elif "n" in reply:
+            returned = reply["n"]
+        duration_ms = event.duration_micros / 1000
+        
+        with self.lock:
+            if cursor:
+                if cursor_id is not None and not cursor.get("id"):
+                    self.cursors.pop(cursor_id, None)
+                elif cursor_id is None and cursor.get("id"):
+                    if len(self.cursors) >= MONGO_OPEN_CURSORS_LIMIT:
+                        self.cursors.clear()  # abandoned cursors never report exhaustion
+                    self.cursors[cursor["id"]] = shape
+            self.record(shape, duration_ms, returned, new_query=cursor_id is None)
+            explain = (
+                command is not None and duration_ms >= MONGO_SLOW_QUERY_MS and self.loop is not None
+                and time.monotonic() - self.explained.get(shape, float("-inf")) >= MONGO_EXPLAIN_INTERVAL_SECONDS
+            )
+            if explain:
+                self.explained[shape] = time.monotonic()
+        
+        if duration_ms >= MONGO_SLOW_QUERY_MS:
+            if explain:
+                self.loop.call_soon_threadsafe(
+                    lambda: asyncio.ensure_future(explain_slow_query(shape, command, duration_ms))
+                )
+            else:
+                logger.warning(f"Slow query {shape}: {duration_ms:.0f} ms")
+    
+    def failed(self, event):
+        with self.lock:
+            entry = self.pending.pop((event.connection_id, event.request_id), None)
+            if entry is not None:
+                self.record(entry[0], event.duration_micros / 1000, 0, new_query=entry[2] is None, failed=True)
+    
+    def record(self, shape: str, duration_ms: float, returned: int, new_query: bool, failed: bool = False):
+        """Add one round trip to a shape; called with the lock held"""
+        stats = self.shapes.get(shape)
+        if stats is None:
+            if len(self.shapes) >= MONGO_QUERY_SHAPES_LIMIT:
+                return
+            stats = self.shapes[shape] = {
+                "count": 0, "failed": 0, "total_ms": 0.0, "max_ms": 0.0, "docs_returned": 0, "plan": None
+            }
+        if new_query:
+            stats["count"] += 1
+        if failed:
+            stats["failed"] += 1
+        stats["total_ms"] += duration_ms
+        stats["max_ms"] = max(stats["max_ms"], duration_ms)
+        stats["docs_returned"] += returned
+
+async def explain_slow_query(shape: str, command: dict, duration_ms: float):
+    explain_command = {
+        key: value for key, value in command.items()
+        if not key.startswith("$") and key not in SESSION_FIELDS
+    }
+    try:
+        explain = await client[command["$db"]].command({"explain": explain_command, "verbosity": "queryPlanner"})
+        summary = plan_summary(explain)
+    except Exception as e:
+        summary = f"explain failed: {str(e)}"
+    with query_stats.lock:
+        if shape in query_stats.shapes:
+            query_stats.shapes[shape]["plan"] = summary
+    logger.warning(f"Slow query {shape}: {duration_ms:.0f} ms, plan {summary}")
+
+query_stats = QueryStatsListener()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 5))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+
+# The client is opened by the lifespan and closed on shutdown. Handlers and
+# background jobs reach it through the module-level `db`, which is also
+# published as app.state.db.
+client = None
+db = None
+
+def create_database_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        mongo_url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        event_listeners=[query_stats]
+    )
+
+def open_database():
+    global client, db
+    client = create_database_client()
+    db = client[os.environ['DB_NAME']]
+    sync_seq_seen["value"] = 0
+
+def close_database():
+    global client, db
+    if client is not None:
+        client.close()
+    client = db = None
+
+# Background scheduler / leader election
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+LEADER_LEASE_SECONDS = int(os.environ.get('LEADER_LEASE_SECONDS', 30))
+TODO_CHECK_INTERVAL_SECONDS = int(os.environ.get('TODO_CHECK_INTERVAL_SECONDS', 60))
+REMINDER_CLAIM_TIMEOUT_MINUTES = int(os.environ.get('REMINDER_CLAIM_TIMEOUT_MINUTES', 10))
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Response compression
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_LEVEL = int(os.environ.get('COMPRESSION_LEVEL', 6))
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/xml')
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported content coding from an Accept-Encoding header"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+    
+    supported = ['br', 'gzip'] if brotli else ['gzip']
+    candidates = [
+        (weights.get(coding, weights.get('*', 0.0)), -index, coding)
+        for index, coding in enumerate(supported)
+    ]
+    weight, _, coding = max(candidates)
+    return coding if weight > 0 else None
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(COMPRESSION_LEVEL, 11))
+    return gzip.compress(body, compresslevel=COMPRESSION_LEVEL)
+
+class CompressedRoute(APIRoute):
+    """API route that compresses large responses with the negotiated encoding
+
+    Compression runs in the threadpool (brotli and gzip release the GIL), so a
+    large export does not stall the event loop for other requests.
+    """
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+        
+        async def compressed_route_handler(request: Request) -> Response:
+            response = await route_handler(request)
+            body = getattr(response, 'body', None)
+            content_type = response.headers.get('content-type', '')
+            if body is None or not content_type.startswith(COMPRESSIBLE_TYPES):
+                return response
+            
+            response.headers.append('Vary', 'Accept-Encoding')
+            if len(body) < COMPRESSION_MIN_SIZE or 'content-encoding' in response.headers:
+                return response
+            
+            encoding = negotiate_encoding(request.headers.get('accept-encoding', ''))
+            if encoding is None:
+                return response
+            compressed = await run_in_threadpool(compress_body, body, encoding)
+            
+            response.body = compressed
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Content-Length'] = str(len(compressed))
+            return response
+        
+        return compressed_route_handler
+
+# Application lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_resources(app)
+    try:
+        yield
+    finally:
+        await shutdown_resources(app)
 
 # Create the main app
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
+app = FastAPI(lifespan=lifespan)
+api_router = APIRouter(prefix="/api", route_class=CompressedRoute)
 
 # Email configuration
 SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
@@ -44,18 +391,95 @@ SMTP_USERNAME = os.environ.get('SMTP_USERNAME', '')
 SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL', '')
 SENDER_NAME = os.environ.get('SENDER_NAME', 'RechnungsManager')
+# Absolute URL of this backend, needed to link the logo from emails
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+SMTP_RATE_PER_MINUTE = float(os.environ.get('SMTP_RATE_PER_MINUTE', 20))
+SMTP_BURST = int(os.environ.get('SMTP_BURST', 5))
+EMAIL_BATCH_CONCURRENCY = int(os.environ.get('EMAIL_BATCH_CONCURRENCY', 4))
+# Connect/command timeout per SMTP operation; aiosmtplib would wait 60s
+SMTP_TIMEOUT_SECONDS = float(os.environ.get('SMTP_TIMEOUT_SECONDS', 10))
+SMTP_BREAKER_FAILURES = int(os.environ.get('SMTP_BREAKER_FAILURES', 3))
+SMTP_BREAKER_RESET_SECONDS = float(os.environ.get('SMTP_BREAKER_RESET_SECONDS', 60))
+SMTP_BREAKER_HALF_OPEN_TRIALS = int(os.environ.get('SMTP_BREAKER_HALF_OPEN_TRIALS', 1))
+MAIL_SPOOL_DIR = Path(os.environ.get('MAIL_SPOOL_DIR', ROOT_DIR / 'mail_spool'))
+MAIL_SPOOL_MAX_MESSAGES = int(os.environ.get('MAIL_SPOOL_MAX_MESSAGES', 1000))
+MAIL_SPOOL_MAX_ATTEMPTS = int(os.environ.get('MAIL_SPOOL_MAX_ATTEMPTS', 5))
+MAIL_SPOOL_INTERVAL_SECONDS = int(os.environ.get('MAIL_SPOOL_INTERVAL_SECONDS', 30))
+
+# Worker pool for CPU-bound rendering (PDFs), keeps the event loop responsive.
+# Created by the lifespan and shut down with it, so the app can be started again.
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+render_pool = None
+
+async def run_in_render_pool(func, *args):
+    """Run a blocking render function on the shared render pool"""
+    loop = asyncio.get_running_loop()
+    # Outside the lifespan (scripts, benchmarks) the loop's default executor is used
+    return await loop.run_in_executor(render_pool, stack_sampler.attributed(func), *args)
 
 # Template environment
 template_dir = ROOT_DIR / 'templates'
 template_dir.mkdir(exist_ok=True)
-jinja_env = Environment(
-    loader=FileSystemLoader(template_dir),
-    autoescape=True
-)
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+
+@lru_cache(maxsize=1)
+def get_jinja_env():
+    """Templates are only rendered for emails, so Jinja is set up on first use"""
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        autoescape=select_autoescape(['html']),
+        bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+        auto_reload=False
+    )
+
+EMAIL_TEMPLATES = [
+    'german_invoice_email.html',
+    'todo_reminder_email.html',
+    'todo_reminder_email.txt',
+    'dunning_email.html',
+    'dunning_email.txt'
+]
+compiled_templates = {}
+template_render_stats = {}
+
+def load_email_templates():
+    """Compile all email templates once so each send only renders"""
+    for name in EMAIL_TEMPLATES:
+        compiled_templates[name] = get_jinja_env().get_template(name)
+
+def render_template(name: str, **context) -> str:
+    """Render a precompiled template and record its render time"""
+    template = compiled_templates.get(name)
+    if template is None:
+        template = compiled_templates[name] = get_jinja_env().get_template(name)
+    
+    started = time.perf_counter()
+    rendered = template.render(**context)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    stats = template_render_stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+    stats["count"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    return rendered
 
 # Serve static files for uploads
 uploads_dir = ROOT_DIR / "uploads"
 uploads_dir.mkdir(exist_ok=True)
+logo_dir = uploads_dir / "logo"
+logo_dir.mkdir(exist_ok=True)
+LOGO_CACHE_MAX_AGE = 365 * 24 * 3600
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files whose URL changes with their content, cacheable for good"""
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={LOGO_CACHE_MAX_AGE}, immutable"
+        return response
+
+# Mounted before /uploads so logo variants get the long-lived cache headers
+app.mount("/uploads/logo", ImmutableStaticFiles(directory=str(logo_dir)), name="logo")
 app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
 
 # Pydantic Models
@@ -66,7 +490,9 @@ class Customer(BaseModel):
     address: str
     postal_code: str
     city: str
+    buyer_reference: Optional[str] = None  # Leitweg-ID for XRechnung
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_seq: int = 0  # Delta sync sequence, see /api/sync
 
 class CustomerCreate(BaseModel):
     name: str
@@ -74,6 +500,7 @@ class CustomerCreate(BaseModel):
     address: str
     postal_code: str
     city: str
+    buyer_reference: Optional[str] = None  # Leitweg-ID for XRechnung
 
 class CompanyData(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -88,7 +515,9 @@ class CompanyData(BaseModel):
     bank_name: str
     iban: str
     bic: str
-    logo_url: Optional[str] = None
+    logo_url: Optional[str] = None  # Email-size variant, see POST /api/company/logo
+    logo_hash: Optional[str] = None
+    logo_variants: dict = {}  # Variant name -> URL under /uploads/logo
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class CompanyDataCreate(BaseModel):
@@ -132,6 +561,7 @@ class ToDo(BaseModel):
     reminder_sent: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     completed_at: Optional[datetime] = None
+    updated_seq: int = 0  # Delta sync sequence, see /api/sync
 
 class ToDoCreate(BaseModel):
     title: str
@@ -164,6 +594,28 @@ class Invoice(BaseModel):
     notes: Optional[str] = None
     apply_tax: bool = True  # New field to control tax application
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    customer_deleted: bool = False  # Customer was deleted, name is a snapshot
+    paid_at: Optional[datetime] = None
+    dunning_level: int = 0  # Highest reminder level sent, see DUNNING_LEVELS
+    dunning_fees: float = 0.0  # Accumulated reminder fees on top of total_amount
+    last_dunning_at: Optional[datetime] = None
+    updated_seq: int = 0  # Delta sync sequence, see /api/sync
+    archived_at: Optional[datetime] = None  # Set once moved to invoices_archive
+
+class InvoiceSummary(BaseModel):
+    """Compact invoice representation for list views (?view=summary)"""
+    id: str
+    invoice_number: str
+    customer_name: str
+    subtotal: float
+    tax_amount: float
+    total_amount: float
+    status: str
+    invoice_date: datetime
+    due_date: datetime
+    created_at: datetime
+    item_count: int = 0
+    archived_at: Optional[datetime] = None
 
 class InvoiceCreate(BaseModel):
     customer_id: str
@@ -173,6 +625,84 @@ class InvoiceCreate(BaseModel):
     notes: Optional[str] = None
     apply_tax: bool = True  # New field
 
+class InvoiceBatchSendRequest(BaseModel):
+    """Selects draft invoices for POST /api/invoices/send-batch"""
+    invoice_ids: Optional[List[str]] = None
+    customer_id: Optional[str] = None
+    invoice_date_from: Optional[str] = None  # ISO date string
+    invoice_date_to: Optional[str] = None  # ISO date string
+    limit: int = Field(default=500, ge=1, le=5000)
+
+class RecurringInvoice(BaseModel):
+    """Definition from which the scheduler generates an invoice every interval"""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    customer_id: str
+    customer_name: str
+    items: List[InvoiceItem]
+    subtotal: float
+    tax_rate: float = 19.0
+    tax_amount: float
+    total_amount: float
+    interval: Literal["weekly", "monthly", "quarterly", "yearly"] = "monthly"
+    billing_day: int  # Day of month the invoices are dated, kept across short months
+    next_run_date: datetime
+    payment_terms_days: int = 14
+    notes: Optional[str] = None
+    apply_tax: bool = True
+    send_email: bool = True
+    active: bool = True
+    generated_count: int = 0
+    last_invoice_id: Optional[str] = None
+    last_run_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class RecurringInvoiceCreate(BaseModel):
+    customer_id: str
+    items: List[InvoiceItemCreate]
+    interval: Literal["weekly", "monthly", "quarterly", "yearly"] = "monthly"
+    start_date: str  # ISO date string of the first invoice
+    payment_terms_days: int = Field(default=14, ge=0, le=365)
+    notes: Optional[str] = None
+    apply_tax: bool = True
+    tax_rate: float = Field(default=19.0, ge=0, le=100)
+    send_email: bool = True
+
+class RecurringInvoiceUpdate(BaseModel):
+    items: Optional[List[InvoiceItemCreate]] = None
+    interval: Optional[Literal["weekly", "monthly", "quarterly", "yearly"]] = None
+    next_run_date: Optional[str] = None  # ISO date string
+    payment_terms_days: Optional[int] = Field(default=None, ge=0, le=365)
+    notes: Optional[str] = None
+    apply_tax: Optional[bool] = None
+    tax_rate: Optional[float] = Field(default=None, ge=0, le=100)
+    send_email: Optional[bool] = None
+    active: Optional[bool] = None
+
+class EInvoiceBatchRequest(BaseModel):
+    invoice_ids: List[str] = Field(..., min_length=1, max_length=5000)
+    profile: Literal["xrechnung", "zugferd"] = "xrechnung"
+
+class StatementBatchRequest(BaseModel):
+    """Statements for POST /api/statements/batch; no ids means every customer"""
+    period_from: str  # ISO date
+    period_to: str  # ISO date
+    customer_ids: Optional[List[str]] = Field(default=None, min_length=1, max_length=20000)
+    include_inactive: bool = False  # also customers without entries and a zero balance
+
+class Job(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    type: str
+    status: str = "queued"  # queued, running, completed, failed
+    total: int = 0
+    processed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    errors: List[str] = []
+    result: Optional[dict] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class Quote(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     quote_number: str
@@ -190,6 +720,53 @@ class Quote(BaseModel):
     apply_tax: bool = True  # New field to control tax application
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     converted_to_invoice_id: Optional[str] = None
+    customer_deleted: bool = False  # Customer was deleted, name is a snapshot
+    updated_seq: int = 0  # Delta sync sequence, see /api/sync
+    archived_at: Optional[datetime] = None  # Set once moved to quotes_archive
+
+class QuoteSummary(BaseModel):
+    """Compact quote representation for list views (?view=summary)"""
+    id: str
+    quote_number: str
+    customer_name: str
+    subtotal: float
+    tax_amount: float
+    total_amount: float
+    status: str
+    quote_date: datetime
+    valid_until: datetime
+    created_at: datetime
+    item_count: int = 0
+    archived_at: Optional[datetime] = None
+
+class QuoteConversionBatchRequest(BaseModel):
+    """Quotes for POST /api/quotes/convert-batch; no ids means all accepted quotes"""
+    quote_ids: Optional[List[str]] = None
+    limit: int = Field(default=500, ge=1, le=5000)
+
+class InvoiceStatusUpdate(BaseModel):
+    status: Literal["draft", "sent", "paid"]
+    paid_at: Optional[str] = None  # ISO date of the payment, defaults to now
+
+class QuoteStatusUpdate(BaseModel):
+    status: Literal["draft", "sent", "accepted", "rejected"]
+
+class StatusBatchSelection(BaseModel):
+    """Documents for the status-batch endpoints: the given ids, or all matching the filter fields"""
+    ids: Optional[List[str]] = Field(default=None, min_length=1, max_length=5000)
+    customer_id: Optional[str] = None
+    current_status: Optional[str] = None
+    limit: int = Field(default=500, ge=1, le=5000)
+
+class InvoiceStatusBatchUpdate(StatusBatchSelection):
+    status: Literal["draft", "sent", "paid"]
+    paid_at: Optional[str] = None  # ISO date of the payment, defaults to now
+
+class QuoteStatusBatchUpdate(StatusBatchSelection):
+    status: Literal["draft", "sent", "accepted", "rejected"]
+
+class ToDoStatusBatchUpdate(StatusBatchSelection):
+    status: Literal["pending", "completed", "cancelled"]
 
 class QuoteCreate(BaseModel):
     customer_id: str
@@ -199,6 +776,506 @@ class QuoteCreate(BaseModel):
     notes: Optional[str] = None
     apply_tax: bool = True  # New field
 
+# Default company data used until the company profile has been saved
+DEFAULT_COMPANY = {
+    "company_name": "Ihre Firma GmbH",
+    "address": "Musterstraße 123",
+    "postal_code": "12345",
+    "city": "Musterstadt",
+    "phone": "+49 123 456789",
+    "email": "info@ihrefirma.de",
+    "website": "www.ihrefirma.de",
+    "bank_name": "Deutsche Bank",
+    "iban": "DE89 1234 5678 9012 3456 78",
+    "bic": "DEUTDEDBXXX",
+    "tax_number": "DE123456789"
+}
+
+async def get_company_data() -> dict:
+    company = await db.company_data.find_one({})
+    return company or dict(DEFAULT_COMPANY)
+
+# PDF rendering
+# ReportLab is the slowest import of the app and most requests never render a
+# PDF, so the layout code lives in pdf_rendering.py and is imported on first use.
+def load_pdf_rendering():
+    import pdf_rendering
+    return pdf_rendering
+
+def with_logo_path(company: dict) -> dict:
+    """Company data plus the file path of its PDF logo variant, if any"""
+    logo_hash = company.get("logo_hash")
+    logo_path = logo_dir / logo_hash / "pdf.png" if logo_hash else None
+    return {**company, "logo_path": str(logo_path) if logo_path and logo_path.exists() else None}
+
+def render_invoice_pdf(invoice: dict, customer: dict, company: dict, canvasmaker=None) -> io.BytesIO:
+    """Lay out an invoice PDF from the cached company fragments"""
+    pdf_rendering = load_pdf_rendering()
+    return pdf_rendering.render_invoice_pdf(
+        invoice, customer, with_logo_path(company), canvasmaker or pdf_rendering.Canvas
+    )
+
+def render_dunning_pdf(invoice: dict, customer: dict, company: dict, notice: dict) -> io.BytesIO:
+    """Lay out a payment reminder for an overdue invoice"""
+    return load_pdf_rendering().render_dunning_pdf(invoice, customer, with_logo_path(company), notice)
+
+def render_statement_pdf(statement: dict, company: dict) -> io.BytesIO:
+    """Lay out a customer account statement"""
+    return load_pdf_rendering().render_statement_pdf(statement, with_logo_path(company))
+
+# Company logo
+# Uploads are streamed to disk and decoded once in the render pool into
+# fixed-size PNG variants under uploads/logo/<content hash>/. The URLs change
+# with the image, so the variants are served as immutable. Older variants are
+# kept because sent emails link to them.
+LOGO_MAX_BYTES = int(os.environ.get('LOGO_MAX_BYTES', 10 * 1024 * 1024))
+LOGO_MAX_PIXELS = int(os.environ.get('LOGO_MAX_PIXELS', 40_000_000))
+LOGO_UPLOAD_CHUNK_SIZE = 1024 * 1024
+LOGO_FORMATS = {"PNG": "png", "JPEG": "jpg", "GIF": "gif", "WEBP": "webp"}
+LOGO_VARIANTS = {
+    "pdf": (600, 200),  # 4x the 150x50 pt box in the PDF header
+    "email": (400, 160),
+    "thumbnail": (128, 128)
+}
+
+def store_logo_upload(source) -> Optional[tuple]:
+    """Copy an upload to a temp file in chunks; returns (path, content hash),
+    or None if it exceeds LOGO_MAX_BYTES"""
+    digest = hashlib.sha256()
+    size = 0
+    temp_path = logo_dir / f".upload-{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "wb") as out:
+        for chunk in iter(lambda: source.read(LOGO_UPLOAD_CHUNK_SIZE), b""):
+            size += len(chunk)
+            if size > LOGO_MAX_BYTES:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    if size > LOGO_MAX_BYTES:
+        temp_path.unlink(missing_ok=True)
+        return None
+    return temp_path, digest.hexdigest()[:16]
+
+def build_logo_variants(source: Path, target: Path):
+    """Decode the upload once and write every variant (runs in the render pool)"""
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(source) as original:
+            if original.format not in LOGO_FORMATS:
+                raise ValueError(f"unsupported format {original.format}")
+            if original.width * original.height > LOGO_MAX_PIXELS:
+                raise ValueError(f"{original.width}x{original.height} pixels is too large")
+            extension = LOGO_FORMATS[original.format]
+            # JPEGs can be decoded at a reduced scale, which is far cheaper
+            original.draft("RGB", LOGO_VARIANTS["pdf"])
+            image = ImageOps.exif_transpose(original).convert("RGBA")
+    except (OSError, Image.DecompressionBombError):
+        raise ValueError("not a readable PNG, JPEG, GIF or WebP image")
+    
+    staging = target.with_name(f".{target.name}-{uuid.uuid4().hex}")
+    staging.mkdir(parents=True)
+    for name, size in LOGO_VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail(size, Image.LANCZOS)
+        if name == "pdf":
+            # Invoices are printed on white, flattening saves a soft mask per render
+            flattened = Image.new("RGB", variant.size, "white")
+            flattened.paste(variant, mask=variant.getchannel("A"))
+            variant = flattened
+        variant.save(staging / f"{name}.png", "PNG", optimize=True)
+    source.replace(staging / f"original.{extension}")
+    try:
+        staging.rename(target)
+    except OSError:
+        # Same image processed concurrently, the other copy is identical
+        shutil.rmtree(staging, ignore_errors=True)
+
+def logo_variant_urls(logo_hash: str) -> dict:
+    return {name: f"/uploads/logo/{logo_hash}/{name}.png" for name in LOGO_VARIANTS}
+
+# E-invoices (XRechnung / ZUGFeRD)
+# Both profiles are EN 16931 invoices in UN/CEFACT CII syntax, written element
+# by element with a streaming XMLGenerator. ZUGFeRD embeds the same XML as
+# factur-x.xml in the invoice PDF with PDF/A-3 metadata. Generated artifacts
+# are cached per invoice under ARTIFACT_DIR (not the public uploads mount).
+ARTIFACT_DIR = Path(os.environ.get('ARTIFACT_DIR', ROOT_DIR / 'artifacts'))
+CII_NAMESPACES = {
+    "xmlns:rsm": "urn:un:unece:uncefact:data:standard:CrossIndustryInvoice:100",
+    "xmlns:ram": "urn:un:unece:uncefact:data:standard:ReusableAggregateBusinessInformationEntity:100",
+    "xmlns:qdt": "urn:un:unece:uncefact:data:standard:QualifiedDataType:100",
+    "xmlns:udt": "urn:un:unece:uncefact:data:standard:UnqualifiedDataType:100"
+}
+EINVOICE_GUIDELINES = {
+    "xrechnung": "urn:cen.eu:en16931:2017#compliant#urn:xeinkauf.de:kosit:xrechnung_3.0",
+    "zugferd": "urn:cen.eu:en16931:2017"
+}
+EINVOICE_BUSINESS_PROCESS = "urn:fdc:peppol.eu:2017:poacc:billing:01:1.0"
+# UN/ECE recommendation 20 codes for the units offered in the frontend
+UNIT_CODES = {"hours": "HUR", "pieces": "H87", "kg": "KGM", "m": "MTR", "m2": "MTK"}
+VAT_ID_PATTERN = re.compile(r"^[A-Z]{2}[0-9A-Z]{2,13}$")
+EINVOICE_INVOICE_FIELDS = ("invoice_number", "invoice_date", "due_date", "items", "subtotal",
+                           "tax_rate", "tax_amount", "total_amount", "apply_tax", "notes")
+EINVOICE_CUSTOMER_FIELDS = ("name", "email", "address", "postal_code", "city", "buyer_reference")
+
+class CiiWriter:
+    """Streaming writer for CII documents, elements are emitted as they are produced"""
+    def __init__(self, stream):
+        self.xml = XMLGenerator(stream, encoding="utf-8", short_empty_elements=True)
+        self.xml.startDocument()
+    
+    @contextmanager
+    def element(self, name: str, attrs: dict = None):
+        self.xml.startElement(name, attrs or {})
+        yield
+        self.xml.endElement(name)
+    
+    def leaf(self, name: str, text, attrs: dict = None):
+        if text is None or text == "":
+            return
+        self.xml.startElement(name, attrs or {})
+        self.xml.characters(str(text))
+        self.xml.endElement(name)
+    
+    def date(self, name: str, value: str):
+        with self.element(name):
+            self.leaf("udt:DateTimeString", datetime.fromisoformat(value).strftime("%Y%m%d"), {"format": "102"})
+    
+    def close(self):
+        self.xml.endDocument()
+
+def cii_amount(value: float) -> str:
+    return f"{value:.2f}"
+
+def write_cii_party(writer: CiiWriter, name: str, party: dict, contact: dict = None):
+    with writer.element(name):
+        writer.leaf("ram:Name", party.get("company_name") or party.get("name"))
+        if contact:
+            with writer.element("ram:DefinedTradeContact"):
+                writer.leaf("ram:PersonName", contact["name"])
+                if contact.get("phone"):
+                    with writer.element("ram:TelephoneUniversalCommunication"):
+                        writer.leaf("ram:CompleteNumber", contact["phone"])
+                if contact.get("email"):
+                    with writer.element("ram:EmailURIUniversalCommunication"):
+                        writer.leaf("ram:URIID", contact["email"])
+        with writer.element("ram:PostalTradeAddress"):
+            writer.leaf("ram:PostcodeCode", party.get("postal_code"))
+            writer.leaf("ram:LineOne", party.get("address"))
+            writer.leaf("ram:CityName", party.get("city"))
+            writer.leaf("ram:CountryID", party.get("country_code") or "DE")
+        if party.get("email"):
+            with writer.element("ram:URIUniversalCommunication"):
+                writer.leaf("ram:URIID", party["email"], {"schemeID": "EM"})
+        tax_number = (party.get("tax_number") or "").replace(" ", "")
+        if tax_number:
+            with writer.element("ram:SpecifiedTaxRegistration"):
+                writer.leaf("ram:ID", tax_number, {"schemeID": "VA" if VAT_ID_PATTERN.match(tax_number) else "FC"})
+
+def write_cii_tax(writer: CiiWriter, apply_tax: bool, rate: float, basis: float = None, tax: float = None):
+    with writer.element("ram:ApplicableTradeTax"):
+        if tax is not None:
+            writer.leaf("ram:CalculatedAmount", cii_amount(tax))
+        writer.leaf("ram:TypeCode", "VAT")
+        if not apply_tax and basis is not None:
+            writer.leaf("ram:ExemptionReason", "Steuerfreie Leistung")
+        if basis is not None:
+            writer.leaf("ram:BasisAmount", cii_amount(basis))
+        writer.leaf("ram:CategoryCode", "S" if apply_tax else "E")
+        writer.leaf("ram:RateApplicablePercent", f"{rate if apply_tax else 0:g}")
+
+def write_cii_invoice(stream, invoice: dict, customer: dict, company: dict, profile: str):
+    """Serialize an invoice as EN 16931 CII XML into a binary stream"""
+    apply_tax = invoice.get("apply_tax", True)
+    rate = invoice.get("tax_rate", 19.0)
+    subtotal = round(invoice["subtotal"], 2)
+    writer = CiiWriter(stream)
+    
+    with writer.element("rsm:CrossIndustryInvoice", CII_NAMESPACES):
+        with writer.element("rsm:ExchangedDocumentContext"):
+            with writer.element("ram:BusinessProcessSpecifiedDocumentContextParameter"):
+                writer.leaf("ram:ID", EINVOICE_BUSINESS_PROCESS)
+            with writer.element("ram:GuidelineSpecifiedDocumentContextParameter"):
+                writer.leaf("ram:ID", EINVOICE_GUIDELINES[profile])
+        
+        with writer.element("rsm:ExchangedDocument"):
+            writer.leaf("ram:ID", invoice["invoice_number"])
+            writer.leaf("ram:TypeCode", "380")
+            writer.date("ram:IssueDateTime", invoice["invoice_date"])
+            if invoice.get("notes"):
+                with writer.element("ram:IncludedNote"):
+                    writer.leaf("ram:Content", invoice["notes"])
+        
+        with writer.element("rsm:SupplyChainTradeTransaction"):
+            for line_id, item in enumerate(invoice["items"], 1):
+                with writer.element("ram:IncludedSupplyChainTradeLineItem"):
+                    with writer.element("ram:AssociatedDocumentLineDocument"):
+                        writer.leaf("ram:LineID", line_id)
+                    with writer.element("ram:SpecifiedTradeProduct"):
+                        writer.leaf("ram:Name", item["description"])
+                    with writer.element("ram:SpecifiedLineTradeAgreement"):
+                        with writer.element("ram:NetPriceProductTradePrice"):
+                            writer.leaf("ram:ChargeAmount", cii_amount(item["unit_price"]))
+                    with writer.element("ram:SpecifiedLineTradeDelivery"):
+                        writer.leaf("ram:BilledQuantity", f"{item['quantity']:.4f}",
+                                    {"unitCode": UNIT_CODES.get(item.get("unit"), "C62")})
+                    with writer.element("ram:SpecifiedLineTradeSettlement"):
+                        write_cii_tax(writer, apply_tax, rate)
+                        with writer.element("ram:SpecifiedTradeSettlementLineMonetarySummation"):
+                            writer.leaf("ram:LineTotalAmount", cii_amount(item["total_price"]))
+            
+            with writer.element("ram:ApplicableHeaderTradeAgreement"):
+                # XRechnung requires a buyer reference (Leitweg-ID for public customers)
+                writer.leaf("ram:BuyerReference", customer.get("buyer_reference") or invoice["invoice_number"])
+                write_cii_party(writer, "ram:SellerTradeParty", company, contact={
+                    "name": company.get("company_name"),
+                    "phone": company.get("phone"),
+                    "email": company.get("email")
+                })
+                write_cii_party(writer, "ram:BuyerTradeParty", customer)
+            
+            with writer.element("ram:ApplicableHeaderTradeDelivery"):
+                with writer.element("ram:ActualDeliverySupplyChainEvent"):
+                    writer.date("ram:OccurrenceDateTime", invoice["invoice_date"])
+            
+            with writer.element("ram:ApplicableHeaderTradeSettlement"):
+                writer.leaf("ram:PaymentReference", invoice["invoice_number"])
+                writer.leaf("ram:InvoiceCurrencyCode", "EUR")
+                with writer.element("ram:SpecifiedTradeSettlementPaymentMeans"):
+                    writer.leaf("ram:TypeCode", "58")  # SEPA credit transfer
+                    with writer.element("ram:PayeePartyCreditorFinancialAccount"):
+                        writer.leaf("ram:IBANID", (company.get("iban") or "").replace(" ", ""))
+                    if company.get("bic"):
+                        with writer.element("ram:PayeeSpecifiedCreditorFinancialInstitution"):
+                            writer.leaf("ram:BICID", company["bic"])
+                write_cii_tax(writer, apply_tax, rate, basis=subtotal, tax=invoice["tax_amount"])
+                with writer.element("ram:SpecifiedTradePaymentTerms"):
+                    writer.date("ram:DueDateDateTime", invoice["due_date"])
+                with writer.element("ram:SpecifiedTradeSettlementHeaderMonetarySummation"):
+                    writer.leaf("ram:LineTotalAmount", cii_amount(subtotal))
+                    writer.leaf("ram:TaxBasisTotalAmount", cii_amount(subtotal))
+                    writer.leaf("ram:TaxTotalAmount", cii_amount(invoice["tax_amount"]), {"currencyID": "EUR"})
+                    writer.leaf("ram:GrandTotalAmount", cii_amount(invoice["total_amount"]))
+                    writer.leaf("ram:DuePayableAmount", cii_amount(invoice["total_amount"]))
+    writer.close()
+
+def render_cii_xml(invoice: dict, customer: dict, company: dict, profile: str) -> bytes:
+    buffer = io.BytesIO()
+    write_cii_invoice(buffer, invoice, customer, company, profile)
+    return buffer.getvalue()
+
+def render_zugferd_pdf(invoice: dict, customer: dict, company: dict) -> io.BytesIO:
+    xml = render_cii_xml(invoice, customer, company, "zugferd")
+    return load_pdf_rendering().render_facturx_pdf(invoice, customer, company, xml)
+
+EINVOICE_RENDERERS = {
+    "xrechnung": ("xml", lambda invoice, customer, company: render_cii_xml(invoice, customer, company, "xrechnung")),
+    "zugferd": ("pdf", lambda invoice, customer, company: render_zugferd_pdf(invoice, customer, company).getvalue())
+}
+
+def einvoice_artifact_path(invoice: dict, customer: dict, company: dict, profile: str) -> Path:
+    """Cache path keyed by everything that ends up in the document"""
+    key_data = json.dumps(
+        [
+            {name: invoice.get(name) for name in EINVOICE_INVOICE_FIELDS},
+            {name: customer.get(name) for name in EINVOICE_CUSTOMER_FIELDS},
+            {name: company.get(name) for name in (*DEFAULT_COMPANY, "logo_hash")}
+        ],
+        sort_keys=True, default=str
+    )
+    key = hashlib.sha256(key_data.encode("utf-8")).hexdigest()[:16]
+    extension = EINVOICE_RENDERERS[profile][0]
+    return ARTIFACT_DIR / invoice["id"] / f"{profile}-{key}.{extension}"
+
+def build_einvoice_artifact(invoice: dict, customer: dict, company: dict, profile: str) -> Path:
+    """Return the cached artifact, rendering it first if needed (runs in the render pool)"""
+    path = einvoice_artifact_path(invoice, customer, company, profile)
+    if path.exists():
+        return path
+    content = EINVOICE_RENDERERS[profile][1](invoice, customer, company)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Drop artifacts of older invoice revisions, then publish atomically
+    for stale in path.parent.glob(f"{profile}-*"):
+        stale.unlink(missing_ok=True)
+    temp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    temp_path.write_bytes(content)
+    temp_path.replace(path)
+    return path
+
+# Rate limiting for outgoing mail
+class TokenBucket:
+    """Async token bucket, refills `rate` tokens per second up to `capacity`"""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+smtp_rate_limiter = TokenBucket(SMTP_RATE_PER_MINUTE / 60, SMTP_BURST)
+
+# SMTP circuit breaker and mail spool
+# After SMTP_BREAKER_FAILURES consecutive failed sends the breaker opens and
+# sends fail immediately instead of waiting for connection timeouts. After
+# SMTP_BREAKER_RESET_SECONDS it lets SMTP_BREAKER_HALF_OPEN_TRIALS sends through
+# as probes: one success closes it again, a failure reopens it. Messages that
+# can be delivered later (invoice mails, ToDo reminders) are parked in
+# MAIL_SPOOL_DIR while the breaker is open, together with the update to apply
+# once they went out, and drained by the "mail-spool" scheduled job.
+class SmtpUnavailable(Exception):
+    """Raised instead of sending while the SMTP circuit is open"""
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float, half_open_trials: int = 1):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.half_open_trials = max(1, half_open_trials)
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.trials_in_flight = 0
+        self.opened_at = None
+        self.opened_at_wall = None
+        self.last_error = None
+        self.transitions = 0
+    
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"SMTP circuit {self.state} -> {state}")
+            self.state = state
+            self.transitions += 1
+    
+    def allow(self) -> bool:
+        """Whether a send may start now; a True in half-open state takes a trial slot"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self._set_state("half_open")
+            self.trials_in_flight = 0
+        if self.state == "half_open":
+            if self.trials_in_flight >= self.half_open_trials:
+                return False
+            self.trials_in_flight += 1
+        return True
+    
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.trials_in_flight = 0
+        self._set_state("closed")
+    
+    def record_failure(self, error: str):
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.opened_at_wall = datetime.now(timezone.utc)
+            self.trials_in_flight = 0
+            self._set_state("open")
+    
+    def release(self):
+        """Give back a half-open trial slot for a send that was cancelled"""
+        if self.state == "half_open":
+            self.trials_in_flight = max(0, self.trials_in_flight - 1)
+    
+    def snapshot(self) -> dict:
+        retry_at = None
+        if self.state == "open":
+            retry_at = (self.opened_at_wall + timedelta(seconds=self.reset_seconds)).isoformat()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "opened_at": self.opened_at_wall.isoformat() if self.opened_at_wall else None,
+            "retry_at": retry_at,
+            "last_error": self.last_error,
+            "transitions": self.transitions
+        }
+
+class MailSpool:
+    """Serialized messages on disk, one JSON file per key (a re-spooled key replaces its entry)"""
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.dead_directory = directory / "dead"
+    
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+    
+    def keys(self) -> List[str]:
+        """Spooled keys, oldest first"""
+        if not self.directory.exists():
+            return []
+        paths = []
+        for path in self.directory.glob("*.json"):
+            try:
+                paths.append((path.stat().st_mtime, path.stem))
+            except FileNotFoundError:
+                continue
+        return [key for _, key in sorted(paths)]
+    
+    def count(self, dead: bool = False) -> int:
+        directory = self.dead_directory if dead else self.directory
+        return sum(1 for _ in directory.glob("*.json")) if directory.exists() else 0
+    
+    def _write(self, path: Path, entry: dict):
+        temp_path = path.with_name(f".{path.stem}.{uuid.uuid4().hex}.tmp")
+        temp_path.write_text(json.dumps(entry), encoding="utf-8")
+        temp_path.replace(path)
+    
+    def put(self, key: str, message: MIMEMultipart, on_delivered: Optional[dict]) -> bool:
+        """Park a message; False if the spool is full"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        if not path.exists() and self.count() >= MAIL_SPOOL_MAX_MESSAGES:
+            return False
+        self._write(path, {
+            "key": key,
+            "recipient": message["To"],
+            "subject": message["Subject"],
+            "spooled_at": datetime.now(timezone.utc).isoformat(),
+            "attempts": 0,
+            "last_error": None,
+            "on_delivered": on_delivered,
+            "message": message.as_string()
+        })
+        return True
+    
+    def load(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self.path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+    
+    def contains(self, key: str) -> bool:
+        return self.path(key).exists()
+    
+    def remove(self, key: str):
+        self.path(key).unlink(missing_ok=True)
+    
+    def record_attempt(self, entry: dict, error: str):
+        """Count a rejected delivery; entries out of attempts move to the dead directory"""
+        entry = {**entry, "attempts": entry["attempts"] + 1, "last_error": error}
+        if entry["attempts"] < MAIL_SPOOL_MAX_ATTEMPTS:
+            self._write(self.path(entry["key"]), entry)
+            return
+        self.dead_directory.mkdir(parents=True, exist_ok=True)
+        self._write(self.dead_directory / f"{entry['key']}.json", entry)
+        self.remove(entry["key"])
+        logger.error(f"Spooled mail {entry['key']} to {entry['recipient']} given up after {entry['attempts']} attempts: {error}")
+
+smtp_breaker = CircuitBreaker(SMTP_BREAKER_FAILURES, SMTP_BREAKER_RESET_SECONDS, SMTP_BREAKER_HALF_OPEN_TRIALS)
+mail_spool = MailSpool(MAIL_SPOOL_DIR)
+
 # Email Service Class
 class EmailService:
     def __init__(self):
@@ -208,6 +1285,62 @@ class EmailService:
         self.password = SMTP_PASSWORD
         self.sender_email = SENDER_EMAIL
         self.sender_name = SENDER_NAME
+        self.from_header = formataddr((self.sender_name, self.sender_email))
+    
+    def build_message(self, recipient: str, subject: str) -> MIMEMultipart:
+        """Create a message with the shared sender header already set.
+        
+        Messages are built fresh rather than copied from a prebuilt skeleton:
+        a copy that is safe to modify costs more than the ~2 µs this takes.
+        """
+        message = MIMEMultipart()
+        message["From"] = self.from_header
+        message["To"] = recipient
+        message["Subject"] = subject
+        return message
+    
+    async def transmit(self, message):
+        """Send a message through the configured SMTP server, reporting the outcome to smtp_breaker.
+        
+        Callers must have been admitted by smtp_breaker.allow().
+        """
+        import aiosmtplib  # deferred, most workers never send mail
+        try:
+            await smtp_rate_limiter.acquire()
+            async with aiosmtplib.SMTP(
+                hostname=self.smtp_server,
+                port=self.smtp_port,
+                use_tls=True,
+                timeout=SMTP_TIMEOUT_SECONDS
+            ) as server:
+                await server.login(self.username, self.password)
+                await server.send_message(message)
+        except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused):
+            # The server answered, only this message was rejected
+            smtp_breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            smtp_breaker.release()
+            raise
+        except Exception as e:
+            smtp_breaker.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        smtp_breaker.record_success()
+    
+    async def deliver(self, message: MIMEMultipart, spool_key: str = None, on_delivered: dict = None) -> bool:
+        """Send a prepared message, failing fast while the SMTP circuit is open.
+        
+        With a spool_key the message is parked in the mail spool instead and False
+        is returned; on_delivered ({"collection", "id", "set", "unset", "sent_at"})
+        is applied once the spooled message went out.
+        """
+        if smtp_breaker.allow():
+            await self.transmit(message)
+            return True
+        if spool_key and await run_in_threadpool(mail_spool.put, spool_key, message, on_delivered):
+            logger.warning(f"SMTP circuit open, spooled mail to {message['To']} as {spool_key}")
+            return False
+        raise SmtpUnavailable(f"SMTP circuit open since {smtp_breaker.opened_at_wall.isoformat()}")
     
     async def send_invoice_email(self, invoice: dict, customer: dict, company: dict) -> bool:
         """Send invoice email with PDF attachment"""
@@ -217,21 +1350,22 @@ class EmailService:
                 return False
             
             # Generate PDF
-            pdf_buffer = self.generate_invoice_pdf(invoice, customer, company)
+            pdf_buffer = await run_in_render_pool(self.generate_invoice_pdf, invoice, customer, company)
             
-            # Render email template
-            template = jinja_env.get_template('german_invoice_email.html')
-            html_body = template.render(
-                invoice=invoice,
+            # Render email template (expects parsed dates)
+            html_body = render_template(
+                'german_invoice_email.html',
+                invoice=parse_from_mongo(dict(invoice)),
                 customer=customer,
-                company=company
+                company=company,
+                logo_url=f"{PUBLIC_BASE_URL}{company['logo_url']}" if PUBLIC_BASE_URL and company.get('logo_url') else None
             )
             
             # Create email message
-            message = MIMEMultipart()
-            message["From"] = formataddr((self.sender_name, self.sender_email))
-            message["To"] = customer["email"]
-            message["Subject"] = f"Rechnung {invoice['invoice_number']} von {company['company_name']}"
+            message = self.build_message(
+                customer["email"],
+                f"Rechnung {invoice['invoice_number']} von {company['company_name']}"
+            )
             
             # Add HTML body
             html_part = MIMEText(html_body, "html", "utf-8")
@@ -249,13 +1383,18 @@ class EmailService:
                 message.attach(part)
             
             # Send email
-            async with aiosmtplib.SMTP(
-                hostname=self.smtp_server,
-                port=self.smtp_port,
-                use_tls=True
-            ) as server:
-                await server.login(self.username, self.password)
-                await server.send_message(message)
+            if not await self.deliver(
+                message,
+                spool_key=f"invoice-{invoice['id']}",
+                on_delivered={
+                    "collection": "invoices",
+                    "id": invoice["id"],
+                    "set": {"status": "sent"},
+                    "unset": ["send_job_id", "send_claimed_at"],
+                    "sent_at": "email_sent_at"
+                }
+            ):
+                return False
             
             logger.info(f"Invoice email sent successfully to {customer['email']}")
             return True
@@ -264,6 +1403,47 @@ class EmailService:
             logger.error(f"Failed to send invoice email: {str(e)}")
             return False
     
+    async def send_dunning_email(self, invoice: dict, customer: dict, company: dict, notice: dict) -> bool:
+        """Send a payment reminder with the reminder PDF attached"""
+        try:
+            if not self.username or not self.password:
+                logger.warning("Email credentials not configured, skipping payment reminder")
+                return False
+            
+            pdf_buffer = await run_in_render_pool(render_dunning_pdf, invoice, customer, company, notice)
+            
+            context = {
+                "invoice": parse_from_mongo(dict(invoice)),
+                "customer": customer,
+                "company": company,
+                "notice": notice
+            }
+            message = self.build_message(
+                customer["email"],
+                f"{notice['title']}: Rechnung {invoice['invoice_number']} von {company['company_name']}"
+            )
+            message.attach(MIMEText(render_template('dunning_email.txt', **context), "plain", "utf-8"))
+            message.attach(MIMEText(render_template('dunning_email.html', **context), "html", "utf-8"))
+            
+            part = MIMEBase("application", "pdf")
+            part.set_payload(pdf_buffer.getvalue())
+            encoders.encode_base64(part)
+            part.add_header(
+                "Content-Disposition",
+                f"attachment; filename=Mahnung_{notice['level']}_{invoice['invoice_number']}.pdf"
+            )
+            message.attach(part)
+            
+            # Not spooled: the dunning run records the level and retries next interval
+            await self.deliver(message)
+            
+            logger.info(f"Payment reminder level {notice['level']} sent to {customer['email']}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to send payment reminder: {str(e)}")
+            return False
+    
     async def send_todo_reminder_email(self, todo: dict, customer: dict = None, company: dict = None) -> bool:
         """Send ToDo reminder email"""
         try:
@@ -286,47 +1466,18 @@ class EmailService:
             
             subject = f"Erinnerung: {todo['title']} - {due_date} um {due_time}"
             
-            html_body = f"""
-            <html>
-            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9f9f9;">
-                    <div style="background-color: white; padding: 30px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                        <h2 style="color: #2c5aa0; margin-bottom: 20px;">🔔 ToDo-Erinnerung</h2>
-                        
-                        <div style="background-color: #e8f2ff; padding: 15px; border-radius: 5px; margin: 20px 0;">
-                            <h3 style="margin-top: 0; color: #2c5aa0;">{todo['title']}</h3>
-                            {f'<p><strong>Beschreibung:</strong> {todo["description"]}</p>' if todo.get("description") else ''}
-                            <p><strong>Fällig:</strong> {due_date} um {due_time} Uhr</p>
-                            {f'<p><strong>Kunde:</strong> {customer["name"]}</p>' if customer else ''}
-                        </div>
-                        
-                        <p>Diese Erinnerung wurde automatisch vom RechnungsManager gesendet.</p>
-                        
-                        <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; font-size: 12px; color: #666; text-align: center;">
-                            <p>{company.get("company_name", "RechnungsManager")}<br>
-                            Automatische ToDo-Erinnerung</p>
-                        </div>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            text_body = f"""
-            ToDo-Erinnerung: {todo['title']}
-            
-            Fällig: {due_date} um {due_time} Uhr
-            {f'Beschreibung: {todo["description"]}' if todo.get("description") else ''}
-            {f'Kunde: {customer["name"]}' if customer else ''}
-            
-            Diese Erinnerung wurde automatisch vom RechnungsManager gesendet.
-            """
+            context = {
+                "todo": todo,
+                "customer": customer,
+                "company": company,
+                "due_date": due_date,
+                "due_time": due_time
+            }
+            html_body = render_template('todo_reminder_email.html', **context)
+            text_body = render_template('todo_reminder_email.txt', **context)
             
             # Create email message
-            message = MIMEMultipart()
-            message["From"] = formataddr((self.sender_name, self.sender_email))
-            message["To"] = recipient_email
-            message["Subject"] = subject
+            message = self.build_message(recipient_email, subject)
             
             # Add text and HTML parts
             text_part = MIMEText(text_body, "plain", "utf-8")
@@ -335,13 +1486,17 @@ class EmailService:
             message.attach(html_part)
             
             # Send email
-            async with aiosmtplib.SMTP(
-                hostname=self.smtp_server,
-                port=self.smtp_port,
-                use_tls=True
-            ) as server:
-                await server.login(self.username, self.password)
-                await server.send_message(message)
+            if not await self.deliver(
+                message,
+                spool_key=f"todo-reminder-{todo['id']}",
+                on_delivered={
+                    "collection": "todos",
+                    "id": todo["id"],
+                    "set": {"reminder_sent": True},
+                    "sent_at": "reminder_sent_at"
+                }
+            ):
+                return False
             
             logger.info(f"ToDo reminder email sent to {recipient_email}")
             return True
@@ -353,147 +1508,82 @@ class EmailService:
     def generate_invoice_pdf(self, invoice: dict, customer: dict, company: dict) -> io.BytesIO:
         """Generate PDF for invoice"""
         try:
-            buffer = io.BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4)
-            styles = getSampleStyleSheet()
-            story = []
-            
-            # Company header
-            story.append(Paragraph(f"<b>{company['company_name']}</b>", styles['Title']))
-            story.append(Paragraph(f"{company['address']}<br/>{company['postal_code']} {company['city']}", styles['Normal']))
-            story.append(Spacer(1, 20))
-            
-            # Invoice title
-            story.append(Paragraph(f"<b>RECHNUNG {invoice['invoice_number']}</b>", styles['Heading1']))
-            story.append(Spacer(1, 12))
-            
-            # Customer info
-            story.append(Paragraph("<b>Rechnungsadresse:</b>", styles['Normal']))
-            story.append(Paragraph(f"{customer['name']}<br/>{customer['address']}<br/>{customer['postal_code']} {customer['city']}", styles['Normal']))
-            story.append(Spacer(1, 20))
-            
-            # Invoice details
-            invoice_date = datetime.fromisoformat(invoice['invoice_date']).strftime('%d.%m.%Y')
-            due_date = datetime.fromisoformat(invoice['due_date']).strftime('%d.%m.%Y')
-            
-            details_data = [
-                ['Rechnungsdatum:', invoice_date],
-                ['Fälligkeitsdatum:', due_date]
-            ]
-            
-            details_table = Table(details_data, colWidths=[100, 100])
-            details_table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ]))
-            story.append(details_table)
-            story.append(Spacer(1, 20))
-            
-            # Line items
-            headers = ['Pos.', 'Beschreibung', 'Menge', 'Einzelpreis', 'Gesamt']
-            table_data = [headers]
-            
-            for i, item in enumerate(invoice['items'], 1):
-                row = [
-                    str(i),
-                    item['description'],
-                    f"{item['quantity']:.2f}",
-                    f"€{item['unit_price']:.2f}",
-                    f"€{item['total_price']:.2f}"
-                ]
-                table_data.append(row)
-            
-            items_table = Table(table_data, colWidths=[30, 200, 60, 80, 80])
-            items_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(items_table)
-            story.append(Spacer(1, 20))
-            
-            # Totals
-            totals_data = [
-                ['Zwischensumme:', f"€{invoice['subtotal']:.2f}"],
-                ['MwSt. (19%):', f"€{invoice['tax_amount']:.2f}"],
-                ['<b>Gesamtbetrag:</b>', f"<b>€{invoice['total_amount']:.2f}</b>"]
-            ]
-            
-            totals_table = Table(totals_data, colWidths=[300, 100])
-            totals_table.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
-            ]))
-            story.append(totals_table)
-            
-            # Footer
-            story.append(Spacer(1, 30))
-            footer_text = f"""
-            <b>Zahlungshinweise:</b><br/>
-            Bitte überweisen Sie den Betrag bis zum {due_date}.<br/>
-            Bank: {company.get('bank_name', 'N/A')}<br/>
-            IBAN: {company.get('iban', 'N/A')}<br/>
-            BIC: {company.get('bic', 'N/A')}<br/>
-            Verwendungszweck: {invoice['invoice_number']}
-            """
-            story.append(Paragraph(footer_text, styles['Normal']))
-            
-            doc.build(story)
-            buffer.seek(0)
-            return buffer
-            
+            return render_invoice_pdf(invoice, customer, company)
         except Exception as e:
             logger.error(f"Failed to generate PDF: {str(e)}")
             return None
 
-# Initialize email service
-email_service = EmailService()
+# Created by the lifespan together with the database client
+email_service = None
 
 # Background task for sending reminder emails
-async def send_todo_reminder_task(todo_id: str):
-    try:
-        # Get todo
-        todo = await db.todos.find_one({"id": todo_id})
-        if not todo:
-            logger.error(f"ToDo not found: {todo_id}")
-            return
-        
-        # Skip if already sent or completed
-        if todo.get("reminder_sent") or todo.get("status") != "pending":
-            return
-        
-        # Get customer if assigned
-        customer = None
-        if todo.get("customer_id"):
-            customer = await db.customers.find_one({"id": todo["customer_id"]})
+async def claim_todo_reminder(todo_id: str) -> Optional[dict]:
+    """Atomically take a due reminder so only one worker sends it.
+    
+    A claim older than REMINDER_CLAIM_TIMEOUT_MINUTES belongs to a worker
+    that died mid-send and may be taken over.
+    """
+    now = datetime.now(timezone.utc)
+    stale_before = (now - timedelta(minutes=REMINDER_CLAIM_TIMEOUT_MINUTES)).isoformat()
+    return await db.todos.find_one_and_update(
+        {
+            "id": todo_id,
+            "status": "pending",
+            "reminder_sent": {"$ne": True},
+            "$or": [
+                {"reminder_claimed_at": {"$exists": False}},
+                {"reminder_claimed_at": {"$lt": stale_before}}
+            ]
+        },
+        {"$set": {"reminder_claimed_at": now.isoformat()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def send_todo_reminder_task(todo_id: str):
+    try:
+        # Skip if waiting in the mail spool, which marks it sent on delivery
+        if await run_in_threadpool(mail_spool.contains, f"todo-reminder-{todo_id}"):
+            return
         
-        # Get company data
-        company = await db.company_data.find_one({})
-        if not company:
-            company = {
-                "company_name": "Ihre Firma GmbH",
-                "email": "info@ihrefirma.de",
-                "phone": "+49 123 456789"
-            }
+        # Skip unless this call wins the claim (already sent, completed or taken)
+        todo = await claim_todo_reminder(todo_id)
+        if not todo:
+            return
+        claim = {"id": todo_id, "reminder_claimed_at": todo["reminder_claimed_at"]}
         
-        # Send reminder email
-        success = await email_service.send_todo_reminder_email(todo, customer, company)
+        try:
+            # Get customer if assigned
+            customer = None
+            if todo.get("customer_id"):
+                customer = await db.customers.find_one({"id": todo["customer_id"]})
+            
+            # Get company data
+            company = await get_company_data()
+            
+            # Send reminder email
+            success = await email_service.send_todo_reminder_email(todo, customer, company)
+        except BaseException:
+            await db.todos.update_one(claim, {"$unset": {"reminder_claimed_at": ""}})
+            raise
         
         if success:
             # Update reminder sent status
-            await db.todos.update_one(
-                {"id": todo_id},
-                {"$set": {"reminder_sent": True, "reminder_sent_at": datetime.now(timezone.utc).isoformat()}}
-            )
+            async with sync_write() as updated_seq:
+                await db.todos.update_one(
+                    claim,
+                    {
+                        "$set": {
+                            "reminder_sent": True,
+                            "reminder_sent_at": datetime.now(timezone.utc).isoformat(),
+                            "updated_seq": updated_seq
+                        },
+                        "$unset": {"reminder_claimed_at": ""}
+                    }
+                )
             logger.info(f"ToDo reminder sent for: {todo['title']}")
+        else:
+            # Not sent (or parked in the spool): let the next check try again
+            await db.todos.update_one(claim, {"$unset": {"reminder_claimed_at": ""}})
         
     except Exception as e:
         logger.error(f"Error in send_todo_reminder_task: {str(e)}")
@@ -536,37 +1626,138 @@ async def send_invoice_email_task(invoice_id: str):
             return
         
         # Get company data
-        company = await db.company_data.find_one({})
-        if not company:
-            # Use default company data
-            company = {
-                "company_name": "Ihre Firma GmbH",
-                "address": "Musterstraße 123",
-                "postal_code": "12345",
-                "city": "Musterstadt",
-                "phone": "+49 123 456789",
-                "email": "info@ihrefirma.de",
-                "website": "www.ihrefirma.de",
-                "bank_name": "Deutsche Bank",
-                "iban": "DE89 1234 5678 9012 3456 78",
-                "bic": "DEUTDEDBXXX",
-                "tax_number": "DE123456789"
-            }
+        company = await get_company_data()
         
         # Send email
         success = await email_service.send_invoice_email(invoice, customer, company)
         
         if success:
             # Update invoice status
-            await db.invoices.update_one(
-                {"id": invoice_id},
-                {"$set": {"status": "sent", "email_sent_at": datetime.now(timezone.utc).isoformat()}}
-            )
+            async with sync_write() as updated_seq:
+                await db.invoices.update_one(
+                    {"id": invoice_id},
+                    {"$set": {
+                        "status": "sent",
+                        "email_sent_at": datetime.now(timezone.utc).isoformat(),
+                        "updated_seq": updated_seq
+                    }}
+                )
             logger.info(f"Invoice {invoice['invoice_number']} email sent and status updated")
         
     except Exception as e:
         logger.error(f"Error in send_invoice_email_task: {str(e)}")
 
+# Background scheduler
+# Periodic jobs only run in the worker holding the scheduler lease, so running
+# under several uvicorn/gunicorn workers does not multiply reminder sends.
+scheduled_jobs = []
+
+def register_scheduled_job(name: str, interval_seconds: int, job):
+    """Register a coroutine function to be run periodically by the leader"""
+    scheduled_jobs.append({"name": name, "interval": interval_seconds, "job": job})
+
+async def try_acquire_leadership(lease_name: str = "scheduler") -> bool:
+    """Acquire or renew the lease document; returns True if this worker is leader"""
+    now = datetime.now(timezone.utc)
+    try:
+        lease = await db.leases.find_one_and_update(
+            {"_id": lease_name, "$or": [{"holder": INSTANCE_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {
+                "holder": INSTANCE_ID,
+                "expires_at": now + timedelta(seconds=LEADER_LEASE_SECONDS),
+                "renewed_at": now
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease
+        return False
+    return lease is not None and lease.get("holder") == INSTANCE_ID
+
+async def release_leadership(lease_name: str = "scheduler"):
+    await db.leases.delete_one({"_id": lease_name, "holder": INSTANCE_ID})
+
+async def run_scheduler():
+    """Renew the leader lease and start due jobs while this worker is leader"""
+    loop = asyncio.get_running_loop()
+    last_run = {}
+    running = {}
+    tick = max(1, LEADER_LEASE_SECONDS // 3)
+    
+    while True:
+        try:
+            is_leader = await try_acquire_leadership()
+        except Exception as e:
+            logger.error(f"Scheduler lease check failed: {str(e)}")
+            is_leader = False
+        
+        if is_leader:
+            now = loop.time()
+            for entry in scheduled_jobs:
+                name = entry["name"]
+                if name in running and not running[name].done():
+                    continue
+                if now - last_run.get(name, float('-inf')) >= entry["interval"]:
+                    last_run[name] = now
+                    running[name] = asyncio.create_task(entry["job"]())
+        elif running:
+            # Leadership lost, stop jobs so the new leader does not duplicate them
+            for task in running.values():
+                task.cancel()
+            running.clear()
+            last_run.clear()
+        
+        try:
+            await asyncio.sleep(tick)
+        except asyncio.CancelledError:
+            for task in running.values():
+                task.cancel()
+            raise
+
+register_scheduled_job("due-todo-reminders", TODO_CHECK_INTERVAL_SECONDS, check_due_todos_task)
+
+async def apply_delivery_update(on_delivered: dict):
+    """Record a spooled message as sent on the document it belongs to"""
+    async with sync_write() as updated_seq:
+        update = {"$set": {
+            **on_delivered.get("set", {}),
+            on_delivered["sent_at"]: datetime.now(timezone.utc).isoformat(),
+            "updated_seq": updated_seq
+        }}
+        if on_delivered.get("unset"):
+            update["$unset"] = {field: "" for field in on_delivered["unset"]}
+        await db[on_delivered["collection"]].update_one({"id": on_delivered["id"]}, update)
+
+async def drain_mail_spool():
+    """Send spooled messages oldest first while the SMTP circuit lets them through"""
+    try:
+        keys = await run_in_threadpool(mail_spool.keys)
+        sent = 0
+        for key in keys:
+            entry = await run_in_threadpool(mail_spool.load, key)
+            if entry is None:
+                continue
+            if not smtp_breaker.allow():
+                break
+            try:
+                await email_service.transmit(message_from_string(entry["message"]))
+            except Exception as e:
+                if smtp_breaker.state != "closed":
+                    break
+                await run_in_threadpool(mail_spool.record_attempt, entry, f"{type(e).__name__}: {e}")
+                continue
+            await run_in_threadpool(mail_spool.remove, key)
+            if entry.get("on_delivered"):
+                await apply_delivery_update(entry["on_delivered"])
+            sent += 1
+        if sent:
+            logger.info(f"Mail spool drained {sent} of {len(keys)} messages")
+    except Exception as e:
+        logger.error(f"Error in drain_mail_spool: {str(e)}")
+
+register_scheduled_job("mail-spool", MAIL_SPOOL_INTERVAL_SECONDS, drain_mail_spool)
+
 # Helper functions
 def prepare_for_mongo(data):
     if isinstance(data, dict):
@@ -575,6 +1766,14 @@ def prepare_for_mongo(data):
                 data[key] = value.isoformat()
     return data
 
+def summary_projection(model) -> dict:
+    """Build a $project stage returning only the fields of a summary model"""
+    projection = {"_id": 0}
+    for field_name in model.model_fields:
+        projection[field_name] = 1
+    projection["item_count"] = {"$size": {"$ifNull": ["$items", []]}}
+    return projection
+
 def parse_from_mongo(item):
     if isinstance(item, dict):
         for key, value in item.items():
@@ -585,173 +1784,3008 @@ def parse_from_mongo(item):
                     pass
     return item
 
-# Customer endpoints
-@api_router.post("/customers", response_model=Customer)
-async def create_customer(customer: CustomerCreate):
-    customer_dict = customer.dict()
-    customer_obj = Customer(**customer_dict)
-    customer_data = prepare_for_mongo(customer_obj.dict())
-    await db.customers.insert_one(customer_data)
-    return customer_obj
+# Delta sync
+# Every write to a synced collection stamps the document with the next value of
+# a global counter; deletions and archival leave a tombstone. Clients keep the
+# returned cursor and ask for everything after it. A writer registers itself in
+# sync_in_flight before it moves the counter and stays there until its write has
+# landed (or committed); the cursor handed out stays below every registered
+# stamp, so a write that lands late can never fall behind a cursor a client
+# already holds. The registration carries a lower bound of the stamp (the last
+# counter value this process saw, plus one) instead of the stamp itself, which
+# keeps the counter document down to a single $inc per write at the price of a
+# cursor that is sometimes held back a little further than necessary.
+# Registrations of writers that died are dropped after SYNC_WRITE_TIMEOUT_SECONDS.
+#
+# Tombstones expire after SYNC_TOMBSTONE_TTL_DAYS (TTL index on deleted_at). A
+# scheduled checkpoint records the counter value every
+# SYNC_CHECKPOINT_INTERVAL_SECONDS; a cursor below the first checkpoint inside
+# the window may have missed expired tombstones, so it gets a full resync.
+SYNC_WRITE_TIMEOUT_SECONDS = int(os.environ.get('SYNC_WRITE_TIMEOUT_SECONDS', 60))
+SYNC_TOMBSTONE_TTL_DAYS = int(os.environ.get('SYNC_TOMBSTONE_TTL_DAYS', 90))
+SYNC_CHECKPOINT_INTERVAL_SECONDS = int(os.environ.get('SYNC_CHECKPOINT_INTERVAL_SECONDS', 3600))
+sync_seq_seen = {"value": 0}  # Highest counter value this process has seen
 
-@api_router.get("/customers", response_model=List[Customer])
-async def get_customers():
-    customers = await db.customers.find().to_list(length=None)
-    return [Customer(**parse_from_mongo(customer)) for customer in customers]
+@asynccontextmanager
+async def sync_write():
+    """Reserve the next sync sequence for the writes made inside the block"""
+    token = uuid.uuid4().hex
+    await db.sync_in_flight.insert_one({
+        "_id": token,
+        "seq": sync_seq_seen["value"] + 1,
+        "reserved_at": datetime.now(timezone.utc).isoformat()
+    })
+    try:
+        counter = await db.counters.find_one_and_update(
+            {"_id": "sync_seq"},
+            {"$inc": {"value": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        updated_seq = counter["value"]
+        sync_seq_seen["value"] = max(sync_seq_seen["value"], updated_seq)
+        yield updated_seq
+    finally:
+        await db.sync_in_flight.delete_one({"_id": token})
+        # Every synced write passes through here, so it doubles as the change signal
+        dashboard_hub.notify()
 
-@api_router.get("/customers/{customer_id}", response_model=Customer)
-async def get_customer(customer_id: str):
-    customer = await db.customers.find_one({"id": customer_id})
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    return Customer(**parse_from_mongo(customer))
+async def current_sync_seq(floor: int = 0) -> int:
+    """Highest sequence up to which every write has landed (never below `floor`)"""
+    counter = await db.counters.find_one({"_id": "sync_seq"})
+    if not counter:
+        return floor
+    cursor = counter["value"]
+    sync_seq_seen["value"] = max(sync_seq_seen["value"], cursor)
+    # Read after the counter: a writer that moved it is registered by now
+    expired_before = (datetime.now(timezone.utc) - timedelta(seconds=SYNC_WRITE_TIMEOUT_SECONDS)).isoformat()
+    expired = []
+    async for reservation in db.sync_in_flight.find({}):
+        if reservation["reserved_at"] < expired_before:
+            expired.append(reservation["_id"])
+        else:
+            cursor = min(cursor, reservation["seq"] - 1)
+    if expired:
+        await db.sync_in_flight.delete_many({"_id": {"$in": expired}})
+    return max(cursor, floor)
 
-@api_router.put("/customers/{customer_id}", response_model=Customer)
-async def update_customer(customer_id: str, customer_update: CustomerCreate):
-    existing_customer = await db.customers.find_one({"id": customer_id})
-    if not existing_customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
+async def record_deletion(collection: str, doc_id: str):
+    async with sync_write() as updated_seq:
+        await db.sync_tombstones.insert_one({
+            "collection": collection,
+            "id": doc_id,
+            "updated_seq": updated_seq,
+            "deleted_at": datetime.now(timezone.utc)  # A date, for the TTL index
+        })
+
+async def record_sync_checkpoint():
+    counter = await db.counters.find_one({"_id": "sync_seq"})
+    now = datetime.now(timezone.utc)
+    await db.sync_checkpoints.insert_one({"seq": counter["value"] if counter else 0, "created_at": now})
+    # Only the newest checkpoint before the window is kept, to tell that it has passed
+    cutoff = now - timedelta(days=SYNC_TOMBSTONE_TTL_DAYS)
+    last_before = await db.sync_checkpoints.find_one({"created_at": {"$lt": cutoff}}, sort=[("created_at", -1)])
+    if last_before:
+        await db.sync_checkpoints.delete_many({"created_at": {"$lt": last_before["created_at"]}})
+
+async def sync_horizon() -> int:
+    """Lowest cursor that still sees every tombstone written after it"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=SYNC_TOMBSTONE_TTL_DAYS)
+    if not await db.sync_checkpoints.find_one({"created_at": {"$lt": cutoff}}):
+        # Checkpoints are younger than the window, so no tombstone has expired yet
+        return 0
+    first_inside = await db.sync_checkpoints.find_one({"created_at": {"$gte": cutoff}}, sort=[("created_at", 1)])
+    if first_inside:
+        return first_inside["seq"]
+    # No checkpoint in the whole window: any tombstone may be gone
+    counter = await db.counters.find_one({"_id": "sync_seq"})
+    return counter["value"] if counter else 0
+
+register_scheduled_job("sync-checkpoint", SYNC_CHECKPOINT_INTERVAL_SECONDS, record_sync_checkpoint)
+
+# Document numbers
+# Invoice and quote numbers come from counters so parallel requests never
+# share a number. A counter is seeded from the highest existing number.
+DOCUMENT_NUMBER_SOURCES = {
+    "invoice": ("invoices", "invoice_number"),
+    "quote": ("quotes", "quote_number")
+}
+
+def format_document_number(prefix: str, number: int) -> str:
+    return f"{prefix}-{number:04d}"
+
+async def reserve_document_numbers(kind: str, count: int = 1, session=None) -> int:
+    """Reserve `count` consecutive numbers and return the first one. Inside a
+    transaction the reservation rolls back with it, so retries leave no gaps."""
+    counter_id = f"{kind}_number"
+    if not await db.counters.find_one({"_id": counter_id}, session=session):
+        collection, field = DOCUMENT_NUMBER_SOURCES[kind]
+        highest = 0
+        for name in (collection, f"{collection}_archive"):
+            async for doc in db[name].find({}, {"_id": 0, field: 1}, session=session):
+                try:
+                    highest = max(highest, int(str(doc.get(field, "")).rsplit("-", 1)[-1]))
+                except ValueError:
+                    pass
+        try:
+            await db.counters.insert_one({"_id": counter_id, "value": highest}, session=session)
+        except DuplicateKeyError:
+            pass
     
-    update_data = customer_update.dict()
-    update_data["id"] = customer_id
-    update_data["created_at"] = existing_customer.get("created_at")
+    counter = await db.counters.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"value": count}},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    return counter["value"] - count + 1
+
+async def release_document_numbers(kind: str, first: int, count: int) -> bool:
+    """Hand back the last reserved range if no later reservation followed it"""
+    result = await db.counters.update_one(
+        {"_id": f"{kind}_number", "value": first + count - 1},
+        {"$inc": {"value": -count}}
+    )
+    return result.modified_count == 1
+
+# Quote conversion
+# Quotes are claimed with a conditional update on status "accepted", so each
+# quote turns into exactly one invoice no matter how many requests race. On a
+# replica set the whole conversion, invoice numbers included, runs in a
+# transaction. Standalone servers have none: there a failed conversion keeps
+# the invoices it already wrote (deleting them would leave holes in the
+# numbering), links them to their quotes and hands unused numbers back. Claims
+# left behind by a crashed worker are settled the same way once they are older
+# than CONVERSION_CLAIM_TIMEOUT_MINUTES.
+mongo_features = {"transactions": False}
+QUOTE_INVOICE_TERMS_DAYS = 30  # payment terms of invoices created from quotes
+CONVERSION_CLAIM_TIMEOUT_MINUTES = int(os.environ.get('CONVERSION_CLAIM_TIMEOUT_MINUTES', 10))
+CONVERSION_RECOVERY_INTERVAL_SECONDS = int(os.environ.get('CONVERSION_RECOVERY_INTERVAL_SECONDS', 300))
+
+def build_invoice_from_quote(quote: dict, invoice_number: str, updated_seq: int) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "invoice_number": invoice_number,
+        "customer_id": quote["customer_id"],
+        "customer_name": quote["customer_name"],
+        "items": quote["items"],
+        "subtotal": quote["subtotal"],
+        "tax_rate": quote["tax_rate"],
+        "tax_amount": quote["tax_amount"],
+        "total_amount": quote["total_amount"],
+        "invoice_date": now.isoformat(),
+        "due_date": (now + timedelta(days=QUOTE_INVOICE_TERMS_DAYS)).isoformat(),
+        "status": "draft",
+        "notes": f"Basierend auf {quote['quote_number']}" + (f" - {quote.get('notes', '')}" if quote.get('notes') else ""),
+        "apply_tax": quote.get("apply_tax", True),  # Preserve tax setting from quote
+        "created_at": now.isoformat(),
+        "converted_from_quote_id": quote["id"],
+        "updated_seq": updated_seq
+    }
+
+async def convert_claimed_quotes(claim: str, quote_ids: Optional[List[str]], limit: int, updated_seq: int,
+                                 reservation: dict, session=None) -> List[dict]:
+    query = {"status": "accepted"}
+    if quote_ids is not None:
+        query["id"] = {"$in": quote_ids}
+    candidates = await db.quotes.find(query, {"_id": 0, "id": 1}, session=session).to_list(length=limit)
+    if not candidates:
+        return []
+    
+    query["id"] = {"$in": [candidate["id"] for candidate in candidates]}
+    await db.quotes.update_many(
+        query,
+        {"$set": {
+            "status": "converting",
+            "conversion_claim": claim,
+            "conversion_claimed_at": datetime.now(timezone.utc).isoformat()
+        }},
+        session=session
+    )
+    quotes = await db.quotes.find({"conversion_claim": claim}, session=session).to_list(length=None)
+    if not quotes:
+        return []
     
-    customer_obj = Customer(**update_data)
-    customer_data = prepare_for_mongo(customer_obj.dict())
+    # Numbers are only reserved for quotes this request actually holds
+    first_number = await reserve_document_numbers("invoice", len(quotes), session)
+    reservation.update(first=first_number, count=len(quotes), quote_ids=[quote["id"] for quote in quotes])
+    invoices = [
+        build_invoice_from_quote(quote, format_document_number("INV", first_number + offset), updated_seq)
+        for offset, quote in enumerate(quotes)
+    ]
+    await db.invoices.insert_many(invoices, session=session)
     
-    await db.customers.replace_one({"id": customer_id}, customer_data)
-    return customer_obj
+    await db.quotes.bulk_write([
+        UpdateOne(
+            {"id": quote["id"], "conversion_claim": claim},
+            {
+                "$set": {
+                    "status": "converted",
+                    "converted_to_invoice_id": invoice["id"],
+                    "updated_seq": updated_seq
+                },
+                "$unset": {"conversion_claim": "", "conversion_claimed_at": ""}
+            }
+        )
+        for quote, invoice in zip(quotes, invoices)
+    ], session=session)
+    
+    return [
+        {
+            "quote_id": quote["id"],
+            "quote_number": quote["quote_number"],
+            "invoice_id": invoice["id"],
+            "invoice_number": invoice["invoice_number"]
+        }
+        for quote, invoice in zip(quotes, invoices)
+    ]
+
+async def settle_conversion_claim(claim_query: dict, updated_seq: int) -> dict:
+    """Finish or release quotes left in "converting": quotes whose invoice was
+    written become converted, the others go back to accepted"""
+    quotes = await db.quotes.find(
+        {**claim_query, "status": "converting"}, {"_id": 0, "id": 1, "conversion_claim": 1}
+    ).to_list(length=None)
+    if not quotes:
+        return {"converted": 0, "released": 0}
+    invoices = {
+        invoice["converted_from_quote_id"]: invoice["id"]
+        for invoice in await db.invoices.find(
+            {"converted_from_quote_id": {"$in": [quote["id"] for quote in quotes]}},
+            {"_id": 0, "id": 1, "converted_from_quote_id": 1}
+        ).to_list(length=None)
+    }
+    updates = []
+    for quote in quotes:
+        if quote["id"] in invoices:
+            fields = {"status": "converted", "converted_to_invoice_id": invoices[quote["id"]]}
+        else:
+            fields = {"status": "accepted"}
+        updates.append(UpdateOne(
+            {"id": quote["id"], "conversion_claim": quote["conversion_claim"]},
+            {"$set": {**fields, "updated_seq": updated_seq},
+             "$unset": {"conversion_claim": "", "conversion_claimed_at": ""}}
+        ))
+    await db.quotes.bulk_write(updates, ordered=False)
+    return {"converted": len(invoices), "released": len(quotes) - len(invoices)}
+
+async def convert_quotes(quote_ids: Optional[List[str]], limit: int = 500) -> List[dict]:
+    """Convert accepted quotes to draft invoices, atomically per quote"""
+    claim = str(uuid.uuid4())
+    
+    async with sync_write() as updated_seq:
+        if mongo_features["transactions"]:
+            async with await client.start_session() as session:
+                async def run_in_transaction(session):
+                    return await convert_claimed_quotes(claim, quote_ids, limit, updated_seq, {}, session)
+                return await session.with_transaction(run_in_transaction)
+        
+        reservation = {}
+        try:
+            return await convert_claimed_quotes(claim, quote_ids, limit, updated_seq, reservation)
+        except Exception:
+            await settle_conversion_claim({"conversion_claim": claim}, updated_seq)
+            if reservation:
+                used = {
+                    int(invoice["invoice_number"].rsplit("-", 1)[-1])
+                    for invoice in await db.invoices.find(
+                        {"converted_from_quote_id": {"$in": reservation["quote_ids"]}},
+                        {"_id": 0, "invoice_number": 1}
+                    ).to_list(length=None)
+                }
+                # insert_many is ordered, so the unused numbers are the tail of the range
+                first_unused = max(used) + 1 if used else reservation["first"]
+                unused = reservation["first"] + reservation["count"] - first_unused
+                if unused and not await release_document_numbers("invoice", first_unused, unused):
+                    logger.error(f"Invoice numbers {first_unused} to {first_unused + unused - 1} stay unused")
+            raise
+
+async def recover_stale_conversions():
+    """Scheduled entry point: settle claims of conversions that never finished"""
+    try:
+        stale_before = (datetime.now(timezone.utc) - timedelta(minutes=CONVERSION_CLAIM_TIMEOUT_MINUTES)).isoformat()
+        claim_query = {"conversion_claimed_at": {"$lt": stale_before}}
+        if not await db.quotes.count_documents({**claim_query, "status": "converting"}, limit=1):
+            return
+        async with sync_write() as updated_seq:
+            settled = await settle_conversion_claim(claim_query, updated_seq)
+        logger.warning(
+            f"Recovered stale quote conversions: {settled['converted']} converted, {settled['released']} released"
+        )
+    except Exception as e:
+        logger.error(f"Error in recover_stale_conversions: {str(e)}")
+
+register_scheduled_job("quote-conversion-recovery", CONVERSION_RECOVERY_INTERVAL_SECONDS, recover_stale_conversions)
+
+# Batch status updates
+# Each target status lists the statuses it may be reached from. Eligible
+# documents change in one update_many that is conditioned on those statuses
+# and stamped with a fresh sync sequence, so documents changed by a concurrent
+# request in between are reported as conflicts instead of being overwritten.
+# "converted" (and the transient "converting") are only set by quote conversion.
+STATUS_TRANSITIONS = {
+    "invoices": {
+        "draft": {"sent"},
+        "sent": {"draft", "paid"},
+        "paid": {"draft", "sent"}
+    },
+    "quotes": {
+        "draft": {"sent"},
+        "sent": {"draft", "accepted", "rejected"},
+        "accepted": {"draft", "sent", "rejected"},
+        "rejected": {"draft", "sent", "accepted"}
+    },
+    "todos": {
+        "pending": {"completed", "cancelled"},
+        "completed": {"pending"},
+        "cancelled": {"pending"}
+    }
+}
+
+def status_batch_query(selection: StatusBatchSelection) -> dict:
+    query = {}
+    if selection.ids:
+        query["id"] = {"$in": selection.ids}
+    if selection.customer_id:
+        query["customer_id"] = selection.customer_id
+    if selection.current_status:
+        query["status"] = selection.current_status
+    if not query:
+        raise HTTPException(status_code=400, detail="Select documents by ids, customer_id or current_status")
+    return query
+
+def status_change_update(collection: str, status: str, updated_seq: int, changed_at: str) -> dict:
+    """The status change together with the timestamps that depend on it"""
+    update = {"$set": {"status": status, "updated_seq": updated_seq}}
+    if collection == "invoices":
+        if status == "paid":
+            update["$set"]["paid_at"] = changed_at
+        else:
+            update["$unset"] = {"paid_at": "", "payment_reference": ""}
+    elif collection == "todos":
+        if status == "completed":
+            update["$set"]["completed_at"] = changed_at
+        else:
+            update["$unset"] = {"completed_at": ""}
+    return update
+
+async def apply_status_change(collection: str, status: str, query: dict, ids: Optional[List[str]],
+                              limit: int, changed_at: str, updated_seq: int, session=None) -> List[dict]:
+    allowed = STATUS_TRANSITIONS[collection][status]
+    projection = {"_id": 0, "id": 1, "status": 1}
+    if collection == "invoices":
+        projection.update({"invoice_number": 1, "total_amount": 1, "dunning_fees": 1})
+    documents = await db[collection].find(query, projection, session=session).to_list(length=limit)
+    
+    outcomes = {}
+    eligible = []
+    for document in documents:
+        if document["status"] == status:
+            outcomes[document["id"]] = {"outcome": "unchanged"}
+        elif document["status"] not in allowed:
+            outcomes[document["id"]] = {"outcome": "invalid_transition", "from": document["status"]}
+        else:
+            eligible.append(document)
+    
+    if eligible:
+        eligible_ids = [document["id"] for document in eligible]
+        await db[collection].update_many(
+            {"id": {"$in": eligible_ids}, "status": {"$in": list(allowed)}},
+            status_change_update(collection, status, updated_seq, changed_at),
+            session=session
+        )
+        changed = {
+            document["id"]
+            for document in await db[collection].find(
+                {"id": {"$in": eligible_ids}, "updated_seq": updated_seq}, {"_id": 0, "id": 1}, session=session
+            ).to_list(length=None)
+        }
+        for document in eligible:
+            if document["id"] in changed:
+                outcomes[document["id"]] = {"outcome": "updated", "from": document["status"]}
+            else:
+                outcomes[document["id"]] = {"outcome": "conflict", "from": document["status"]}
+        
+        if collection == "invoices":
+            await record_manual_payments(
+                [document for document in eligible if document["id"] in changed], status, changed_at, session
+            )
+    
+    order = ids if ids else [document["id"] for document in documents]
+    return [{"id": doc_id, **outcomes.get(doc_id, {"outcome": "not_found"})} for doc_id in order]
+
+async def record_manual_payments(invoices: List[dict], status: str, changed_at: str, session=None):
+    """Keep db.payments in step with invoices marked paid or unpaid by hand"""
+    if not invoices:
+        return
+    if status != "paid":
+        # Imported bank payments stay, they record money that actually arrived
+        await db.payments.delete_many(
+            {"invoice_id": {"$in": [invoice["id"] for invoice in invoices]}, "source": "manual"},
+            session=session
+        )
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db.payments.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "invoice_id": invoice["id"],
+            "invoice_number": invoice["invoice_number"],
+            "amount": round(invoice["total_amount"] + invoice.get("dunning_fees", 0.0), 2),
+            "booking_date": changed_at,
+            "reference": None,
+            "source": "manual",
+            "created_at": now
+        }
+        for invoice in invoices
+    ], session=session)
+
+async def update_statuses(collection: str, status: str, query: dict, ids: Optional[List[str]],
+                          limit: int, changed_at: Optional[str] = None) -> dict:
+    """Move the selected documents to `status`; returns per-id outcomes.
+    
+    Outcomes are updated, unchanged, invalid_transition, conflict or not_found.
+    """
+    try:
+        changed_at = datetime.fromisoformat(changed_at).isoformat() if changed_at else datetime.now(timezone.utc).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="paid_at must be an ISO date")
+    limit = len(ids) if ids else limit
+    
+    async with sync_write() as updated_seq:
+        if mongo_features["transactions"]:
+            async with await client.start_session() as session:
+                async def run_in_transaction(session):
+                    return await apply_status_change(
+                        collection, status, query, ids, limit, changed_at, updated_seq, session
+                    )
+                results = await session.with_transaction(run_in_transaction)
+        else:
+            results = await apply_status_change(collection, status, query, ids, limit, changed_at, updated_seq)
+    
+    counts = Counter(result["outcome"] for result in results)
+    return {"status": status, "updated": counts["updated"], "counts": dict(counts), "results": results}
+
+def raise_for_status_outcome(result: dict, not_found_detail: str):
+    """Map the outcome of a single-document status change to the HTTP error it stands for"""
+    if result["outcome"] == "not_found":
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    if result["outcome"] == "invalid_transition":
+        raise HTTPException(status_code=400, detail=f"Status cannot change from {result['from']}")
+    if result["outcome"] == "conflict":
+        raise HTTPException(status_code=409, detail="Status was changed by another request")
+
+# Idempotency keys
+# The first response for an Idempotency-Key is stored and replayed for
+# retries. Concurrent duplicates race on the unique _id, and the loser gets
+# 409 until the first request has finished.
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+
+def fingerprint_request(payload) -> str:
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+async def claim_idempotency_key(key_id: str, request_hash: str) -> Optional[dict]:
+    """Claim the key for this request; returns the stored record if already taken"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.idempotency_keys.insert_one({
+            "_id": key_id,
+            "request_hash": request_hash,
+            "status": "in_progress",
+            "created_at": now,
+            "locked_at": now
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    
+    # Take over keys whose original request died without finishing
+    stale = await db.idempotency_keys.find_one_and_update(
+        {
+            "_id": key_id,
+            "request_hash": request_hash,
+            "status": "in_progress",
+            "locked_at": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}
+        },
+        {"$set": {"locked_at": now}}
+    )
+    if stale:
+        return None
+    return await db.idempotency_keys.find_one({"_id": key_id})
+
+async def run_idempotent(idempotency_key: Optional[str], scope: str, payload, operation):
+    """Run `operation` once per Idempotency-Key and replay its response for retries"""
+    if not idempotency_key:
+        return await operation()
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key too long")
+    
+    key_id = f"{scope}:{idempotency_key}"
+    request_hash = fingerprint_request(payload)
+    existing = await claim_idempotency_key(key_id, request_hash)
+    
+    if existing:
+        if existing["request_hash"] != request_hash:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was used with a different request")
+        if existing["status"] != "completed":
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        return JSONResponse(
+            content=existing["response"],
+            status_code=existing.get("status_code", 200),
+            headers={"Idempotent-Replayed": "true"}
+        )
+    
+    try:
+        result = await operation()
+    except Exception:
+        # Failed requests may be retried with the same key
+        await db.idempotency_keys.delete_one({"_id": key_id})
+        raise
+    
+    await db.idempotency_keys.update_one(
+        {"_id": key_id},
+        {"$set": {"status": "completed", "response": jsonable_encoder(result), "status_code": 200}}
+    )
+    return result
+
+# Job tracking for long-running batch operations
+async def create_job(job_type: str, total: int = 0) -> Job:
+    job = Job(type=job_type, total=total)
+    await db.jobs.insert_one(prepare_for_mongo(job.dict()))
+    return job
+
+async def start_job(job_id: str, total: Optional[int] = None):
+    update = {"status": "running", "started_at": datetime.now(timezone.utc).isoformat()}
+    if total is not None:
+        update["total"] = total
+    await db.jobs.update_one({"id": job_id}, {"$set": update})
+
+async def record_job_progress(job_id: str, succeeded: int = 0, failed: int = 0, error: str = None):
+    update = {"$inc": {"processed": succeeded + failed, "succeeded": succeeded, "failed": failed}}
+    if error:
+        update["$push"] = {"errors": {"$each": [error], "$slice": -50}}
+    await db.jobs.update_one({"id": job_id}, update)
+
+async def finish_job(job_id: str, status: str = "completed", result: dict = None):
+    update = {"status": status, "finished_at": datetime.now(timezone.utc).isoformat()}
+    if result is not None:
+        update["result"] = result
+    await db.jobs.update_one({"id": job_id}, {"$set": update})
+
+# Customer fan-out
+# Invoices, quotes and todos embed customer_name so lists never need a join.
+# Renames and deletions are pushed to them in id batches by a background job.
+CUSTOMER_PROPAGATION_BATCH_SIZE = int(os.environ.get('CUSTOMER_PROPAGATION_BATCH_SIZE', 500))
+CUSTOMER_DEPENDENT_COLLECTIONS = ["invoices", "quotes", "todos", "recurring_invoices"]
+
+async def update_in_batches(job_id: str, collection: str, query: dict, fields: dict,
+                            still_current=None) -> bool:
+    """Set `fields` on all documents matching `query`, one id batch at a time.
+    
+    `query` must stop matching once a document is updated. Returns False if
+    `still_current` reports the job has been superseded.
+    """
+    while True:
+        if still_current and not await still_current():
+            return False
+        batch = await db[collection].find(query, {"_id": 0, "id": 1}).to_list(
+            length=CUSTOMER_PROPAGATION_BATCH_SIZE
+        )
+        if not batch:
+            return True
+        async with sync_write() as updated_seq:
+            result = await db[collection].update_many(
+                {**query, "id": {"$in": [doc["id"] for doc in batch]}},
+                {"$set": {**fields, "updated_seq": updated_seq}}
+            )
+        await record_job_progress(job_id, succeeded=result.modified_count)
+
+async def propagate_customer_name(job_id: str, customer_id: str, name: str):
+    try:
+        queries = {
+            collection: {"customer_id": customer_id, "customer_name": {"$ne": name}}
+            for collection in CUSTOMER_DEPENDENT_COLLECTIONS
+        }
+        total = 0
+        for collection, query in queries.items():
+            total += await db[collection].count_documents(query)
+        await start_job(job_id, total=total)
+        
+        async def still_current():
+            # A newer rename has its own job; stop instead of writing a stale name
+            customer = await db.customers.find_one({"id": customer_id}, {"_id": 0, "name": 1})
+            return customer is not None and customer["name"] == name
+        
+        for collection, query in queries.items():
+            if not await update_in_batches(job_id, collection, query, {"customer_name": name}, still_current):
+                await finish_job(job_id, result={"superseded": True})
+                return
+        
+        await finish_job(job_id)
+        logger.info(f"Customer name propagated to {total} documents for {customer_id}")
+    
+    except Exception as e:
+        logger.error(f"Error in propagate_customer_name: {str(e)}")
+        await finish_job(job_id, status="failed")
+
+def invoice_customer_snapshot(invoice: dict) -> dict:
+    """Customer data for documents of a deleted customer, from the invoice itself"""
+    return {
+        **{name: "" for name in EINVOICE_CUSTOMER_FIELDS},
+        "name": invoice["customer_name"],
+        **(invoice.get("customer_snapshot") or {}),
+        "id": invoice["customer_id"]
+    }
+
+async def detach_deleted_customer(job_id: str, customer_id: str, snapshot: dict):
+    """Handle documents of a deleted customer.
+    
+    Invoices and quotes are retained (statutory retention), archived ones
+    included, with a snapshot of the billing address and get customer_deleted
+    set; todos are unlinked and recurring invoices stopped.
+    """
+    try:
+        retained = {"customer_deleted": True, "customer_snapshot": snapshot}
+        updates = [
+            ("invoices", {"customer_id": customer_id, "customer_deleted": {"$ne": True}}, retained),
+            ("quotes", {"customer_id": customer_id, "customer_deleted": {"$ne": True}}, retained),
+            ("todos", {"customer_id": customer_id}, {"customer_id": None, "customer_name": None}),
+            ("recurring_invoices", {"customer_id": customer_id, "active": True}, {"active": False})
+        ]
+        total = 0
+        for collection, query, _ in updates:
+            total += await db[collection].count_documents(query)
+        await start_job(job_id, total=total)
+        
+        for collection, query, fields in updates:
+            await update_in_batches(job_id, collection, query, fields)
+        # Archived documents are not synced, so they need no sequence stamp
+        for collection in ARCHIVED_COLLECTIONS:
+            await db[f"{collection}_archive"].update_many(
+                {"customer_id": customer_id, "customer_deleted": {"$ne": True}}, {"$set": retained}
+            )
+        
+        await finish_job(job_id)
+    
+    except Exception as e:
+        logger.error(f"Error in detach_deleted_customer: {str(e)}")
+        await finish_job(job_id, status="failed")
+
+# Bank statement import
+# Statements are parsed as a stream of credit lines and matched against an
+# in-memory index of open invoices: by invoice number found in the
+# Verwendungszweck (the reference printed on the PDF) plus the amount.
+INVOICE_REFERENCE_PATTERN = re.compile(r"INV[\s\-_]*(\d+)", re.IGNORECASE)
+MT940_STATEMENT_LINE = re.compile(r"^(\d{6})(\d{4})?(R?[CD])[A-Z]?(\d+,\d*)")
+MT940_SUBFIELD = re.compile(r"\?\d{2}")
+
+class StatementLine(BaseModel):
+    amount: float  # Positive for credits
+    booking_date: Optional[str] = None
+    reference: str = ""
+    counterparty: Optional[str] = None
+
+def xml_local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def xml_find_text(element, *path) -> Optional[str]:
+    """Namespace-agnostic lookup of the first element along `path`"""
+    current = [element]
+    for name in path:
+        current = [child for node in current for child in node if xml_local_name(child.tag) == name]
+        if not current:
+            return None
+    return (current[0].text or "").strip()
+
+def xml_all_text(element, name: str) -> List[str]:
+    return [(node.text or "").strip() for node in element.iter() if xml_local_name(node.tag) == name]
+
+def parse_camt053(stream):
+    """Yield credit lines from a CAMT.053 statement without loading the whole tree"""
+    for _, element in ET.iterparse(stream, events=("end",)):
+        if xml_local_name(element.tag) != "Ntry":
+            continue
+        if xml_find_text(element, "CdtDbtInd") == "CRDT" and xml_find_text(element, "RvslInd") != "true":
+            booking_date = xml_find_text(element, "BookgDt", "Dt") or xml_find_text(element, "BookgDt", "DtTm")
+            transactions = [node for node in element.iter() if xml_local_name(node.tag) == "TxDtls"]
+            if len(transactions) <= 1:
+                parts = [(transactions[0] if transactions else element, xml_find_text(element, "Amt"))]
+            else:
+                # Batch booking: every transaction carries its own amount
+                parts = [
+                    (transaction, xml_find_text(transaction, "AmtDtls", "TxAmt", "Amt") or xml_find_text(transaction, "Amt"))
+                    for transaction in transactions
+                ]
+            
+            for transaction, amount in parts:
+                if not amount:
+                    continue
+                reference = xml_all_text(transaction, "Ustrd") + xml_all_text(element, "AddtlNtryInf")
+                yield StatementLine(
+                    amount=float(amount),
+                    booking_date=(booking_date or "")[:10] or None,
+                    reference=" ".join(part for part in reference if part),
+                    counterparty=xml_find_text(transaction, "RltdPties", "Dbtr", "Nm")
+                )
+        element.clear()
+
+def parse_mt940(lines):
+    """Yield credit lines from MT940 :61:/:86: pairs"""
+    pending = None
+    info = []
+    
+    def flush():
+        if pending is not None:
+            reference = MT940_SUBFIELD.sub(" ", "".join(info))
+            return pending.model_copy(update={"reference": " ".join(reference.split())})
+        return None
+    
+    current_tag = None
+    for raw_line in lines:
+        line = raw_line.rstrip("\r\n")
+        tag_match = re.match(r"^:(\d{2}[A-Z]?):(.*)$", line)
+        if tag_match:
+            current_tag, value = tag_match.groups()
+            if current_tag == "61":
+                entry = flush()
+                if entry:
+                    yield entry
+                pending, info = None, []
+                match = MT940_STATEMENT_LINE.match(value)
+                if match and match.group(3) == "C":
+                    value_date = match.group(1)
+                    pending = StatementLine(
+                        amount=float(match.group(4).replace(",", ".")),
+                        booking_date=f"20{value_date[0:2]}-{value_date[2:4]}-{value_date[4:6]}",
+                        reference=value
+                    )
+            elif current_tag == "86":
+                info = [value]
+            elif current_tag in ("62F", "62M"):
+                entry = flush()
+                if entry:
+                    yield entry
+                pending, info = None, []
+        elif current_tag == "86" and line != "-":
+            info.append(line)
+    
+    entry = flush()
+    if entry:
+        yield entry
+
+CSV_COLUMNS = {
+    "amount": ("betrag", "amount", "umsatz", "betrag (eur)"),
+    "reference": ("verwendungszweck", "purpose", "reference", "buchungstext", "vwz"),
+    "booking_date": ("buchungstag", "buchungsdatum", "date", "datum", "valuta"),
+    "counterparty": ("auftraggeber", "zahlungspflichtiger", "name", "beguenstigter/zahlungspflichtiger",
+                     "auftraggeber/empfänger", "empfänger")
+}
+
+def parse_german_amount(value: str) -> float:
+    value = value.strip().replace("€", "").replace("EUR", "").replace(" ", "")
+    if "," in value:
+        value = value.replace(".", "").replace(",", ".")
+    return float(value)
+
+def parse_statement_csv(lines):
+    """Yield credit lines from a bank CSV export (German or English headers)"""
+    rows = csv.reader(lines, delimiter=";" if ";" in lines.peek_header() else ",")
+    columns = None
+    for row in rows:
+        if columns is None:
+            normalized = [cell.strip().strip('"').lower() for cell in row]
+            found = {
+                key: next((i for i, name in enumerate(normalized) if name in names), None)
+                for key, names in CSV_COLUMNS.items()
+            }
+            if found["amount"] is not None and found["reference"] is not None:
+                columns = found
+            continue
+        if len(row) <= max(index for index in columns.values() if index is not None):
+            continue
+        try:
+            amount = parse_german_amount(row[columns["amount"]])
+        except ValueError:
+            continue
+        if amount <= 0:
+            continue
+        booking_date = None
+        if columns["booking_date"] is not None:
+            raw_date = row[columns["booking_date"]].strip()
+            for date_format in ("%d.%m.%Y", "%Y-%m-%d", "%d.%m.%y"):
+                try:
+                    booking_date = datetime.strptime(raw_date, date_format).date().isoformat()
+                    break
+                except ValueError:
+                    pass
+        yield StatementLine(
+            amount=amount,
+            booking_date=booking_date,
+            reference=row[columns["reference"]],
+            counterparty=row[columns["counterparty"]] if columns["counterparty"] is not None else None
+        )
+
+class PeekableLines:
+    """Text line iterator over a binary upload that can look at the first line"""
+    def __init__(self, stream, encoding: str):
+        self.lines = io.TextIOWrapper(stream, encoding=encoding, errors="replace", newline="")
+        self.first = None
+    
+    def peek_header(self) -> str:
+        if self.first is None:
+            self.first = self.lines.readline()
+        return self.first
+    
+    def __iter__(self):
+        if self.first is not None:
+            yield self.first
+        yield from self.lines
+
+def detect_statement_format(head: bytes) -> str:
+    text = head.lstrip(b"\xef\xbb\xbf").lstrip()
+    if text.startswith(b"<"):
+        return "camt053"
+    if text.startswith((b":20:", b"{1:", b":940:")) or b"\n:20:" in text or b"\n:61:" in text:
+        return "mt940"
+    return "csv"
+
+def iter_statement_lines(stream, statement_format: str, encoding: str):
+    if statement_format == "camt053":
+        return parse_camt053(stream)
+    if statement_format == "mt940":
+        return parse_mt940(io.TextIOWrapper(stream, encoding=encoding, errors="replace"))
+    return parse_statement_csv(PeekableLines(stream, encoding))
+
+def open_amount_cents(invoice: dict) -> int:
+    """Amount the customer owes, including reminder fees"""
+    return round((invoice["total_amount"] + (invoice.get("dunning_fees") or 0.0)) * 100)
+
+class OpenInvoiceIndex:
+    """Hash index of open invoices by normalized number and by amount in cents"""
+    def __init__(self, invoices: List[dict]):
+        self.by_number = {}
+        self.by_amount = defaultdict(list)
+        for invoice in invoices:
+            self.by_number[self.normalize(invoice["invoice_number"])] = invoice
+            self.by_amount[open_amount_cents(invoice)].append(invoice)
+    
+    @staticmethod
+    def normalize(number: str) -> Optional[str]:
+        match = INVOICE_REFERENCE_PATTERN.search(number or "")
+        return f"INV-{int(match.group(1))}" if match else None
+    
+    def remove(self, invoice: dict):
+        self.by_number.pop(self.normalize(invoice["invoice_number"]), None)
+        candidates = self.by_amount.get(open_amount_cents(invoice), [])
+        if invoice in candidates:
+            candidates.remove(invoice)
+    
+    def referenced(self, reference: str) -> List[dict]:
+        found = []
+        for match in INVOICE_REFERENCE_PATTERN.finditer(reference or ""):
+            invoice = self.by_number.get(f"INV-{int(match.group(1))}")
+            if invoice and invoice not in found:
+                found.append(invoice)
+        return found
+
+def reconcile_statement(lines, index: OpenInvoiceIndex) -> dict:
+    """Match credit lines against the open invoice index in one pass"""
+    report = {"credits": 0, "matched": [], "amount_mismatch": [], "suggestions": [], "unmatched": []}
+    for line in lines:
+        report["credits"] += 1
+        cents = round(line.amount * 100)
+        line_info = {"amount": line.amount, "booking_date": line.booking_date, "reference": line.reference[:140]}
+        referenced = index.referenced(line.reference)
+        
+        # One payment may settle several referenced invoices at once
+        if referenced and sum(open_amount_cents(invoice) for invoice in referenced) == cents:
+            for invoice in referenced:
+                index.remove(invoice)
+                report["matched"].append({
+                    **line_info,
+                    "invoice_id": invoice["id"],
+                    "invoice_number": invoice["invoice_number"],
+                    "amount": open_amount_cents(invoice) / 100
+                })
+        elif referenced:
+            report["amount_mismatch"].append({
+                **line_info,
+                "invoice_numbers": [invoice["invoice_number"] for invoice in referenced],
+                "open_amount": sum(open_amount_cents(invoice) for invoice in referenced) / 100
+            })
+        elif len(index.by_amount.get(cents, [])) == 1:
+            # Amount alone is not proof of payment; report it for manual review
+            invoice = index.by_amount[cents][0]
+            report["suggestions"].append({
+                **line_info,
+                "invoice_id": invoice["id"],
+                "invoice_number": invoice["invoice_number"],
+                "counterparty": line.counterparty
+            })
+        elif len(report["unmatched"]) < 500:
+            report["unmatched"].append({**line_info, "counterparty": line.counterparty})
+    return report
+
+async def apply_statement_matches(matched: List[dict], statement_format: str, filename: str):
+    """Bulk-mark matched invoices as paid and record the payments"""
+    if not matched:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    async with sync_write() as updated_seq:
+        await db.invoices.bulk_write([
+            UpdateOne(
+                {"id": match["invoice_id"], "status": {"$ne": "paid"}},
+                {"$set": {
+                    "status": "paid",
+                    "paid_at": match["booking_date"] or now,
+                    "payment_reference": match["reference"],
+                    "updated_seq": updated_seq
+                }}
+            )
+            for match in matched
+        ], ordered=False)
+    await db.payments.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "invoice_id": match["invoice_id"],
+            "invoice_number": match["invoice_number"],
+            "amount": match["amount"],
+            "booking_date": match["booking_date"],
+            "reference": match["reference"],
+            "source": f"{statement_format}:{filename}",
+            "created_at": now
+        }
+        for match in matched
+    ])
+
+# Batch invoice email dispatch
+SEND_CLAIM_TIMEOUT_MINUTES = 60
+
+def build_draft_query(request: InvoiceBatchSendRequest) -> dict:
+    query = {"status": "draft"}
+    if request.invoice_ids:
+        query["id"] = {"$in": request.invoice_ids}
+    if request.customer_id:
+        query["customer_id"] = request.customer_id
+    date_range = {}
+    if request.invoice_date_from:
+        date_range["$gte"] = datetime.fromisoformat(request.invoice_date_from).isoformat()
+    if request.invoice_date_to:
+        date_range["$lte"] = datetime.fromisoformat(request.invoice_date_to).isoformat()
+    if date_range:
+        query["invoice_date"] = date_range
+    return query
+
+async def claim_drafts_for_job(job_id: str, request: InvoiceBatchSendRequest) -> List[str]:
+    """Mark matching drafts as owned by this job so overlapping batches skip them"""
+    now = datetime.now(timezone.utc)
+    stale_claim = (now - timedelta(minutes=SEND_CLAIM_TIMEOUT_MINUTES)).isoformat()
+    query = build_draft_query(request)
+    query["$or"] = [
+        {"send_job_id": {"$exists": False}},
+        {"send_job_id": None},
+        {"send_claimed_at": {"$lt": stale_claim}}
+    ]
+    candidates = await db.invoices.find(query, {"_id": 0, "id": 1}).sort(
+        "invoice_date", 1
+    ).to_list(length=request.limit)
+    if not candidates:
+        return []
+    
+    query["id"] = {"$in": [candidate["id"] for candidate in candidates]}
+    await db.invoices.update_many(
+        query,
+        {"$set": {"send_job_id": job_id, "send_claimed_at": now.isoformat()}}
+    )
+    claimed = await db.invoices.find({"send_job_id": job_id}, {"_id": 0, "id": 1}).to_list(length=None)
+    return [invoice["id"] for invoice in claimed]
+
+async def run_invoice_send_batch(job_id: str, invoice_ids: List[str]):
+    """Render and mail claimed drafts; SMTP throughput is bounded by smtp_rate_limiter"""
+    try:
+        await start_job(job_id, total=len(invoice_ids))
+        company = await get_company_data()
+        invoices = await db.invoices.find({"id": {"$in": invoice_ids}}).to_list(length=None)
+        customer_ids = list({invoice["customer_id"] for invoice in invoices})
+        customers = {
+            customer["id"]: customer
+            for customer in await db.customers.find({"id": {"$in": customer_ids}}).to_list(length=None)
+        }
+        semaphore = asyncio.Semaphore(EMAIL_BATCH_CONCURRENCY)
+        
+        async def send_one(invoice: dict):
+            async with semaphore:
+                customer = customers.get(invoice["customer_id"])
+                success = False
+                if customer:
+                    success = await email_service.send_invoice_email(invoice, customer, company)
+                
+                if success:
+                    async with sync_write() as updated_seq:
+                        await db.invoices.update_one(
+                            {"id": invoice["id"]},
+                            {
+                                "$set": {
+                                    "status": "sent",
+                                    "email_sent_at": datetime.now(timezone.utc).isoformat(),
+                                    "updated_seq": updated_seq
+                                },
+                                "$unset": {"send_job_id": "", "send_claimed_at": ""}
+                            }
+                        )
+                    await record_job_progress(job_id, succeeded=1)
+                else:
+                    await db.invoices.update_one(
+                        {"id": invoice["id"]},
+                        {"$unset": {"send_job_id": "", "send_claimed_at": ""}}
+                    )
+                    if not customer:
+                        reason = "customer not found"
+                    elif await run_in_threadpool(mail_spool.contains, f"invoice-{invoice['id']}"):
+                        reason = "queued in mail spool, SMTP unavailable"
+                    else:
+                        reason = "email send failed"
+                    await record_job_progress(job_id, failed=1, error=f"{invoice['invoice_number']}: {reason}")
+        
+        await asyncio.gather(*(send_one(invoice) for invoice in invoices))
+        await finish_job(job_id)
+        logger.info(f"Batch send job {job_id} finished for {len(invoices)} invoices")
+    
+    except Exception as e:
+        logger.error(f"Error in run_invoice_send_batch: {str(e)}")
+        await db.invoices.update_many(
+            {"send_job_id": job_id},
+            {"$unset": {"send_job_id": "", "send_claimed_at": ""}}
+        )
+        await finish_job(job_id, status="failed")
+
+# Recurring invoices
+# Due definitions are materialized in one pass: customers are prefetched with a
+# single query, invoice numbers are reserved as one range and the invoices are
+# written with insert_many. A unique (recurring_invoice_id, recurring_period)
+# index lets a rerun after a crash skip periods that were already billed.
+RECURRING_INVOICE_CHECK_INTERVAL_SECONDS = int(os.environ.get('RECURRING_INVOICE_CHECK_INTERVAL_SECONDS', 3600))
+RECURRING_BATCH_LIMIT = int(os.environ.get('RECURRING_BATCH_LIMIT', 1000))
+RECURRING_MAX_CATCH_UP_PERIODS = int(os.environ.get('RECURRING_MAX_CATCH_UP_PERIODS', 12))
+RECURRING_CLAIM_TIMEOUT_MINUTES = 30
+INTERVAL_MONTHS = {"monthly": 1, "quarterly": 3, "yearly": 12}
+
+def next_billing_date(current: datetime, interval: str, billing_day: int) -> datetime:
+    if interval == "weekly":
+        return current + timedelta(weeks=1)
+    month_index = current.month - 1 + INTERVAL_MONTHS[interval]
+    year = current.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(billing_day, calendar.monthrange(year, month)[1])
+    return current.replace(year=year, month=month, day=day)
+
+def parse_billing_date(value: str) -> datetime:
+    """Recurring dates are compared as ISO strings, so they are kept naive"""
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+def parse_billing_date_param(value: str, name: str) -> datetime:
+    try:
+        return parse_billing_date(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}, expected an ISO date")
+
+def calculate_recurring_totals(items_data: List[InvoiceItemCreate], apply_tax: bool, tax_rate: float) -> dict:
+    items = [
+        InvoiceItem(**item_data.dict(), total_price=item_data.quantity * item_data.unit_price)
+        for item_data in items_data
+    ]
+    subtotal = sum(item.total_price for item in items)
+    tax_amount = subtotal * tax_rate / 100 if apply_tax else 0  # Conditional VAT
+    return {
+        "items": items,
+        "subtotal": subtotal,
+        "tax_amount": tax_amount,
+        "total_amount": subtotal + tax_amount
+    }
+
+def build_recurring_invoice(definition: dict, customer: dict, period: datetime, invoice_number: str,
+                            updated_seq: int, send_job_id: Optional[str]) -> dict:
+    now = datetime.now(timezone.utc)
+    invoice = {
+        "id": str(uuid.uuid4()),
+        "invoice_number": invoice_number,
+        "customer_id": customer["id"],
+        "customer_name": customer["name"],
+        "items": definition["items"],
+        "subtotal": definition["subtotal"],
+        "tax_rate": definition.get("tax_rate", 19.0),
+        "tax_amount": definition["tax_amount"],
+        "total_amount": definition["total_amount"],
+        "invoice_date": period.isoformat(),
+        "due_date": (period + timedelta(days=definition.get("payment_terms_days", 14))).isoformat(),
+        "status": "draft",
+        "notes": definition.get("notes"),
+        "apply_tax": definition.get("apply_tax", True),
+        "created_at": now.isoformat(),
+        "recurring_invoice_id": definition["id"],
+        "recurring_period": period.isoformat(),
+        "updated_seq": updated_seq
+    }
+    if send_job_id:
+        # Claimed for the send job up front so a parallel send-batch skips it
+        invoice["send_job_id"] = send_job_id
+        invoice["send_claimed_at"] = now.isoformat()
+    return invoice
+
+def due_recurring_query(as_of: datetime) -> dict:
+    stale_claim = (datetime.now(timezone.utc) - timedelta(minutes=RECURRING_CLAIM_TIMEOUT_MINUTES)).isoformat()
+    return {
+        "active": True,
+        "next_run_date": {"$lte": as_of.isoformat()},
+        "$or": [{"run_claim": None}, {"run_claimed_at": {"$lt": stale_claim}}]
+    }
+
+async def claim_due_recurring_invoices(claim: str, as_of: datetime) -> List[dict]:
+    query = due_recurring_query(as_of)
+    candidates = await db.recurring_invoices.find(query, {"_id": 0, "id": 1}).sort(
+        "next_run_date", 1
+    ).to_list(length=RECURRING_BATCH_LIMIT)
+    if not candidates:
+        return []
+    
+    query["id"] = {"$in": [candidate["id"] for candidate in candidates]}
+    await db.recurring_invoices.update_many(
+        query,
+        {"$set": {"run_claim": claim, "run_claimed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    return await db.recurring_invoices.find({"run_claim": claim}).to_list(length=None)
+
+async def insert_new_invoices(invoices: List[dict]) -> List[dict]:
+    """insert_many that skips periods billed by an earlier, interrupted run"""
+    try:
+        await db.invoices.insert_many(invoices, ordered=False)
+        return invoices
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in write_errors):
+            raise
+        duplicates = {error["index"] for error in write_errors}
+        return [invoice for index, invoice in enumerate(invoices) if index not in duplicates]
+
+async def run_recurring_invoice_job(job_id: str, as_of: Optional[datetime] = None):
+    """Generate all due recurring invoices, then mail them as one send batch"""
+    try:
+        as_of = as_of or datetime.now(timezone.utc).replace(tzinfo=None)
+        definitions = await claim_due_recurring_invoices(job_id, as_of)
+        await start_job(job_id, total=len(definitions))
+        
+        customer_ids = list({definition["customer_id"] for definition in definitions})
+        customers = {
+            customer["id"]: customer
+            for customer in await db.customers.find({"id": {"$in": customer_ids}}).to_list(length=None)
+        }
+        
+        planned = []
+        next_runs = {}
+        orphaned = []
+        for definition in definitions:
+            customer = customers.get(definition["customer_id"])
+            if not customer:
+                orphaned.append(definition["id"])
+                continue
+            # Catch up on periods missed while the scheduler was down
+            period = parse_billing_date(definition["next_run_date"])
+            periods = 0
+            while period <= as_of and periods < RECURRING_MAX_CATCH_UP_PERIODS:
+                planned.append((definition, customer, period))
+                period = next_billing_date(period, definition["interval"], definition["billing_day"])
+                periods += 1
+            next_runs[definition["id"]] = period
+        
+        if planned:
+            # A run that crashed after inserting but before advancing next_run_date
+            # leaves billed periods behind; drop them before reserving numbers
+            billed = await db.invoices.find(
+                {
+                    "recurring_invoice_id": {"$in": list(next_runs)},
+                    "recurring_period": {"$in": list({period.isoformat() for _, _, period in planned})}
+                },
+                {"_id": 0, "recurring_invoice_id": 1, "recurring_period": 1}
+            ).to_list(length=None)
+            billed = {(invoice["recurring_invoice_id"], invoice["recurring_period"]) for invoice in billed}
+            planned = [
+                (definition, customer, period) for definition, customer, period in planned
+                if (definition["id"], period.isoformat()) not in billed
+            ]
+        
+        send_job = None
+        if SMTP_USERNAME and SMTP_PASSWORD and any(definition.get("send_email", True) for definition, _, _ in planned):
+            send_job = await create_job("invoice-send-batch")
+        
+        created = []
+        if planned:
+            first_number = await reserve_document_numbers("invoice", len(planned))
+            async with sync_write() as updated_seq:
+                invoices = [
+                    build_recurring_invoice(
+                        definition, customer, period,
+                        format_document_number("INV", first_number + offset), updated_seq,
+                        send_job.id if send_job and definition.get("send_email", True) else None
+                    )
+                    for offset, (definition, customer, period) in enumerate(planned)
+                ]
+                created = await insert_new_invoices(invoices)
+        
+        created_by_definition = defaultdict(list)
+        for invoice in created:
+            created_by_definition[invoice["recurring_invoice_id"]].append(invoice)
+        now = datetime.now(timezone.utc).isoformat()
+        schedule_updates = []
+        for definition_id, next_run in next_runs.items():
+            update = {
+                "$set": {"next_run_date": next_run.isoformat(), "last_run_at": now},
+                "$unset": {"run_claim": "", "run_claimed_at": ""}
+            }
+            definition_invoices = created_by_definition.get(definition_id)
+            if definition_invoices:
+                update["$set"]["last_invoice_id"] = definition_invoices[-1]["id"]
+                update["$inc"] = {"generated_count": len(definition_invoices)}
+            schedule_updates.append(UpdateOne({"id": definition_id, "run_claim": job_id}, update))
+        if schedule_updates:
+            await db.recurring_invoices.bulk_write(schedule_updates, ordered=False)
+        
+        if orphaned:
+            await db.recurring_invoices.update_many(
+                {"id": {"$in": orphaned}, "run_claim": job_id},
+                {"$unset": {"run_claim": "", "run_claimed_at": ""}}
+            )
+            for definition_id in orphaned:
+                await record_job_progress(job_id, failed=1, error=f"{definition_id}: customer not found")
+        await record_job_progress(job_id, succeeded=len(next_runs))
+        
+        mail_ids = [invoice["id"] for invoice in created if invoice.get("send_job_id")]
+        await finish_job(job_id, result={
+            "invoices_created": len(created),
+            "invoice_numbers": [invoice["invoice_number"] for invoice in created[:100]],
+            "send_job_id": send_job.id if mail_ids else None
+        })
+        logger.info(f"Recurring invoice job {job_id}: {len(created)} invoices from {len(next_runs)} definitions")
+        
+        if send_job:
+            if mail_ids:
+                await run_invoice_send_batch(send_job.id, mail_ids)
+            else:
+                await finish_job(send_job.id)
+    
+    except Exception as e:
+        logger.error(f"Error in run_recurring_invoice_job: {str(e)}")
+        await db.recurring_invoices.update_many(
+            {"run_claim": job_id},
+            {"$unset": {"run_claim": "", "run_claimed_at": ""}}
+        )
+        await finish_job(job_id, status="failed")
+
+async def recurring_invoices_task():
+    """Scheduled entry point; only creates a job record when something is due"""
+    as_of = datetime.now(timezone.utc).replace(tzinfo=None)
+    if not await db.recurring_invoices.count_documents(due_recurring_query(as_of), limit=1):
+        return
+    job = await create_job("recurring-invoices")
+    await run_recurring_invoice_job(job.id, as_of)
+
+register_scheduled_job("recurring-invoices", RECURRING_INVOICE_CHECK_INTERVAL_SECONDS, recurring_invoices_task)
+
+# Dunning (Mahnwesen)
+# Sent, unpaid invoices escalate one reminder level per run once they are
+# overdue long enough for their next level. Candidates come from the
+# (status, due_date) index; each level's threshold is part of the query, so a
+# run only touches invoices that actually get a reminder.
+DEFAULT_DUNNING_LEVELS = [
+    {"title": "Zahlungserinnerung", "days_overdue": 7, "fee": 0.0},
+    {"title": "1. Mahnung", "days_overdue": 21, "fee": 5.0},
+    {"title": "2. Mahnung", "days_overdue": 35, "fee": 10.0}
+]
+DUNNING_LEVELS = json.loads(os.environ['DUNNING_LEVELS']) if os.environ.get('DUNNING_LEVELS') else DEFAULT_DUNNING_LEVELS
+DUNNING_INTERVAL_SECONDS = int(os.environ.get('DUNNING_INTERVAL_SECONDS', 24 * 3600))
+DUNNING_MIN_DAYS_BETWEEN = int(os.environ.get('DUNNING_MIN_DAYS_BETWEEN', 7))
+DUNNING_PAYMENT_DAYS = int(os.environ.get('DUNNING_PAYMENT_DAYS', 7))
+DUNNING_BATCH_SIZE = int(os.environ.get('DUNNING_BATCH_SIZE', 200))
+DUNNING_CLAIM_TIMEOUT_MINUTES = 60
+
+def dunning_candidate_query(as_of: datetime) -> dict:
+    """Invoices due for their next reminder level as of `as_of` (naive, like due_date)"""
+    now = datetime.now(timezone.utc)
+    level_clauses = [
+        {
+            "dunning_level": {"$in": [0, None]} if index == 0 else index,
+            "due_date": {"$lt": (as_of - timedelta(days=level["days_overdue"])).isoformat()}
+        }
+        for index, level in enumerate(DUNNING_LEVELS)
+    ]
+    return {
+        "status": "sent",
+        "due_date": {"$lt": (as_of - timedelta(days=DUNNING_LEVELS[0]["days_overdue"])).isoformat()},
+        "$and": [
+            {"$or": level_clauses},
+            {"$or": [
+                {"last_dunning_at": None},
+                {"last_dunning_at": {"$lt": (now - timedelta(days=DUNNING_MIN_DAYS_BETWEEN)).isoformat()}}
+            ]},
+            {"$or": [
+                {"dunning_job_id": None},
+                {"dunning_claimed_at": {"$lt": (now - timedelta(minutes=DUNNING_CLAIM_TIMEOUT_MINUTES)).isoformat()}}
+            ]}
+        ]
+    }
+
+def build_dunning_notice(invoice: dict, as_of: datetime) -> dict:
+    level_index = invoice.get("dunning_level") or 0
+    level = DUNNING_LEVELS[level_index]
+    total_fees = round((invoice.get("dunning_fees") or 0.0) + level["fee"], 2)
+    return {
+        "level": level_index + 1,
+        "title": level["title"],
+        "fee": level["fee"],
+        "total_fees": total_fees,
+        "open_amount": round(invoice["total_amount"] + total_fees, 2),
+        "payment_deadline": as_of + timedelta(days=DUNNING_PAYMENT_DAYS)
+    }
+
+async def claim_dunning_batch(job_id: str, as_of: datetime) -> List[dict]:
+    query = dunning_candidate_query(as_of)
+    candidates = await db.invoices.find(query, {"_id": 0, "id": 1}).sort(
+        "due_date", 1
+    ).to_list(length=DUNNING_BATCH_SIZE)
+    if not candidates:
+        return []
+    
+    candidate_ids = [candidate["id"] for candidate in candidates]
+    query["id"] = {"$in": candidate_ids}
+    await db.invoices.update_many(
+        query,
+        {"$set": {"dunning_job_id": job_id, "dunning_claimed_at": datetime.now(timezone.utc).isoformat()}}
+    )
+    return await db.invoices.find({"id": {"$in": candidate_ids}, "dunning_job_id": job_id}).to_list(length=None)
+
+async def send_dunning_batch(job_id: str, invoices: List[dict], company: dict, as_of: datetime):
+    """Send one batch of reminders and record the reached levels in bulk.
+    
+    Returns the notice sent per invoice, None where sending failed.
+    """
+    customer_ids = list({invoice["customer_id"] for invoice in invoices})
+    customers = {
+        customer["id"]: customer
+        for customer in await db.customers.find({"id": {"$in": customer_ids}}).to_list(length=None)
+    }
+    semaphore = asyncio.Semaphore(EMAIL_BATCH_CONCURRENCY)
+    
+    async def send_one(invoice: dict):
+        async with semaphore:
+            customer = customers.get(invoice["customer_id"])
+            notice = build_dunning_notice(invoice, as_of)
+            if customer and await email_service.send_dunning_email(invoice, customer, company, notice):
+                return notice
+            return None
+    
+    notices = await asyncio.gather(*(send_one(invoice) for invoice in invoices))
+    
+    now = datetime.now(timezone.utc).isoformat()
+    async with sync_write() as updated_seq:
+        updates = []
+        history = []
+        for invoice, notice in zip(invoices, notices):
+            if not notice:
+                # Stays claimed until the run ends so later batches skip it
+                continue
+            updates.append(UpdateOne(
+                {"id": invoice["id"], "dunning_job_id": job_id},
+                {
+                    "$set": {
+                        "dunning_level": notice["level"],
+                        "dunning_fees": notice["total_fees"],
+                        "last_dunning_at": now,
+                        "updated_seq": updated_seq
+                    },
+                    "$unset": {"dunning_job_id": "", "dunning_claimed_at": ""}
+                }
+            ))
+            history.append({
+                "id": str(uuid.uuid4()),
+                "invoice_id": invoice["id"],
+                "invoice_number": invoice["invoice_number"],
+                "level": notice["level"],
+                "title": notice["title"],
+                "fee": notice["fee"],
+                "open_amount": notice["open_amount"],
+                "payment_deadline": notice["payment_deadline"].isoformat(),
+                "job_id": job_id,
+                "sent_at": now
+            })
+        
+        if updates:
+            await db.invoices.bulk_write(updates, ordered=False)
+            await db.dunning_notices.insert_many(history)
+    
+    await record_job_progress(job_id, succeeded=len(history))
+    for invoice, notice in zip(invoices, notices):
+        if not notice:
+            await record_job_progress(job_id, failed=1, error=f"{invoice['invoice_number']}: reminder could not be sent")
+    return notices
+
+async def run_dunning_job(job_id: str, as_of: Optional[datetime] = None):
+    """Escalate all due invoices batch by batch; failed sends are retried next run"""
+    try:
+        as_of = as_of or datetime.now(timezone.utc).replace(tzinfo=None)
+        await start_job(job_id, total=await db.invoices.count_documents(dunning_candidate_query(as_of)))
+        company = await get_company_data()
+        sent_by_level = defaultdict(int)
+        
+        while True:
+            invoices = await claim_dunning_batch(job_id, as_of)
+            if not invoices:
+                break
+            notices = await send_dunning_batch(job_id, invoices, company, as_of)
+            for notice in notices:
+                if notice:
+                    sent_by_level[str(notice["level"])] += 1
+            if not any(notices):
+                # Nothing got through (SMTP down); leave the rest for the next run
+                break
+        
+        await db.invoices.update_many(
+            {"dunning_job_id": job_id},
+            {"$unset": {"dunning_job_id": "", "dunning_claimed_at": ""}}
+        )
+        await finish_job(job_id, result={"sent_by_level": dict(sent_by_level)})
+        logger.info(f"Dunning job {job_id} sent {sum(sent_by_level.values())} reminders")
+    
+    except Exception as e:
+        logger.error(f"Error in run_dunning_job: {str(e)}")
+        await db.invoices.update_many(
+            {"dunning_job_id": job_id},
+            {"$unset": {"dunning_job_id": "", "dunning_claimed_at": ""}}
+        )
+        await finish_job(job_id, status="failed")
+
+async def dunning_task():
+    """Scheduled entry point; skipped while email is not configured"""
+    if not SMTP_USERNAME or not SMTP_PASSWORD:
+        return
+    as_of = datetime.now(timezone.utc).replace(tzinfo=None)
+    if not await db.invoices.count_documents(dunning_candidate_query(as_of), limit=1):
+        return
+    job = await create_job("dunning-run")
+    await run_dunning_job(job.id, as_of)
+
+register_scheduled_job("dunning", DUNNING_INTERVAL_SECONDS, dunning_task)
+
+# Archival
+# Paid invoices and closed quotes older than ARCHIVE_AFTER_DAYS move to
+# invoices_archive / quotes_archive, keeping the hot collections (and their
+# indexes) at the working set. The archive is kept for the 10-year retention
+# period. Lists read it only with ?include_archived=true; lookups by id,
+# e-invoices, statements and the reports always include it. Revenue of archived
+# invoices is folded into archive_rollups so dashboard totals stay complete.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get('ARCHIVE_INTERVAL_SECONDS', 24 * 3600))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+ARCHIVED_COLLECTIONS = ["invoices", "quotes"]
+
+def archive_query(collection: str, cutoff: str) -> dict:
+    if collection == "invoices":
+        return {
+            "status": "paid",
+            "$or": [
+                {"paid_at": {"$lt": cutoff}},
+                {"paid_at": None, "invoice_date": {"$lt": cutoff}}
+            ]
+        }
+    return {"status": {"$in": ["converted", "rejected"]}, "quote_date": {"$lt": cutoff}}
+
+def revenue_month(invoice_date: str) -> tuple:
+    """(year, month) as the dashboard's $dateFromString grouping sees it"""
+    value = datetime.fromisoformat(invoice_date)
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc)
+    return value.year, value.month
+
+def archive_rollup_updates(collection: str, documents: List[dict]) -> list:
+    if collection == "quotes":
+        return [UpdateOne({"_id": "totals"}, {"$inc": {"quote_count": len(documents)}}, upsert=True)]
+    
+    customers = {}
+    months = defaultdict(float)
+    revenue = 0.0
+    for invoice in documents:
+        amount = invoice.get("total_amount", 0)
+        revenue += amount
+        customer = customers.setdefault(invoice["customer_id"], {
+            "name": invoice["customer_name"], "revenue": 0.0, "invoice_count": 0
+        })
+        customer["revenue"] += amount
+        customer["invoice_count"] += 1
+        months[revenue_month(invoice["invoice_date"])] += amount
+    
+    updates = [UpdateOne(
+        {"_id": "totals"},
+        {"$inc": {"invoice_count": len(documents), "revenue": revenue}},
+        upsert=True
+    )]
+    updates.extend(
+        UpdateOne(
+            {"_id": f"customer:{customer_id}"},
+            {
+                "$set": {"kind": "customer", "customer_id": customer_id, "customer_name": customer["name"]},
+                "$inc": {"revenue": customer["revenue"], "invoice_count": customer["invoice_count"]}
+            },
+            upsert=True
+        )
+        for customer_id, customer in customers.items()
+    )
+    updates.extend(
+        UpdateOne(
+            {"_id": f"month:{year}-{month:02d}"},
+            {"$set": {"kind": "month", "year": year, "month": month}, "$inc": {"revenue": amount}},
+            upsert=True
+        )
+        for (year, month), amount in months.items()
+    )
+    return updates
+
+async def archive_batch(collection: str, documents: List[dict], updated_seq: int, session=None) -> List[dict]:
+    """Copy documents to the archive, drop them from the hot collection, leave
+    sync tombstones and update the rollups; returns the documents that were moved"""
+    archive = db[f"{collection}_archive"]
+    archived_at = datetime.now(timezone.utc).isoformat()
+    for document in documents:
+        document.pop("_id", None)
+        document["archived_at"] = archived_at
+    # Upserts keep a rerun after an interrupted batch free of duplicate key errors
+    await archive.bulk_write([
+        ReplaceOne({"id": document["id"]}, document, upsert=True)
+        for document in documents
+    ], ordered=False, session=session)
+    
+    # A document written since it was read keeps its hot copy
+    await db[collection].bulk_write([
+        DeleteOne({"id": document["id"], "updated_seq": document.get("updated_seq")})
+        for document in documents
+    ], ordered=False, session=session)
+    ids = [document["id"] for document in documents]
+    kept = {
+        document["id"]
+        for document in await db[collection].find(
+            {"id": {"$in": ids}}, {"_id": 0, "id": 1}, session=session
+        ).to_list(length=None)
+    }
+    if kept:
+        await archive.delete_many({"id": {"$in": list(kept)}}, session=session)
+    
+    moved = [document for document in documents if document["id"] not in kept]
+    if moved:
+        await db.archive_rollups.bulk_write(archive_rollup_updates(collection, moved), session=session)
+        # Synced clients drop archived documents like deleted ones
+        await db.sync_tombstones.insert_many([
+            {
+                "collection": collection,
+                "id": document["id"],
+                "updated_seq": updated_seq,
+                "deleted_at": datetime.fromisoformat(archived_at),
+                "reason": "archived"
+            }
+            for document in moved
+        ], session=session)
+    return moved
+
+async def archive_documents(collection: str, documents: List[dict]) -> List[dict]:
+    async with sync_write() as updated_seq:
+        if mongo_features["transactions"]:
+            async with await client.start_session() as session:
+                async def run_in_transaction(session):
+                    return await archive_batch(collection, documents, updated_seq, session)
+                return await session.with_transaction(run_in_transaction)
+        # Standalone servers: the archive copy is written first, so an interruption
+        # can at worst leave a document in both collections until the next run
+        return await archive_batch(collection, documents, updated_seq)
+
+async def run_archive_job(job_id: str, as_of: Optional[datetime] = None):
+    try:
+        as_of = as_of or datetime.now(timezone.utc)
+        cutoff = (as_of - timedelta(days=ARCHIVE_AFTER_DAYS)).date().isoformat()
+        await start_job(job_id)
+        archived = {}
+        for collection in ARCHIVED_COLLECTIONS:
+            archived[collection] = 0
+            while True:
+                documents = await db[collection].find(
+                    archive_query(collection, cutoff)
+                ).to_list(length=ARCHIVE_BATCH_SIZE)
+                if not documents:
+                    break
+                moved = await archive_documents(collection, documents)
+                archived[collection] += len(moved)
+                await record_job_progress(job_id, succeeded=len(moved))
+                if not moved or len(documents) < ARCHIVE_BATCH_SIZE:
+                    break
+        
+        if any(archived.values()):
+            dashboard_hub.notify()
+        await finish_job(job_id, result={"cutoff": cutoff, "archived": archived})
+        logger.info(f"Archive job {job_id}: {archived['invoices']} invoices, {archived['quotes']} quotes before {cutoff}")
+    
+    except Exception as e:
+        logger.error(f"Error in run_archive_job: {str(e)}")
+        await finish_job(job_id, status="failed")
+
+async def archive_task():
+    """Scheduled entry point; only creates a job record when something is due"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=ARCHIVE_AFTER_DAYS)).date().isoformat()
+    for collection in ARCHIVED_COLLECTIONS:
+        if await db[collection].count_documents(archive_query(collection, cutoff), limit=1):
+            job = await create_job("archive-run")
+            await run_archive_job(job.id)
+            return
+
+register_scheduled_job("archival", ARCHIVE_INTERVAL_SECONDS, archive_task)
+
+async def find_documents(collection: str, pipeline: list, include_archived: bool = False) -> List[dict]:
+    """Run a list pipeline (sorted by created_at) on the hot collection and,
+    if asked, on its archive"""
+    documents = await db[collection].aggregate(pipeline).to_list(length=None)
+    if include_archived:
+        documents += await db[f"{collection}_archive"].aggregate(pipeline).to_list(length=None)
+        documents.sort(key=lambda document: document.get("created_at") or "", reverse=True)
+    return documents
+
+async def find_document(collection: str, doc_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+    """Look a document up by id, falling back to the archive"""
+    document = await db[collection].find_one({"id": doc_id}, projection)
+    if document is None:
+        document = await db[f"{collection}_archive"].find_one({"id": doc_id}, projection)
+    return document
+
+async def find_documents_by_ids(collection: str, doc_ids: List[str], projection: Optional[dict] = None) -> List[dict]:
+    """Documents with the given ids from the hot collection and its archive"""
+    documents = await db[collection].find({"id": {"$in": doc_ids}}, projection).to_list(length=None)
+    missing = set(doc_ids) - {document["id"] for document in documents}
+    if missing:
+        documents += await db[f"{collection}_archive"].find(
+            {"id": {"$in": list(missing)}}, projection
+        ).to_list(length=None)
+    return documents
+
+async def get_archive_rollups(kind: str) -> List[dict]:
+    return await db.archive_rollups.find({"kind": kind}, {"_id": 0}).to_list(length=None)
+
+# Customer statements (Kontoauszug)
+# A statement lists a customer's issued invoices (debit) and payments (credit)
+# with a running balance, starting from the balance carried over from before
+# the period. Invoices come from one range query on (customer_id,
+# invoice_date) against the hot and the archive collection. Payments come from
+# db.payments; invoices marked paid before payments were recorded count as
+# paid in full on paid_at.
+STATEMENT_DIR = ARTIFACT_DIR / "statements"
+STATEMENT_INVOICE_FIELDS = {"_id": 0, "id": 1, "invoice_number": 1, "invoice_date": 1, "due_date": 1,
+                            "total_amount": 1, "dunning_fees": 1, "status": 1, "paid_at": 1}
+STATEMENT_PAYMENT_FIELDS = {"_id": 0, "invoice_id": 1, "amount": 1, "booking_date": 1, "source": 1}
+
+def parse_statement_period(period_from: Optional[str], period_to: Optional[str]) -> tuple:
+    """(start, end) dates, defaulting to the current year up to today"""
+    today = datetime.now(timezone.utc).date()
+    try:
+        start = datetime.fromisoformat(period_from).date() if period_from else today.replace(month=1, day=1)
+        end = datetime.fromisoformat(period_to).date() if period_to else today
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be ISO dates")
+    if start > end:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    return start, end
+
+async def load_statement_entries(customer_id: str, end) -> tuple:
+    """Issued invoices up to `end` and the payments booked on them"""
+    end_exclusive = (end + timedelta(days=1)).isoformat()
+    query = {"customer_id": customer_id, "invoice_date": {"$lt": end_exclusive}, "status": {"$in": ["sent", "paid"]}}
+    invoices = await db.invoices.find(query, STATEMENT_INVOICE_FIELDS).to_list(length=None)
+    invoices += await db.invoices_archive.find(query, STATEMENT_INVOICE_FIELDS).to_list(length=None)
+    payments = []
+    if invoices:
+        payments = await db.payments.find(
+            {"invoice_id": {"$in": [invoice["id"] for invoice in invoices]}, "booking_date": {"$lt": end_exclusive}},
+            STATEMENT_PAYMENT_FIELDS
+        ).to_list(length=None)
+    return invoices, payments
+
+def build_statement(customer: dict, invoices: List[dict], payments: List[dict], start, end) -> dict:
+    invoice_numbers = {invoice["id"]: invoice["invoice_number"] for invoice in invoices}
+    paid_with_payment = {payment["invoice_id"] for payment in payments}
+    entries = []
+    for invoice in invoices:
+        amount = round(invoice["total_amount"] + (invoice.get("dunning_fees") or 0.0), 2)
+        due_date = datetime.fromisoformat(invoice["due_date"]).strftime("%d.%m.%Y")
+        entries.append({
+            "date": invoice["invoice_date"][:10],
+            "kind": "invoice",
+            "reference": invoice["invoice_number"],
+            "description": f"Rechnung, fällig {due_date}",
+            "debit": amount,
+            "credit": 0.0
+        })
+        if invoice["status"] == "paid" and invoice["id"] not in paid_with_payment:
+            entries.append({
+                "date": (invoice.get("paid_at") or invoice["invoice_date"])[:10],
+                "kind": "payment",
+                "reference": invoice["invoice_number"],
+                "description": "Zahlung",
+                "debit": 0.0,
+                "credit": amount
+            })
+    for payment in payments:
+        entries.append({
+            "date": str(payment["booking_date"])[:10],
+            "kind": "payment",
+            "reference": invoice_numbers[payment["invoice_id"]],
+            "description": "Zahlung" if payment.get("source") == "manual" else "Zahlungseingang Bank",
+            "debit": 0.0,
+            "credit": round(payment["amount"], 2)
+        })
+    # Invoices before payments on the same day, so the balance never dips below zero first
+    entries.sort(key=lambda entry: (entry["date"], entry["kind"] != "invoice", entry["reference"]))
+    
+    start_iso, end_iso = start.isoformat(), end.isoformat()
+    opening_balance = 0.0
+    period_entries = []
+    for entry in entries:
+        if entry["date"] < start_iso:
+            opening_balance += entry["debit"] - entry["credit"]
+        elif entry["date"] <= end_iso:
+            period_entries.append(entry)
+    
+    balance = round(opening_balance, 2)
+    for entry in period_entries:
+        balance = round(balance + entry["debit"] - entry["credit"], 2)
+        entry["balance"] = balance
+    return {
+        "customer": {name: customer.get(name) for name in ("id", "name", "email", "address", "postal_code", "city")},
+        "period_from": start_iso,
+        "period_to": end_iso,
+        "opening_balance": round(opening_balance, 2),
+        "entries": period_entries,
+        "total_debit": round(sum(entry["debit"] for entry in period_entries), 2),
+        "total_credit": round(sum(entry["credit"] for entry in period_entries), 2),
+        "closing_balance": balance
+    }
+
+async def compute_statement(customer: dict, start, end) -> dict:
+    invoices, payments = await load_statement_entries(customer["id"], end)
+    return build_statement(customer, invoices, payments, start, end)
+
+def statement_filename(statement: dict) -> str:
+    name = re.sub(r"[^A-Za-z0-9]+", "_", statement["customer"]["name"] or "").strip("_") or statement["customer"]["id"]
+    return f"Kontoauszug_{name}_{statement['period_from']}_{statement['period_to']}.pdf"
+
+def write_statement_pdf(statement: dict, company: dict, path: Path):
+    """Render a statement straight to a file (runs in the render pool)"""
+    buffer = render_statement_pdf(statement, company)
+    temp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    temp_path.write_bytes(buffer.getvalue())
+    temp_path.replace(path)
+
+def write_statement_archive(directory: Path, statements: List[dict]) -> Path:
+    """Bundle a batch into one zip; PDFs are compressed already, so they are stored as is"""
+    import zipfile
+    path = directory / "statements.zip"
+    temp_path = directory / f".statements.{uuid.uuid4().hex}.tmp"
+    with zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for statement in statements:
+            archive.write(directory / f"{statement['customer_id']}.pdf", statement["filename"])
+    temp_path.replace(path)
+    return path
+
+async def run_statement_batch(job_id: str, request: StatementBatchRequest):
+    """Render statements for many customers on the shared PDF render pool"""
+    try:
+        start, end = parse_statement_period(request.period_from, request.period_to)
+        query = {"id": {"$in": request.customer_ids}} if request.customer_ids else {}
+        customers = await db.customers.find(query, {"_id": 0}).sort("name", 1).to_list(length=None)
+        await start_job(job_id, total=len(customers))
+        company = await get_company_data()
+        directory = STATEMENT_DIR / job_id
+        await run_in_threadpool(directory.mkdir, parents=True, exist_ok=True)
+        semaphore = asyncio.Semaphore(PDF_RENDER_WORKERS * 2)
+        statements = []
+        skipped = 0
+        
+        async def render_one(customer: dict):
+            nonlocal skipped
+            async with semaphore:
+                try:
+                    statement = await compute_statement(customer, start, end)
+                    if not request.include_inactive and not statement["entries"] and not statement["closing_balance"]:
+                        skipped += 1
+                        await record_job_progress(job_id, succeeded=1)
+                        return
+                    await run_in_render_pool(
+                        write_statement_pdf, statement, company, directory / f"{customer['id']}.pdf"
+                    )
+                except Exception as e:
+                    await record_job_progress(job_id, failed=1, error=f"{customer['name']}: {str(e)}")
+                    return
+                statements.append({
+                    "customer_id": customer["id"],
+                    "customer_name": customer["name"],
+                    "closing_balance": statement["closing_balance"],
+                    "entries": len(statement["entries"]),
+                    "filename": statement_filename(statement),
+                    "url": f"/api/statements/batch/{job_id}/{customer['id']}"
+                })
+                await record_job_progress(job_id, succeeded=1)
+        
+        await asyncio.gather(*(render_one(customer) for customer in customers))
+        statements.sort(key=lambda statement: statement["customer_name"])
+        if statements:
+            await run_in_threadpool(write_statement_archive, directory, statements)
+        await finish_job(job_id, result={
+            "period_from": start.isoformat(),
+            "period_to": end.isoformat(),
+            "statements": statements,
+            "skipped_inactive": skipped,
+            "archive_url": f"/api/statements/batch/{job_id}/archive" if statements else None
+        })
+        logger.info(f"Statement batch {job_id}: {len(statements)} statements, {skipped} inactive customers skipped")
+    
+    except Exception as e:
+        logger.error(f"Error in run_statement_batch: {str(e)}")
+        await finish_job(job_id, status="failed")
+
+# Customer endpoints
+@api_router.post("/customers", response_model=Customer)
+async def create_customer(customer: CustomerCreate):
+    customer_dict = customer.dict()
+    async with sync_write() as updated_seq:
+        customer_obj = Customer(**customer_dict, updated_seq=updated_seq)
+        customer_data = prepare_for_mongo(customer_obj.dict())
+        await db.customers.insert_one(customer_data)
+    return customer_obj
+
+@api_router.get("/customers", response_model=List[Customer])
+async def get_customers():
+    customers = await db.customers.find().to_list(length=None)
+    return [Customer(**parse_from_mongo(customer)) for customer in customers]
+
+@api_router.get("/customers/{customer_id}", response_model=Customer)
+async def get_customer(customer_id: str):
+    customer = await db.customers.find_one({"id": customer_id})
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return Customer(**parse_from_mongo(customer))
+
+@api_router.put("/customers/{customer_id}", response_model=Customer)
+async def update_customer(
+    customer_id: str,
+    customer_update: CustomerCreate,
+    background_tasks: BackgroundTasks,
+    response: Response
+):
+    existing_customer = await db.customers.find_one({"id": customer_id})
+    if not existing_customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    update_data = customer_update.dict()
+    update_data["id"] = customer_id
+    update_data["created_at"] = existing_customer.get("created_at")
+    async with sync_write() as updated_seq:
+        update_data["updated_seq"] = updated_seq
+        customer_obj = Customer(**update_data)
+        customer_data = prepare_for_mongo(customer_obj.dict())
+        await db.customers.replace_one({"id": customer_id}, customer_data)
+    
+    # Fan the new name out to invoices, quotes and todos in the background
+    if existing_customer.get("name") != customer_obj.name:
+        job = await create_job("customer-name-propagation")
+        background_tasks.add_task(propagate_customer_name, job.id, customer_id, customer_obj.name)
+        response.headers["X-Job-Id"] = job.id
+    
+    return customer_obj
+
+@api_router.delete("/customers/{customer_id}")
+async def delete_customer(customer_id: str, background_tasks: BackgroundTasks):
+    customer = await db.customers.find_one_and_delete({"id": customer_id}, {"_id": 0})
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    await record_deletion("customers", customer_id)
+    
+    job = await create_job("customer-deletion-cleanup")
+    snapshot = {name: customer.get(name) for name in EINVOICE_CUSTOMER_FIELDS}
+    background_tasks.add_task(detach_deleted_customer, job.id, customer_id, snapshot)
+    return {"message": "Customer deleted successfully", "job_id": job.id}
+
+@api_router.get("/customers/{customer_id}/statement")
+async def get_customer_statement(
+    customer_id: str,
+    period_from: Optional[str] = Query(None, alias="from"),
+    period_to: Optional[str] = Query(None, alias="to"),
+    statement_format: Literal["pdf", "json"] = Query("pdf", alias="format")
+):
+    """Account statement with running balance, the current year by default"""
+    customer = await db.customers.find_one({"id": customer_id}, {"_id": 0})
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    start, end = parse_statement_period(period_from, period_to)
+    
+    statement = await compute_statement(customer, start, end)
+    if statement_format == "json":
+        return statement
+    company = await get_company_data()
+    buffer = await run_in_render_pool(render_statement_pdf, statement, company)
+    return Response(
+        content=buffer.getvalue(),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename={statement_filename(statement)}"}
+    )
+
+# Company Data endpoints
+@api_router.post("/company", response_model=CompanyData)
+async def create_or_update_company(company: CompanyDataCreate):
+    # Check if company data exists
+    existing_company = await db.company_data.find_one({})
+    
+    company_dict = company.dict()
+    
+    if existing_company:
+        # Update existing, the logo is managed by /company/logo
+        logo_fields = {name: existing_company.get(name) for name in ("logo_url", "logo_hash", "logo_variants")}
+        company_obj = CompanyData(**{**company_dict, **logo_fields, "id": existing_company["id"]})
+        company_data = prepare_for_mongo(company_obj.dict())
+        await db.company_data.replace_one({"id": existing_company["id"]}, company_data)
+    else:
+        # Create new
+        company_obj = CompanyData(**company_dict)
+        company_data = prepare_for_mongo(company_obj.dict())
+        await db.company_data.insert_one(company_data)
+    
+    return company_obj
+
+@api_router.get("/company", response_model=Optional[CompanyData])
+async def get_company():
+    company = await db.company_data.find_one({})
+    if not company:
+        return None
+    return CompanyData(**parse_from_mongo(company))
+
+@api_router.post("/company/logo", response_model=CompanyData)
+async def upload_company_logo(file: UploadFile = File(...)):
+    """Store a logo (PNG, JPEG, GIF or WebP) and build its resized variants"""
+    company = await db.company_data.find_one({})
+    if not company:
+        raise HTTPException(status_code=404, detail="Company data not found")
+    
+    await file.seek(0)
+    stored = await run_in_threadpool(store_logo_upload, file.file)
+    if stored is None:
+        raise HTTPException(status_code=413, detail=f"Logo exceeds {LOGO_MAX_BYTES // (1024 * 1024)} MB")
+    temp_path, logo_hash = stored
+    
+    try:
+        if not (logo_dir / logo_hash).exists():
+            await run_in_render_pool(build_logo_variants, temp_path, logo_dir / logo_hash)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid logo image: {str(e)}")
+    finally:
+        temp_path.unlink(missing_ok=True)
+    
+    variants = logo_variant_urls(logo_hash)
+    company = await db.company_data.find_one_and_update(
+        {"id": company["id"]},
+        {"$set": {
+            "logo_url": variants["email"],
+            "logo_hash": logo_hash,
+            "logo_variants": variants,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+    logger.info(f"Company logo {logo_hash} uploaded ({file.filename})")
+    return CompanyData(**parse_from_mongo(company))
+
+@api_router.delete("/company/logo")
+async def delete_company_logo():
+    result = await db.company_data.update_one(
+        {},
+        {"$set": {"logo_url": None, "logo_hash": None, "logo_variants": {}}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Company data not found")
+    return {"message": "Logo removed"}
+
+# Invoice endpoints
+@api_router.post("/invoices", response_model=Invoice)
+async def create_invoice(
+    invoice_data: InvoiceCreate,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await run_idempotent(
+        idempotency_key,
+        "create-invoice",
+        invoice_data.dict(),
+        lambda: insert_invoice(invoice_data, background_tasks)
+    )
+
+async def insert_invoice(invoice_data: InvoiceCreate, background_tasks: BackgroundTasks) -> Invoice:
+    # Get customer info
+    customer = await db.customers.find_one({"id": invoice_data.customer_id})
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    # Generate invoice number
+    invoice_number = format_document_number("INV", await reserve_document_numbers("invoice"))
+    
+    # Calculate totals
+    items = []
+    subtotal = 0
+    
+    for item_data in invoice_data.items:
+        total_price = item_data.quantity * item_data.unit_price
+        item = InvoiceItem(
+            **item_data.dict(),
+            total_price=total_price
+        )
+        items.append(item)
+        subtotal += total_price
+    
+    tax_amount = subtotal * 0.19 if invoice_data.apply_tax else 0  # Conditional VAT
+    total_amount = subtotal + tax_amount
+    
+    # Parse dates
+    invoice_date = datetime.fromisoformat(invoice_data.invoice_date)
+    due_date = datetime.fromisoformat(invoice_data.due_date)
+    
+    async with sync_write() as updated_seq:
+        invoice = Invoice(
+            invoice_number=invoice_number,
+            customer_id=invoice_data.customer_id,
+            customer_name=customer["name"],
+            items=items,
+            subtotal=subtotal,
+            tax_amount=tax_amount,
+            total_amount=total_amount,
+            invoice_date=invoice_date,
+            due_date=due_date,
+            notes=invoice_data.notes,
+            apply_tax=invoice_data.apply_tax,
+            status="draft",  # Start as draft, will be updated to "sent" after email
+            updated_seq=updated_seq
+        )
+    
+        invoice_data_dict = prepare_for_mongo(invoice.dict())
+        await db.invoices.insert_one(invoice_data_dict)
+    
+    # Add background task for email sending
+    if SMTP_USERNAME and SMTP_PASSWORD:
+        background_tasks.add_task(send_invoice_email_task, invoice.id)
+        logger.info(f"Invoice {invoice_number} created, email task scheduled")
+    else:
+        logger.warning(f"Invoice {invoice_number} created, but email not configured")
+    
+    return invoice
+
+@api_router.get("/invoices", response_model=Union[List[Invoice], List[InvoiceSummary]])
+async def get_invoices(view: Literal["full", "summary"] = "full", include_archived: bool = False):
+    if view == "summary":
+        pipeline = [
+            {"$sort": {"created_at": -1}},
+            {"$project": summary_projection(InvoiceSummary)}
+        ]
+        invoices = await find_documents("invoices", pipeline, include_archived)
+        return [InvoiceSummary(**parse_from_mongo(invoice)) for invoice in invoices]
+    
+    invoices = await find_documents("invoices", [{"$sort": {"created_at": -1}}], include_archived)
+    return [Invoice(**parse_from_mongo(invoice)) for invoice in invoices]
+
+@api_router.get("/invoices/{invoice_id}", response_model=Invoice)
+async def get_invoice(invoice_id: str):
+    invoice = await find_document("invoices", invoice_id)
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return Invoice(**parse_from_mongo(invoice))
+
+@api_router.put("/invoices/{invoice_id}/status")
+async def update_invoice_status(invoice_id: str, status_update: InvoiceStatusUpdate):
+    batch = await update_statuses(
+        "invoices", status_update.status, {"id": invoice_id}, [invoice_id], 1, status_update.paid_at
+    )
+    raise_for_status_outcome(batch["results"][0], "Invoice not found")
+    return {"message": "Status updated successfully"}
+
+@api_router.post("/invoices/status-batch")
+async def update_invoice_status_batch(batch_update: InvoiceStatusBatchUpdate):
+    """Change the status of many invoices at once, marking them paid records manual payments"""
+    return await update_statuses(
+        "invoices", batch_update.status, status_batch_query(batch_update),
+        batch_update.ids, batch_update.limit, batch_update.paid_at
+    )
+
+@api_router.post("/invoices/{invoice_id}/send-email")
+async def send_invoice_email(
+    invoice_id: str,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Manually send invoice email"""
+    return await run_idempotent(
+        idempotency_key,
+        f"send-invoice-email:{invoice_id}",
+        {},
+        lambda: schedule_invoice_email(invoice_id, background_tasks)
+    )
+
+async def schedule_invoice_email(invoice_id: str, background_tasks: BackgroundTasks) -> dict:
+    invoice = await db.invoices.find_one({"id": invoice_id})
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    
+    if not SMTP_USERNAME or not SMTP_PASSWORD:
+        raise HTTPException(status_code=500, detail="Email service not configured")
+    
+    # Add background task for email sending
+    background_tasks.add_task(send_invoice_email_task, invoice_id)
+    
+    return {"message": "Email send task scheduled successfully"}
+
+@api_router.post("/invoices/send-batch")
+async def send_invoice_batch(batch_request: InvoiceBatchSendRequest, background_tasks: BackgroundTasks):
+    """Send all matching draft invoices as one rate-limited background job"""
+    if not SMTP_USERNAME or not SMTP_PASSWORD:
+        raise HTTPException(status_code=500, detail="Email service not configured")
+    
+    job = await create_job("invoice-send-batch")
+    invoice_ids = await claim_drafts_for_job(job.id, batch_request)
+    if not invoice_ids:
+        await finish_job(job.id)
+        return {"job_id": job.id, "total": 0, "message": "No draft invoices matched"}
+    
+    background_tasks.add_task(run_invoice_send_batch, job.id, invoice_ids)
+    logger.info(f"Batch send job {job.id} scheduled for {len(invoice_ids)} invoices")
+    
+    return {"job_id": job.id, "total": len(invoice_ids), "message": "Batch send job scheduled"}
+
+@api_router.get("/invoices/{invoice_id}/einvoice")
+async def get_invoice_einvoice(invoice_id: str, profile: Literal["xrechnung", "zugferd"] = "xrechnung"):
+    """XRechnung XML or ZUGFeRD PDF for an invoice, served from the artifact cache"""
+    invoice = await find_document("invoices", invoice_id, {"_id": 0})
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    customer = await db.customers.find_one({"id": invoice["customer_id"]}, {"_id": 0})
+    if not customer:
+        # Invoices outlive their customer (statutory retention)
+        customer = invoice_customer_snapshot(invoice)
+    company = await get_company_data()
+    
+    path = await run_in_render_pool(build_einvoice_artifact, invoice, customer, company, profile)
+    extension = EINVOICE_RENDERERS[profile][0]
+    return FileResponse(
+        path,
+        media_type="application/xml" if extension == "xml" else "application/pdf",
+        filename=f"Rechnung_{invoice['invoice_number']}_{profile}.{extension}"
+    )
+
+async def run_einvoice_batch(job_id: str, invoice_ids: List[str], profile: str):
+    """Render e-invoices for many invoices on the shared PDF render pool"""
+    try:
+        invoices = await find_documents_by_ids("invoices", invoice_ids, {"_id": 0})
+        await start_job(job_id, total=len(invoice_ids))
+        customer_ids = list({invoice["customer_id"] for invoice in invoices})
+        customers = {
+            customer["id"]: customer
+            for customer in await db.customers.find({"id": {"$in": customer_ids}}, {"_id": 0}).to_list(length=None)
+        }
+        company = await get_company_data()
+        semaphore = asyncio.Semaphore(PDF_RENDER_WORKERS * 2)
+        artifacts = []
+        
+        async def render_one(invoice: dict):
+            async with semaphore:
+                customer = customers.get(invoice["customer_id"]) or invoice_customer_snapshot(invoice)
+                try:
+                    await run_in_render_pool(build_einvoice_artifact, invoice, customer, company, profile)
+                except Exception as e:
+                    await record_job_progress(job_id, failed=1, error=f"{invoice['invoice_number']}: {str(e)}")
+                    return
+                artifacts.append({
+                    "invoice_id": invoice["id"],
+                    "invoice_number": invoice["invoice_number"],
+                    "url": f"/api/invoices/{invoice['id']}/einvoice?profile={profile}"
+                })
+                await record_job_progress(job_id, succeeded=1)
+        
+        await asyncio.gather(*(render_one(invoice) for invoice in invoices))
+        missing = len(invoice_ids) - len(invoices)
+        if missing:
+            await record_job_progress(job_id, failed=missing, error=f"{missing} invoices not found")
+        await finish_job(job_id, result={"profile": profile, "artifacts": artifacts})
+        logger.info(f"E-invoice batch {job_id}: {len(artifacts)} {profile} artifacts")
+    
+    except Exception as e:
+        logger.error(f"Error in run_einvoice_batch: {str(e)}")
+        await finish_job(job_id, status="failed")
+
+@api_router.post("/invoices/einvoice-batch")
+async def create_einvoice_batch(batch_request: EInvoiceBatchRequest, background_tasks: BackgroundTasks):
+    """Pre-render e-invoices for many invoices as one background job"""
+    job = await create_job("einvoice-batch", total=len(batch_request.invoice_ids))
+    background_tasks.add_task(run_einvoice_batch, job.id, batch_request.invoice_ids, batch_request.profile)
+    return {"job_id": job.id, "total": len(batch_request.invoice_ids), "message": "E-invoice batch scheduled"}
+
+# Recurring invoice endpoints
+@api_router.post("/recurring-invoices", response_model=RecurringInvoice)
+async def create_recurring_invoice(recurring_data: RecurringInvoiceCreate):
+    customer = await db.customers.find_one({"id": recurring_data.customer_id})
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    
+    start_date = parse_billing_date_param(recurring_data.start_date, "start_date")
+    recurring = RecurringInvoice(
+        customer_id=recurring_data.customer_id,
+        customer_name=customer["name"],
+        interval=recurring_data.interval,
+        billing_day=start_date.day,
+        next_run_date=start_date,
+        payment_terms_days=recurring_data.payment_terms_days,
+        notes=recurring_data.notes,
+        apply_tax=recurring_data.apply_tax,
+        tax_rate=recurring_data.tax_rate,
+        send_email=recurring_data.send_email,
+        **calculate_recurring_totals(recurring_data.items, recurring_data.apply_tax, recurring_data.tax_rate)
+    )
+    await db.recurring_invoices.insert_one(prepare_for_mongo(recurring.dict()))
+    logger.info(f"Recurring invoice {recurring.id} ({recurring.interval}) created for {customer['name']}")
+    return recurring
+
+@api_router.get("/recurring-invoices", response_model=List[RecurringInvoice])
+async def get_recurring_invoices(active: Optional[bool] = None):
+    query = {} if active is None else {"active": active}
+    definitions = await db.recurring_invoices.find(query).sort("next_run_date", 1).to_list(length=None)
+    return [RecurringInvoice(**parse_from_mongo(definition)) for definition in definitions]
+
+@api_router.post("/recurring-invoices/run")
+async def run_recurring_invoices(background_tasks: BackgroundTasks, as_of: Optional[str] = None):
+    """Generate all due recurring invoices now instead of waiting for the scheduler"""
+    as_of_date = parse_billing_date_param(as_of, "as_of") if as_of else None
+    job = await create_job("recurring-invoices")
+    background_tasks.add_task(run_recurring_invoice_job, job.id, as_of_date)
+    return {"job_id": job.id, "message": "Recurring invoice job scheduled"}
+
+@api_router.get("/recurring-invoices/{recurring_id}", response_model=RecurringInvoice)
+async def get_recurring_invoice(recurring_id: str):
+    definition = await db.recurring_invoices.find_one({"id": recurring_id})
+    if not definition:
+        raise HTTPException(status_code=404, detail="Recurring invoice not found")
+    return RecurringInvoice(**parse_from_mongo(definition))
+
+@api_router.put("/recurring-invoices/{recurring_id}", response_model=RecurringInvoice)
+async def update_recurring_invoice(recurring_id: str, recurring_update: RecurringInvoiceUpdate):
+    existing = await db.recurring_invoices.find_one({"id": recurring_id})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Recurring invoice not found")
+    
+    update_data = {k: v for k, v in recurring_update.dict().items() if v is not None and k != "items"}
+    if "next_run_date" in update_data:
+        next_run_date = parse_billing_date_param(update_data["next_run_date"], "next_run_date")
+        update_data["next_run_date"] = next_run_date
+        update_data["billing_day"] = next_run_date.day
+    if any(value is not None for value in (recurring_update.items, recurring_update.apply_tax, recurring_update.tax_rate)):
+        items = recurring_update.items
+        if items is None:
+            items = [InvoiceItemCreate(**item) for item in existing["items"]]
+        apply_tax = existing.get("apply_tax", True) if recurring_update.apply_tax is None else recurring_update.apply_tax
+        tax_rate = existing.get("tax_rate", 19.0) if recurring_update.tax_rate is None else recurring_update.tax_rate
+        update_data.update(calculate_recurring_totals(items, apply_tax, tax_rate))
+        update_data["items"] = [item.dict() for item in update_data["items"]]
+    
+    if update_data:
+        await db.recurring_invoices.update_one(
+            {"id": recurring_id},
+            {"$set": prepare_for_mongo(update_data)}
+        )
+    
+    updated = await db.recurring_invoices.find_one({"id": recurring_id})
+    return RecurringInvoice(**parse_from_mongo(updated))
+
+@api_router.delete("/recurring-invoices/{recurring_id}")
+async def delete_recurring_invoice(recurring_id: str):
+    result = await db.recurring_invoices.delete_one({"id": recurring_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Recurring invoice not found")
+    return {"message": "Recurring invoice deleted successfully"}
+
+# Report endpoints
+# Due dates are ISO strings, so aging buckets are plain string ranges between
+# day boundaries computed from as_of; no per-document date parsing needed.
+AGING_BUCKETS = ["current", "0-30", "31-60", "61-90", "90+"]
+AGING_CSV_HEADER = ["Kunde", "Nicht fällig", "0-30 Tage", "31-60 Tage", "61-90 Tage", "über 90 Tage", "Gesamt"]
+
+def aging_boundaries(as_of: datetime) -> List[str]:
+    """Ascending due_date boundaries, one bucket between each pair (oldest first)"""
+    as_of_day = as_of.date()
+    return [
+        "",
+        (as_of_day - timedelta(days=90)).isoformat(),
+        (as_of_day - timedelta(days=60)).isoformat(),
+        (as_of_day - timedelta(days=30)).isoformat(),
+        (as_of_day + timedelta(days=1)).isoformat(),
+        "~"  # sorts after every ISO date
+    ]
+
+def format_german_amount(amount: float) -> str:
+    return f"{amount:.2f}".replace(".", ",")
+
+async def compute_aging_report(as_of: datetime) -> dict:
+    boundaries = aging_boundaries(as_of)
+    # Oldest boundary first, so the buckets come out as 90+ ... current
+    bucket_names = list(reversed(AGING_BUCKETS))
+    as_of_end = datetime.combine(as_of.date(), datetime.max.time()).isoformat()
+    pipeline = [
+        {"$match": {
+            "status": {"$in": ["sent", "paid"]},
+            "invoice_date": {"$lte": as_of_end},
+            # Invoices paid after as_of were still open on that day
+            "$or": [{"status": "sent"}, {"paid_at": {"$gt": as_of_end}}]
+        }},
+        {"$project": {
+            "_id": 0,
+            "customer_id": 1,
+            "customer_name": 1,
+            "due_date": 1,
+            "amount": {"$add": ["$total_amount", {"$ifNull": ["$dunning_fees", 0]}]}
+        }},
+        {"$facet": {
+            "totals": [
+                {"$bucket": {
+                    "groupBy": "$due_date",
+                    "boundaries": boundaries,
+                    "output": {"amount": {"$sum": "$amount"}, "count": {"$sum": 1}}
+                }}
+            ],
+            "by_customer": [
+                {"$group": {
+                    "_id": {
+                        "customer_id": "$customer_id",
+                        "bucket": {"$switch": {
+                            "branches": [
+                                {"case": {"$lt": ["$due_date", boundary]}, "then": name}
+                                for boundary, name in zip(boundaries[1:-1], bucket_names)
+                            ],
+                            "default": bucket_names[-1]
+                        }}
+                    },
+                    "customer_name": {"$first": "$customer_name"},
+                    "amount": {"$sum": "$amount"},
+                    "count": {"$sum": 1}
+                }}
+            ]
+        }}
+    ]
+    totals = {name: {"amount": 0.0, "count": 0} for name in AGING_BUCKETS}
+    customers = {}
+    # Invoices archived since as_of may have been open on that day
+    for collection in ("invoices", "invoices_archive"):
+        result = (await db[collection].aggregate(pipeline).to_list(length=1))[0]
+        for bucket in result["totals"]:
+            total = totals[bucket_names[boundaries.index(bucket["_id"])]]
+            total["amount"] = round(total["amount"] + bucket["amount"], 2)
+            total["count"] += bucket["count"]
+        
+        for row in result["by_customer"]:
+            customer_id = row["_id"]["customer_id"]
+            customer = customers.setdefault(customer_id, {
+                "customer_id": customer_id,
+                "customer_name": row["customer_name"],
+                "buckets": {name: 0.0 for name in AGING_BUCKETS},
+                "total": 0.0
+            })
+            bucket = row["_id"]["bucket"]
+            customer["buckets"][bucket] = round(customer["buckets"][bucket] + row["amount"], 2)
+            customer["total"] = round(customer["total"] + row["amount"], 2)
+    
+    return {
+        "as_of": as_of.date().isoformat(),
+        "buckets": AGING_BUCKETS,
+        "totals": totals,
+        "total_open": round(sum(bucket["amount"] for bucket in totals.values()), 2),
+        "customers": sorted(customers.values(), key=lambda customer: customer["total"], reverse=True)
+    }
+
+def aging_report_csv(report: dict) -> str:
+    output = io.StringIO()
+    # BOM and semicolons so German Excel opens the file directly
+    output.write("\ufeff")
+    writer = csv.writer(output, delimiter=";")
+    writer.writerow(AGING_CSV_HEADER)
+    for customer in report["customers"]:
+        writer.writerow(
+            [customer["customer_name"]]
+            + [format_german_amount(customer["buckets"][name]) for name in AGING_BUCKETS]
+            + [format_german_amount(customer["total"])]
+        )
+    writer.writerow(
+        ["Summe"]
+        + [format_german_amount(report["totals"][name]["amount"]) for name in AGING_BUCKETS]
+        + [format_german_amount(report["total_open"])]
+    )
+    return output.getvalue()
+
+@api_router.get("/reports/aging")
+async def get_aging_report(
+    as_of: Optional[str] = None,
+    report_format: Literal["json", "csv"] = Query("json", alias="format")
+):
+    """Open receivables per customer, bucketed by days overdue as of a date"""
+    try:
+        as_of_date = datetime.fromisoformat(as_of) if as_of else datetime.now(timezone.utc)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="as_of must be an ISO date")
+    
+    report = await compute_aging_report(as_of_date)
+    if report_format == "csv":
+        return Response(
+            content=aging_report_csv(report),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f"attachment; filename=offene_posten_{report['as_of']}.csv"}
+        )
+    return report
+
+# Cash-flow forecast
+# Expected inflows per week from open invoices and from quotes that may still
+# become invoices. Each item is expected at its due date shifted by the
+# customer's payment delay profile: a weekly histogram of paid_at - due_date
+# over recently paid invoices, shrunk towards the all-customer histogram so a
+# customer with two invoices does not get a spiky profile. Overdue items keep
+# only the part of the profile that is still ahead; items the history says
+# should have been paid already are expected this week and reported as at risk.
+# Sent quotes are weighted with the historical acceptance rate. After loading,
+# everything is NumPy array arithmetic (NumPy is imported on first use).
+FORECAST_HISTORY_DAYS = int(os.environ.get('FORECAST_HISTORY_DAYS', 730))
+FORECAST_PRIOR_WEIGHT = float(os.environ.get('FORECAST_PRIOR_WEIGHT', 5))
+FORECAST_MODEL_TTL_SECONDS = int(os.environ.get('FORECAST_MODEL_TTL_SECONDS', 600))
+FORECAST_DELAY_WEEKS = (-4, 26)  # earliest and latest payment week relative to the due date
+FORECAST_DEFAULT_QUOTE_RATE = 0.5  # until quotes have been accepted or rejected
+payment_delay_model = {"built_at": float('-inf'), "model": None}
+
+def day_numbers(values: list):
+    """Days since 1970-01-01 for ISO date/datetime strings, parsed as arrays of digits.
+    
+    Several times faster than casting to datetime64; the S10 cast keeps the date part.
+    """
+    import numpy as np
+    digits = np.frombuffer(np.array(values, dtype="S10").tobytes(), dtype=np.uint8).reshape(-1, 10).astype(np.int64) - 48
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 5] * 10 + digits[:, 6]
+    day = digits[:, 8] * 10 + digits[:, 9]
+    # Proleptic Gregorian day count with March as the first month of the year
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def build_payment_delay_model(customer_ids: list, due_dates: list, paid_dates: list) -> dict:
+    """Per-customer weekly delay distributions; the last row is the all-customer one"""
+    import numpy as np
+    offsets = np.arange(FORECAST_DELAY_WEEKS[0], FORECAST_DELAY_WEEKS[1] + 1)
+    bucket_count = len(offsets)
+    if not customer_ids:
+        return {
+            "offsets": offsets,
+            "rows": {},
+            "distributions": (offsets == 0).astype(float)[None, :],
+            "samples": 0,
+            "median_delay_days": 0.0
+        }
+    
+    delays = day_numbers(paid_dates) - day_numbers(due_dates)
+    buckets = np.clip(np.floor_divide(delays, 7), offsets[0], offsets[-1]) - offsets[0]
+    rows = {}
+    customer_rows = np.fromiter(
+        (rows.setdefault(customer_id, len(rows)) for customer_id in customer_ids), dtype=np.int64, count=len(customer_ids)
+    )
+    counts = np.bincount(
+        customer_rows * bucket_count + buckets, minlength=len(rows) * bucket_count
+    ).reshape(len(rows), bucket_count).astype(float)
+    overall = counts.sum(axis=0) / len(delays)
+    shrunk = (counts + FORECAST_PRIOR_WEIGHT * overall) / (counts.sum(axis=1, keepdims=True) + FORECAST_PRIOR_WEIGHT)
+    return {
+        "offsets": offsets,
+        "rows": rows,
+        "distributions": np.vstack([shrunk, overall]),
+        "samples": len(delays),
+        "median_delay_days": float(np.median(delays))
+    }
+
+async def get_payment_delay_model() -> dict:
+    """Delay model from invoices paid in the last FORECAST_HISTORY_DAYS, rebuilt every few minutes"""
+    now = time.monotonic()
+    if now - payment_delay_model["built_at"] < FORECAST_MODEL_TTL_SECONDS:
+        return payment_delay_model["model"]
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=FORECAST_HISTORY_DAYS)).date().isoformat()
+    query = {"status": "paid", "paid_at": {"$type": "string", "$gte": cutoff}}
+    projection = {"_id": 0, "customer_id": 1, "due_date": 1, "paid_at": 1}
+    paid = await db.invoices.find(query, projection).to_list(length=None)
+    paid += await db.invoices_archive.find(query, projection).to_list(length=None)
+    model = build_payment_delay_model(
+        [invoice["customer_id"] for invoice in paid],
+        [invoice["due_date"] for invoice in paid],
+        [invoice["paid_at"] for invoice in paid]
+    )
+    payment_delay_model.update(built_at=now, model=model)
+    return model
 
-@api_router.delete("/customers/{customer_id}")
-async def delete_customer(customer_id: str):
-    result = await db.customers.delete_one({"id": customer_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    return {"message": "Customer deleted successfully"}
+async def get_quote_acceptance_rate() -> float:
+    decided = Counter()
+    for collection in ("quotes", "quotes_archive"):
+        for group in await db[collection].aggregate([
+            {"$match": {"status": {"$in": ["accepted", "converted", "rejected"]}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]).to_list(length=None):
+            decided[group["_id"]] += group["count"]
+    total = sum(decided.values())
+    return (decided["accepted"] + decided["converted"]) / total if total else FORECAST_DEFAULT_QUOTE_RATE
 
-# Company Data endpoints
-@api_router.post("/company", response_model=CompanyData)
-async def create_or_update_company(company: CompanyDataCreate):
-    # Check if company data exists
-    existing_company = await db.company_data.find_one({})
+def project_cashflow(model: dict, items: dict, start, weeks: int) -> dict:
+    """Spread every item over the weeks after `start` (a Monday); index `weeks` collects later inflows.
     
-    company_dict = company.dict()
+    Items with the same delay profile, base week and kind behave identically, so
+    they are summed into groups first and only the groups are spread out.
+    """
+    import numpy as np
+    offsets = model["offsets"]
+    distributions = model["distributions"]
+    global_row = len(distributions) - 1
+    count = len(items["amounts"])
     
-    if existing_company:
-        # Update existing
-        company_obj = CompanyData(**{**company_dict, "id": existing_company["id"]})
-        company_data = prepare_for_mongo(company_obj.dict())
-        await db.company_data.replace_one({"id": existing_company["id"]}, company_data)
-    else:
-        # Create new
-        company_obj = CompanyData(**company_dict)
-        company_data = prepare_for_mongo(company_obj.dict())
-        await db.company_data.insert_one(company_data)
+    rows = np.fromiter(
+        map(model["rows"].get, items["customer_ids"], [global_row] * count), dtype=np.int64, count=count
+    )
+    start_day = (start - datetime(1970, 1, 1).date()).days
+    base_weeks = np.floor_divide(day_numbers(items["dates"]) - start_day, 7)
+    # Base weeks this far out behave alike: entirely overdue or entirely after the horizon
+    lowest, highest = -offsets[-1] - 1, weeks - offsets[0]
+    span = highest - lowest + 1
+    keys = ((rows * span + np.clip(base_weeks, lowest, highest) - lowest) * 2
+            + np.array(items["is_quote"], dtype=np.int64))
+    amounts = np.array(items["amounts"], dtype=float)
+    key_count = len(distributions) * span * 2
+    group_counts = np.bincount(keys, minlength=key_count)
+    groups = np.flatnonzero(group_counts)
+    expected = np.bincount(keys, weights=amounts * np.array(items["weights"], dtype=float), minlength=key_count)[groups]
+    nominal = np.bincount(keys, weights=amounts, minlength=key_count)[groups]
     
-    return company_obj
-
-@api_router.get("/company", response_model=Optional[CompanyData])
-async def get_company():
-    company = await db.company_data.find_one({})
-    if not company:
-        return None
-    return CompanyData(**parse_from_mongo(company))
-
-# Invoice endpoints
-@api_router.post("/invoices", response_model=Invoice)
-async def create_invoice(invoice_data: InvoiceCreate, background_tasks: BackgroundTasks):
-    # Get customer info
-    customer = await db.customers.find_one({"id": invoice_data.customer_id})
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
+    group_is_quote = groups % 2 == 1
+    group_weeks = (groups // 2) % span + lowest
+    week_index = group_weeks[:, None] + offsets[None, :]
+    probabilities = np.where(week_index >= 0, distributions[groups // 2 // span], 0.0)
+    remaining = probabilities.sum(axis=1)
+    at_risk = remaining <= 1e-9
+    probabilities /= np.where(at_risk, 1.0, remaining)[:, None]
+    probabilities[at_risk, 0] = 1.0
+    week_index[at_risk, 0] = 0
     
-    # Generate invoice number
-    invoice_count = await db.invoices.count_documents({}) + 1
-    invoice_number = f"INV-{invoice_count:04d}"
+    values = probabilities * expected[:, None]
+    week_index = np.clip(week_index, 0, weeks)
     
-    # Calculate totals
-    items = []
-    subtotal = 0
+    def weekly(mask):
+        return np.bincount(week_index[mask].ravel(), weights=values[mask].ravel(), minlength=weeks + 1)
     
-    for item_data in invoice_data.items:
-        total_price = item_data.quantity * item_data.unit_price
-        item = InvoiceItem(
-            **item_data.dict(),
-            total_price=total_price
-        )
-        items.append(item)
-        subtotal += total_price
+    overdue_invoices = at_risk & ~group_is_quote
+    return {
+        "invoices": weekly(~group_is_quote),
+        "quotes": weekly(group_is_quote),
+        "at_risk_amount": float(nominal[overdue_invoices].sum()),
+        "at_risk_count": int(group_counts[groups][overdue_invoices].sum())
+    }
+
+@api_router.get("/reports/cashflow-forecast")
+async def get_cashflow_forecast(
+    weeks: int = Query(13, ge=1, le=104),
+    include_quotes: bool = True
+):
+    """Expected weekly inflows from open invoices and accepted or sent quotes"""
+    today = datetime.now(timezone.utc).date()
+    start = today - timedelta(days=today.weekday())
+    model = await get_payment_delay_model()
     
-    tax_amount = subtotal * 0.19 if invoice_data.apply_tax else 0  # Conditional VAT
-    total_amount = subtotal + tax_amount
+    invoices = await db.invoices.find(
+        {"status": "sent"}, {"_id": 0, "customer_id": 1, "due_date": 1, "total_amount": 1, "dunning_fees": 1}
+    ).to_list(length=None)
+    items = {
+        "customer_ids": [invoice["customer_id"] for invoice in invoices],
+        "dates": [invoice["due_date"] for invoice in invoices],
+        "amounts": [invoice["total_amount"] + (invoice.get("dunning_fees") or 0.0) for invoice in invoices],
+        "weights": [1.0] * len(invoices),
+        "is_quote": [False] * len(invoices)
+    }
     
-    # Parse dates
-    invoice_date = datetime.fromisoformat(invoice_data.invoice_date)
-    due_date = datetime.fromisoformat(invoice_data.due_date)
+    acceptance_rate = None
+    if include_quotes:
+        acceptance_rate = await get_quote_acceptance_rate()
+        quotes = await db.quotes.find(
+            {"$or": [{"status": "accepted"}, {"status": "sent", "valid_until": {"$gte": today.isoformat()}}]},
+            {"_id": 0, "customer_id": 1, "valid_until": 1, "total_amount": 1, "status": 1}
+        ).to_list(length=None)
+        # Accepted quotes are invoiced now, sent ones at the latest when they expire
+        terms = timedelta(days=QUOTE_INVOICE_TERMS_DAYS)
+        accepted_due = (today + terms).isoformat()
+        for quote in quotes:
+            items["customer_ids"].append(quote["customer_id"])
+            items["dates"].append(
+                accepted_due if quote["status"] == "accepted"
+                else (datetime.fromisoformat(quote["valid_until"][:10]).date() + terms).isoformat()
+            )
+            items["amounts"].append(quote["total_amount"])
+            items["weights"].append(1.0 if quote["status"] == "accepted" else acceptance_rate)
+            items["is_quote"].append(True)
     
-    invoice = Invoice(
-        invoice_number=invoice_number,
-        customer_id=invoice_data.customer_id,
-        customer_name=customer["name"],
-        items=items,
-        subtotal=subtotal,
-        tax_amount=tax_amount,
-        total_amount=total_amount,
-        invoice_date=invoice_date,
-        due_date=due_date,
-        notes=invoice_data.notes,
-        apply_tax=invoice_data.apply_tax,
-        status="draft"  # Start as draft, will be updated to "sent" after email
-    )
+    started = time.perf_counter()
+    projection = project_cashflow(model, items, start, weeks)
+    compute_ms = (time.perf_counter() - started) * 1000
     
-    invoice_data_dict = prepare_for_mongo(invoice.dict())
-    await db.invoices.insert_one(invoice_data_dict)
+    weekly = []
+    cumulative = 0.0
+    for week in range(weeks):
+        invoices_amount = float(projection["invoices"][week])
+        quotes_amount = float(projection["quotes"][week])
+        cumulative += invoices_amount + quotes_amount
+        weekly.append({
+            "week_start": (start + timedelta(weeks=week)).isoformat(),
+            "invoices": round(invoices_amount, 2),
+            "quotes": round(quotes_amount, 2),
+            "total": round(invoices_amount + quotes_amount, 2),
+            "cumulative": round(cumulative, 2)
+        })
+    return {
+        "as_of": today.isoformat(),
+        "weeks": weekly,
+        "after_horizon": {
+            "invoices": round(float(projection["invoices"][weeks]), 2),
+            "quotes": round(float(projection["quotes"][weeks]), 2)
+        },
+        "open_invoices": {"count": len(invoices), "amount": round(sum(items["amounts"][:len(invoices)]), 2)},
+        "quotes_considered": len(items["amounts"]) - len(invoices),
+        "quote_acceptance_rate": acceptance_rate,
+        "at_risk": {"count": projection["at_risk_count"], "amount": round(projection["at_risk_amount"], 2)},
+        "history": {
+            "paid_invoices": model["samples"],
+            "customers": len(model["rows"]),
+            "median_delay_days": model["median_delay_days"]
+        },
+        "compute_ms": round(compute_ms, 2)
+    }
+
+# VAT return (Umsatzsteuer-Voranmeldung)
+# Reports are kept in db.vat_reports. A period that has been closed for
+# VAT_CLOSE_AFTER_DAYS is computed once more and then frozen. The open period
+# keeps each invoice's contribution plus the sync cursor, so a refresh only
+# reads invoices written since the last request. Archived invoices count like
+# hot ones. Reports stored by an older VAT_REPORT_VERSION are recomputed.
+VAT_CLOSE_AFTER_DAYS = int(os.environ.get('VAT_CLOSE_AFTER_DAYS', 10))
+VAT_REPORT_VERSION = 2
+VAT_INVOICE_FIELDS = {"_id": 0, "id": 1, "invoice_date": 1, "status": 1, "apply_tax": 1,
+                      "tax_rate": 1, "subtotal": 1, "tax_amount": 1}
+VAT_PERIOD_PATTERN = re.compile(r"^(\d{4})-(?:(\d{2})|Q([1-4]))$")
+
+def parse_vat_period(period: str):
+    """Return (start, end) dates of a month (2026-09) or quarter (2026-Q3)"""
+    match = VAT_PERIOD_PATTERN.match(period or "")
+    if not match:
+        raise HTTPException(status_code=400, detail="period must look like 2026-09 or 2026-Q3")
+    year = int(match.group(1))
+    if match.group(2):
+        first_month = int(match.group(2))
+        if not 1 <= first_month <= 12:
+            raise HTTPException(status_code=400, detail="Invalid month in period")
+        months = 1
+    else:
+        first_month = (int(match.group(3)) - 1) * 3 + 1
+        months = 3
+    start = datetime(year, first_month, 1)
+    end_month = first_month - 1 + months
+    end = datetime(year + end_month // 12, end_month % 12 + 1, 1)
+    return start, end
+
+def vat_contribution(invoice: dict, start: datetime, end: datetime) -> Optional[dict]:
+    """What an invoice adds to the period, None if it does not count"""
+    if invoice.get("status") not in ("sent", "paid"):
+        return None
+    if not start.isoformat() <= invoice.get("invoice_date", "") < end.isoformat():
+        return None
+    apply_tax = invoice.get("apply_tax", True)
+    return {
+        "rate": invoice.get("tax_rate", 19.0) if apply_tax else 0.0,
+        "taxable": apply_tax,
+        "net": invoice["subtotal"],
+        "tax": invoice["tax_amount"] if apply_tax else 0.0
+    }
+
+def summarize_vat(period: str, start: datetime, end: datetime, contributions: dict) -> dict:
+    rates = {}
+    taxable = non_taxable = 0.0
+    for contribution in contributions.values():
+        if contribution["taxable"]:
+            taxable += contribution["net"]
+            rate = rates.setdefault(contribution["rate"], {"rate": contribution["rate"], "net": 0.0, "tax": 0.0, "invoice_count": 0})
+            rate["net"] += contribution["net"]
+            rate["tax"] += contribution["tax"]
+            rate["invoice_count"] += 1
+        else:
+            non_taxable += contribution["net"]
+    return {
+        "period": period,
+        "start": start.date().isoformat(),
+        "end": (end - timedelta(days=1)).date().isoformat(),
+        "invoice_count": len(contributions),
+        "taxable_revenue": round(taxable, 2),
+        "non_taxable_revenue": round(non_taxable, 2),
+        "total_tax": round(sum(rate["tax"] for rate in rates.values()), 2),
+        "rates": [
+            {**rate, "net": round(rate["net"], 2), "tax": round(rate["tax"], 2)}
+            for _, rate in sorted(rates.items(), reverse=True)
+        ]
+    }
+
+async def compute_vat_report(period: str) -> dict:
+    start, end = parse_vat_period(period)
+    cached = await db.vat_reports.find_one({"_id": period})
+    if cached and cached.get("version") != VAT_REPORT_VERSION:
+        # Computed by an older version (before archived invoices were counted)
+        cached = None
+    if cached and cached.get("closed"):
+        return {**cached["report"], "closed": True}
+    if cached and cached["last_seq"] < await sync_horizon():
+        # Tombstones it would need to catch up may have expired
+        cached = None
     
-    # Add background task for email sending
-    if SMTP_USERNAME and SMTP_PASSWORD:
-        background_tasks.add_task(send_invoice_email_task, invoice.id)
-        logger.info(f"Invoice {invoice_number} created, email task scheduled")
+    # Read the cursor first; writes that race with this request are re-read next time
+    cursor = await current_sync_seq(floor=cached["last_seq"] if cached else 0)
+    if cached:
+        contributions = cached["contributions"]
+        
+        def apply_contribution(invoice: dict):
+            contribution = vat_contribution(invoice, start, end)
+            if contribution:
+                contributions[invoice["id"]] = contribution
+            else:
+                contributions.pop(invoice["id"], None)
+        
+        async for invoice in db.invoices.find({"updated_seq": {"$gt": cached["last_seq"]}}, VAT_INVOICE_FIELDS):
+            apply_contribution(invoice)
+        archived_ids = []
+        async for tombstone in db.sync_tombstones.find(
+            {"collection": "invoices", "updated_seq": {"$gt": cached["last_seq"]}},
+            {"_id": 0, "id": 1, "reason": 1}
+        ):
+            if tombstone.get("reason") == "archived":
+                archived_ids.append(tombstone["id"])
+            else:
+                contributions.pop(tombstone["id"], None)
+        # Archived invoices still count; re-read them in case they changed just before the move
+        if archived_ids:
+            async for invoice in db.invoices_archive.find({"id": {"$in": archived_ids}}, VAT_INVOICE_FIELDS):
+                apply_contribution(invoice)
     else:
-        logger.warning(f"Invoice {invoice_number} created, but email not configured")
+        contributions = {}
+        for collection in ("invoices", "invoices_archive"):
+            async for invoice in db[collection].find(
+                {"invoice_date": {"$gte": start.isoformat(), "$lt": end.isoformat()}}, VAT_INVOICE_FIELDS
+            ):
+                contribution = vat_contribution(invoice, start, end)
+                if contribution:
+                    contributions[invoice["id"]] = contribution
     
-    return invoice
-
-@api_router.get("/invoices", response_model=List[Invoice])
-async def get_invoices():
-    invoices = await db.invoices.find().sort("created_at", -1).to_list(length=None)
-    return [Invoice(**parse_from_mongo(invoice)) for invoice in invoices]
+    report = summarize_vat(period, start, end, contributions)
+    # Period bounds are naive UTC dates
+    closed = datetime.now(timezone.utc).replace(tzinfo=None) >= end + timedelta(days=VAT_CLOSE_AFTER_DAYS)
+    document = {
+        "_id": period,
+        "version": VAT_REPORT_VERSION,
+        "closed": closed,
+        "report": report,
+        "computed_at": datetime.now(timezone.utc).isoformat()
+    }
+    if not closed:
+        document.update(contributions=contributions, last_seq=cursor)
+    try:
+        await db.vat_reports.replace_one(
+            {"_id": period, "$or": [{"closed": {"$ne": True}}, {"version": {"$ne": VAT_REPORT_VERSION}}]},
+            document,
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another request froze the period first
+        pass
+    return {**report, "closed": closed}
 
-@api_router.get("/invoices/{invoice_id}", response_model=Invoice)
-async def get_invoice(invoice_id: str):
-    invoice = await db.invoices.find_one({"id": invoice_id})
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    return Invoice(**parse_from_mongo(invoice))
+@api_router.get("/reports/vat")
+async def get_vat_report(period: str):
+    """Revenue and VAT per rate for a month (2026-09) or quarter (2026-Q3)"""
+    return await compute_vat_report(period)
 
-@api_router.put("/invoices/{invoice_id}/status")
-async def update_invoice_status(invoice_id: str, status: dict):
-    result = await db.invoices.update_one(
-        {"id": invoice_id}, 
-        {"$set": {"status": status["status"]}}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    return {"message": "Status updated successfully"}
+# Dunning endpoints
+@api_router.get("/dunning/levels")
+async def get_dunning_levels():
+    return [{"level": index + 1, **level} for index, level in enumerate(DUNNING_LEVELS)]
 
-@api_router.post("/invoices/{invoice_id}/send-email")
-async def send_invoice_email(invoice_id: str, background_tasks: BackgroundTasks):
-    """Manually send invoice email"""
-    invoice = await db.invoices.find_one({"id": invoice_id})
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
+@api_router.post("/dunning/run")
+async def run_dunning(background_tasks: BackgroundTasks, dry_run: bool = False):
+    """Send all due payment reminders now; dry_run lists them without sending"""
+    as_of = datetime.now(timezone.utc).replace(tzinfo=None)
+    if dry_run:
+        invoices = await db.invoices.find(
+            dunning_candidate_query(as_of),
+            {"_id": 0, "id": 1, "invoice_number": 1, "customer_name": 1, "due_date": 1,
+             "total_amount": 1, "dunning_level": 1, "dunning_fees": 1}
+        ).sort("due_date", 1).to_list(length=500)
+        return {
+            "dry_run": True,
+            "reminders": [
+                {
+                    "invoice_id": invoice["id"],
+                    "invoice_number": invoice["invoice_number"],
+                    "customer_name": invoice["customer_name"],
+                    "due_date": invoice["due_date"],
+                    **build_dunning_notice(invoice, as_of)
+                }
+                for invoice in invoices
+            ]
+        }
     
     if not SMTP_USERNAME or not SMTP_PASSWORD:
         raise HTTPException(status_code=500, detail="Email service not configured")
     
-    # Add background task for email sending
-    background_tasks.add_task(send_invoice_email_task, invoice_id)
+    job = await create_job("dunning-run")
+    background_tasks.add_task(run_dunning_job, job.id, as_of)
+    return {"job_id": job.id, "message": "Dunning run scheduled"}
+
+@api_router.get("/invoices/{invoice_id}/dunning-notices")
+async def get_dunning_notices(invoice_id: str):
+    notices = await db.dunning_notices.find({"invoice_id": invoice_id}, {"_id": 0}).sort("level", 1).to_list(length=None)
+    return [parse_from_mongo(notice) for notice in notices]
+
+# Archive endpoints
+@api_router.post("/archive/run")
+async def run_archive(background_tasks: BackgroundTasks):
+    """Move everything past ARCHIVE_AFTER_DAYS to the archive now"""
+    job = await create_job("archive-run")
+    background_tasks.add_task(run_archive_job, job.id)
+    return {"job_id": job.id, "message": "Archive run scheduled"}
+
+@api_router.get("/archive/stats")
+async def get_archive_stats():
+    stats = {"archive_after_days": ARCHIVE_AFTER_DAYS}
+    for collection in ARCHIVED_COLLECTIONS:
+        stats[collection] = {
+            "hot": await db[collection].estimated_document_count(),
+            "archived": await db[f"{collection}_archive"].estimated_document_count()
+        }
+    return stats
+
+# Statement endpoints
+@api_router.post("/statements/batch")
+async def create_statement_batch(batch_request: StatementBatchRequest, background_tasks: BackgroundTasks):
+    """Render statements for all (or the given) customers as one background job, e.g. at year-end"""
+    parse_statement_period(batch_request.period_from, batch_request.period_to)
+    job = await create_job("statement-batch")
+    background_tasks.add_task(run_statement_batch, job.id, batch_request)
+    return {"job_id": job.id, "message": "Statement batch scheduled"}
+
+async def find_statement_batch(job_id: str) -> dict:
+    job = await db.jobs.find_one({"id": job_id, "type": "statement-batch"}, {"_id": 0})
+    if not job or job.get("status") != "completed":
+        raise HTTPException(status_code=404, detail="Statement batch not found or not finished")
+    return job
+
+@api_router.get("/statements/batch/{job_id}/archive")
+async def get_statement_batch_archive(job_id: str):
+    """All statements of a finished batch as one zip file"""
+    job = await find_statement_batch(job_id)
+    path = STATEMENT_DIR / job["id"] / "statements.zip"
+    if not job["result"]["statements"] or not path.exists():
+        raise HTTPException(status_code=404, detail="No statements in this batch")
+    result = job["result"]
+    return FileResponse(
+        path,
+        media_type="application/zip",
+        filename=f"Kontoauszuege_{result['period_from']}_{result['period_to']}.zip"
+    )
+
+@api_router.get("/statements/batch/{job_id}/{customer_id}")
+async def get_statement_batch_file(job_id: str, customer_id: str):
+    job = await find_statement_batch(job_id)
+    statement = next(
+        (statement for statement in job["result"]["statements"] if statement["customer_id"] == customer_id), None
+    )
+    path = STATEMENT_DIR / job["id"] / f"{customer_id}.pdf"
+    if not statement or not path.exists():
+        raise HTTPException(status_code=404, detail="Statement not found")
+    return FileResponse(path, media_type="application/pdf", filename=statement["filename"])
+
+# Sync endpoint
+SYNC_COLLECTIONS = {
+    "customers": Customer,
+    "invoices": Invoice,
+    "quotes": Quote,
+    "todos": ToDo
+}
+
+@api_router.get("/sync")
+async def sync_changes(since: int = Query(0, ge=0)):
+    """Documents created, changed or deleted after the `since` cursor (0 = full load).
+    A cursor older than the tombstone window gets a full load with `full_resync`
+    set; the client then replaces its copy instead of merging into it."""
+    full_resync = since > 0 and since < await sync_horizon()
+    if full_resync:
+        since = 0
+    # Stays below writes still in flight, so nothing below it can show up later
+    cursor = await current_sync_seq(floor=since)
     
-    return {"message": "Email send task scheduled successfully"}
+    changes = {}
+    for name, model in SYNC_COLLECTIONS.items():
+        query = {"updated_seq": {"$gt": since, "$lte": cursor}} if since else {}
+        docs = await db[name].find(query, {"_id": 0}).sort("updated_seq", 1).to_list(length=None)
+        changes[name] = [model(**parse_from_mongo(doc)) for doc in docs]
+    
+    deleted = {name: [] for name in SYNC_COLLECTIONS}
+    if since:
+        tombstones = await db.sync_tombstones.find(
+            {"updated_seq": {"$gt": since, "$lte": cursor}},
+            {"_id": 0, "collection": 1, "id": 1}
+        ).to_list(length=None)
+        for tombstone in tombstones:
+            deleted.setdefault(tombstone["collection"], []).append(tombstone["id"])
+    
+    return {"cursor": cursor, "changes": changes, "deleted": deleted, "full_resync": full_resync}
+
+# Bank statement endpoints
+@api_router.post("/bank-statements/import")
+async def import_bank_statement(
+    file: UploadFile = File(...),
+    statement_format: Optional[Literal["camt053", "mt940", "csv"]] = Query(None, alias="format"),
+    encoding: str = "utf-8",
+    dry_run: bool = False
+):
+    """Reconcile a CAMT.053, MT940 or CSV statement against open invoices"""
+    open_invoices = await db.invoices.find(
+        {"status": {"$ne": "paid"}},
+        {"_id": 0, "id": 1, "invoice_number": 1, "total_amount": 1, "dunning_fees": 1}
+    ).to_list(length=None)
+    index = OpenInvoiceIndex(open_invoices)
+    
+    await file.seek(0)
+    if statement_format is None:
+        statement_format = detect_statement_format(await file.read(2048))
+        await file.seek(0)
+    
+    def parse_and_match():
+        return reconcile_statement(iter_statement_lines(file.file, statement_format, encoding), index)
+    
+    try:
+        report = await run_in_threadpool(parse_and_match)
+    except (ET.ParseError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse {statement_format} statement: {str(e)}")
+    
+    if not dry_run:
+        await apply_statement_matches(report["matched"], statement_format, file.filename or "")
+    
+    logger.info(
+        f"Bank statement {file.filename} ({statement_format}): {report['credits']} credits, "
+        f"{len(report['matched'])} invoices marked paid"
+    )
+    return {"format": statement_format, "dry_run": dry_run, **report}
+
+# Job endpoints
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    job = await db.jobs.find_one({"id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return Job(**parse_from_mongo(job))
 
 # Dashboard endpoints
 @api_router.get("/dashboard/top-customers")
@@ -765,11 +4799,23 @@ async def get_top_customers():
                 "invoice_count": {"$sum": 1}
             }
         },
-        {"$sort": {"total_revenue": -1}},
-        {"$limit": 5}
+        {"$sort": {"total_revenue": -1}}
     ]
     
-    top_customers = await db.invoices.aggregate(pipeline).to_list(length=5)
+    totals = {
+        customer_data["_id"]: customer_data
+        for customer_data in await db.invoices.aggregate(pipeline).to_list(length=None)
+    }
+    for rollup in await get_archive_rollups("customer"):
+        customer_data = totals.setdefault(rollup["customer_id"], {
+            "_id": rollup["customer_id"],
+            "customer_name": rollup["customer_name"],
+            "total_revenue": 0,
+            "invoice_count": 0
+        })
+        customer_data["total_revenue"] += rollup["revenue"]
+        customer_data["invoice_count"] += rollup["invoice_count"]
+    top_customers = sorted(totals.values(), key=lambda customer_data: customer_data["total_revenue"], reverse=True)[:5]
     
     # Enhance with customer details
     result = []
@@ -803,14 +4849,18 @@ async def get_monthly_revenue():
     ]
     
     monthly_data = await db.invoices.aggregate(pipeline).to_list(length=None)
+    revenue = {(data["_id"]["year"], data["_id"]["month"]): data["revenue"] for data in monthly_data}
+    for rollup in await get_archive_rollups("month"):
+        key = (rollup["year"], rollup["month"])
+        revenue[key] = revenue.get(key, 0) + rollup["revenue"]
     
     result = []
-    for data in monthly_data:
+    for (year, month), amount in sorted(revenue.items()):
         month_names = ["", "Jan", "Feb", "Mär", "Apr", "Mai", "Jun", 
                       "Jul", "Aug", "Sep", "Okt", "Nov", "Dez"]
         result.append({
-            "month": f"{month_names[data['_id']['month']]} {data['_id']['year']}",
-            "revenue": data["revenue"]
+            "month": f"{month_names[month]} {year}",
+            "revenue": amount
         })
     
     return result
@@ -825,20 +4875,160 @@ async def get_dashboard_stats():
     revenue_result = await db.invoices.aggregate(pipeline).to_list(length=1)
     total_revenue = revenue_result[0]["total"] if revenue_result else 0
     
+    # Archived invoices and quotes are all closed, so they only add to the totals
+    archived = await db.archive_rollups.find_one({"_id": "totals"}) or {}
+    
     # Pending invoices
     pending_invoices = await db.invoices.count_documents({"status": {"$ne": "paid"}})
     
     return {
         "total_customers": total_customers,
-        "total_invoices": total_invoices,
-        "total_revenue": total_revenue,
+        "total_invoices": total_invoices + archived.get("invoice_count", 0),
+        "total_revenue": total_revenue + archived.get("revenue", 0),
         "pending_invoices": pending_invoices,
         "total_todos": await db.todos.count_documents({}),
         "pending_todos": await db.todos.count_documents({"status": "pending"}),
-        "total_quotes": await db.quotes.count_documents({}),
+        "total_quotes": await db.quotes.count_documents({}) + archived.get("quote_count", 0),
         "pending_quotes": await db.quotes.count_documents({"status": {"$in": ["draft", "sent"]}})
     }
 
+# Live dashboard (Server-Sent Events)
+# One DashboardHub computes the dashboard for all open streams. It is woken by
+# in-process writes (sync_write) and, on replica sets, by a Mongo change
+# stream so writes from other workers are seen as well.
+DASHBOARD_COLLECTIONS = ["customers", "invoices", "quotes", "todos"]
+DASHBOARD_DEBOUNCE_SECONDS = float(os.environ.get('DASHBOARD_DEBOUNCE_SECONDS', 0.5))
+DASHBOARD_REFRESH_SECONDS = float(os.environ.get('DASHBOARD_REFRESH_SECONDS', 30))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+
+async def compute_dashboard_state() -> dict:
+    stats, top_customers, monthly_revenue, pending_todos = await asyncio.gather(
+        get_dashboard_stats(),
+        get_top_customers(),
+        get_monthly_revenue(),
+        get_todos(status="pending")
+    )
+    return jsonable_encoder({
+        "stats": stats,
+        "top_customers": top_customers,
+        "monthly_revenue": monthly_revenue,
+        "pending_todos": pending_todos
+    })
+
+def dashboard_delta(old: dict, new: dict) -> dict:
+    """Changed stat keys plus any list section that differs"""
+    delta = {}
+    stats = {key: value for key, value in new["stats"].items() if old["stats"].get(key) != value}
+    if stats:
+        delta["stats"] = stats
+    for section in ("top_customers", "monthly_revenue", "pending_todos"):
+        if new[section] != old[section]:
+            delta[section] = new[section]
+    return delta
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class DashboardHub:
+    """Shares one dashboard computation between all open SSE streams"""
+    def __init__(self):
+        self.subscribers = set()
+        self.state = None
+        self.dirty = asyncio.Event()
+        self.task = None
+    
+    def notify(self):
+        if self.task is not None:
+            self.dirty.set()
+    
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=100)
+        self.subscribers.add(queue)
+        if self.state is not None:
+            queue.put_nowait(format_sse("snapshot", self.state))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self.task is not None:
+            self.task.cancel()
+            self.task = None
+            self.state = None
+    
+    def publish(self, state: dict):
+        if self.state is None:
+            message = format_sse("snapshot", state)
+        else:
+            delta = dashboard_delta(self.state, state)
+            if not delta:
+                return
+            message = format_sse("delta", delta)
+        self.state = state
+        
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and resynchronise with a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(format_sse("snapshot", state))
+    
+    async def watch_changes(self):
+        try:
+            pipeline = [{"$match": {"ns.coll": {"$in": DASHBOARD_COLLECTIONS}}}]
+            async with db.watch(pipeline) as stream:
+                async for _ in stream:
+                    self.dirty.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Standalone servers have no change streams; rely on in-process events
+            logger.info(f"Dashboard change stream unavailable: {str(e)}")
+    
+    async def run(self):
+        watcher = asyncio.create_task(self.watch_changes())
+        self.dirty.set()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.dirty.wait(), timeout=DASHBOARD_REFRESH_SECONDS)
+                    await asyncio.sleep(DASHBOARD_DEBOUNCE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self.dirty.clear()
+                try:
+                    self.publish(await compute_dashboard_state())
+                except Exception as e:
+                    logger.error(f"Dashboard computation failed: {str(e)}")
+        finally:
+            watcher.cancel()
+
+dashboard_hub = DashboardHub()
+
+@api_router.get("/dashboard/stream")
+async def dashboard_stream(request: Request):
+    """SSE feed: a 'snapshot' event followed by 'delta' events on changes"""
+    queue = dashboard_hub.subscribe()
+    
+    async def event_source():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+        finally:
+            dashboard_hub.unsubscribe(queue)
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ToDo endpoints
 @api_router.post("/todos", response_model=ToDo)
 async def create_todo(todo_data: ToDoCreate, background_tasks: BackgroundTasks):
@@ -852,17 +5042,19 @@ async def create_todo(todo_data: ToDoCreate, background_tasks: BackgroundTasks):
     # Parse date
     due_date = datetime.fromisoformat(todo_data.due_date)
     
-    todo = ToDo(
-        title=todo_data.title,
-        description=todo_data.description,
-        customer_id=todo_data.customer_id,
-        customer_name=customer_name,
-        due_date=due_date,
-        due_time=todo_data.due_time
-    )
+    async with sync_write() as updated_seq:
+        todo = ToDo(
+            title=todo_data.title,
+            description=todo_data.description,
+            customer_id=todo_data.customer_id,
+            customer_name=customer_name,
+            due_date=due_date,
+            due_time=todo_data.due_time,
+            updated_seq=updated_seq
+        )
     
-    todo_data_dict = prepare_for_mongo(todo.dict())
-    await db.todos.insert_one(todo_data_dict)
+        todo_data_dict = prepare_for_mongo(todo.dict())
+        await db.todos.insert_one(todo_data_dict)
     
     # Schedule reminder check (will be sent when due)
     logger.info(f"ToDo created: {todo.title} - Due: {due_date.strftime('%d.%m.%Y')} at {todo.due_time}")
@@ -906,6 +5098,10 @@ async def update_todo(todo_id: str, todo_update: ToDoUpdate):
         update_data["due_date"] = datetime.fromisoformat(update_data["due_date"]).isoformat()
     
     # Handle completion
+    new_status = update_data.get("status")
+    if new_status and new_status != existing_todo.get("status"):
+        if existing_todo.get("status") not in STATUS_TRANSITIONS["todos"].get(new_status, ()):
+            raise HTTPException(status_code=400, detail=f"Status cannot change from {existing_todo.get('status')} to {new_status}")
     if update_data.get("status") == "completed" and existing_todo.get("status") != "completed":
         update_data["completed_at"] = datetime.now(timezone.utc).isoformat()
     
@@ -913,10 +5109,12 @@ async def update_todo(todo_id: str, todo_update: ToDoUpdate):
     if "due_date" in update_data or "due_time" in update_data:
         update_data["reminder_sent"] = False
     
-    result = await db.todos.update_one(
-        {"id": todo_id},
-        {"$set": update_data}
-    )
+    async with sync_write() as updated_seq:
+        update_data["updated_seq"] = updated_seq
+        result = await db.todos.update_one(
+            {"id": todo_id},
+            {"$set": update_data}
+        )
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="ToDo not found")
@@ -925,11 +5123,19 @@ async def update_todo(todo_id: str, todo_update: ToDoUpdate):
     updated_todo = await db.todos.find_one({"id": todo_id})
     return ToDo(**parse_from_mongo(updated_todo))
 
+@api_router.post("/todos/status-batch")
+async def update_todo_status_batch(batch_update: ToDoStatusBatchUpdate):
+    """Complete, cancel or reopen many ToDos at once"""
+    return await update_statuses(
+        "todos", batch_update.status, status_batch_query(batch_update), batch_update.ids, batch_update.limit
+    )
+
 @api_router.delete("/todos/{todo_id}")
 async def delete_todo(todo_id: str):
     result = await db.todos.delete_one({"id": todo_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="ToDo not found")
+    await record_deletion("todos", todo_id)
     return {"message": "ToDo deleted successfully"}
 
 @api_router.post("/todos/{todo_id}/send-reminder")
@@ -949,21 +5155,36 @@ async def send_todo_reminder(todo_id: str, background_tasks: BackgroundTasks):
 
 @api_router.get("/todos/due/check")
 async def check_due_todos(background_tasks: BackgroundTasks):
-    """Manually trigger due ToDo check"""
+    """Manually trigger due ToDo check.
+    
+    Runs on whichever worker gets the request; each reminder is claimed
+    atomically before it is sent, so this never duplicates the leader's run.
+    """
     background_tasks.add_task(check_due_todos_task)
     return {"message": "Due ToDo check scheduled"}
 
 # Quote endpoints
 @api_router.post("/quotes", response_model=Quote)
-async def create_quote(quote_data: QuoteCreate, background_tasks: BackgroundTasks):
+async def create_quote(
+    quote_data: QuoteCreate,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await run_idempotent(
+        idempotency_key,
+        "create-quote",
+        quote_data.dict(),
+        lambda: insert_quote(quote_data, background_tasks)
+    )
+
+async def insert_quote(quote_data: QuoteCreate, background_tasks: BackgroundTasks) -> Quote:
     # Get customer info
     customer = await db.customers.find_one({"id": quote_data.customer_id})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
     # Generate quote number
-    quote_count = await db.quotes.count_documents({}) + 1
-    quote_number = f"ANG-{quote_count:04d}"
+    quote_number = format_document_number("ANG", await reserve_document_numbers("quote"))
     
     # Calculate totals
     items = []
@@ -985,50 +5206,63 @@ async def create_quote(quote_data: QuoteCreate, background_tasks: BackgroundTask
     quote_date = datetime.fromisoformat(quote_data.quote_date)
     valid_until = datetime.fromisoformat(quote_data.valid_until)
     
-    quote = Quote(
-        quote_number=quote_number,
-        customer_id=quote_data.customer_id,
-        customer_name=customer["name"],
-        items=items,
-        subtotal=subtotal,
-        tax_amount=tax_amount,
-        total_amount=total_amount,
-        quote_date=quote_date,
-        valid_until=valid_until,
-        notes=quote_data.notes,
-        apply_tax=quote_data.apply_tax,
-        status="draft"
-    )
+    async with sync_write() as updated_seq:
+        quote = Quote(
+            quote_number=quote_number,
+            customer_id=quote_data.customer_id,
+            customer_name=customer["name"],
+            items=items,
+            subtotal=subtotal,
+            tax_amount=tax_amount,
+            total_amount=total_amount,
+            quote_date=quote_date,
+            valid_until=valid_until,
+            notes=quote_data.notes,
+            apply_tax=quote_data.apply_tax,
+            status="draft",
+            updated_seq=updated_seq
+        )
     
-    quote_data_dict = prepare_for_mongo(quote.dict())
-    await db.quotes.insert_one(quote_data_dict)
+        quote_data_dict = prepare_for_mongo(quote.dict())
+        await db.quotes.insert_one(quote_data_dict)
     
     logger.info(f"Quote {quote_number} created for customer {customer['name']}")
     
     return quote
 
-@api_router.get("/quotes", response_model=List[Quote])
-async def get_quotes():
-    quotes = await db.quotes.find().sort("created_at", -1).to_list(length=None)
+@api_router.get("/quotes", response_model=Union[List[Quote], List[QuoteSummary]])
+async def get_quotes(view: Literal["full", "summary"] = "full", include_archived: bool = False):
+    if view == "summary":
+        pipeline = [
+            {"$sort": {"created_at": -1}},
+            {"$project": summary_projection(QuoteSummary)}
+        ]
+        quotes = await find_documents("quotes", pipeline, include_archived)
+        return [QuoteSummary(**parse_from_mongo(quote)) for quote in quotes]
+    
+    quotes = await find_documents("quotes", [{"$sort": {"created_at": -1}}], include_archived)
     return [Quote(**parse_from_mongo(quote)) for quote in quotes]
 
 @api_router.get("/quotes/{quote_id}", response_model=Quote)
 async def get_quote(quote_id: str):
-    quote = await db.quotes.find_one({"id": quote_id})
+    quote = await find_document("quotes", quote_id)
     if not quote:
         raise HTTPException(status_code=404, detail="Quote not found")
     return Quote(**parse_from_mongo(quote))
 
 @api_router.put("/quotes/{quote_id}/status")
-async def update_quote_status(quote_id: str, status: dict):
-    result = await db.quotes.update_one(
-        {"id": quote_id}, 
-        {"$set": {"status": status["status"]}}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Quote not found")
+async def update_quote_status(quote_id: str, status_update: QuoteStatusUpdate):
+    batch = await update_statuses("quotes", status_update.status, {"id": quote_id}, [quote_id], 1)
+    raise_for_status_outcome(batch["results"][0], "Quote not found")
     return {"message": "Quote status updated successfully"}
 
+@api_router.post("/quotes/status-batch")
+async def update_quote_status_batch(batch_update: QuoteStatusBatchUpdate):
+    """Change the status of many quotes at once (conversion stays with convert-batch)"""
+    return await update_statuses(
+        "quotes", batch_update.status, status_batch_query(batch_update), batch_update.ids, batch_update.limit
+    )
+
 @api_router.post("/quotes/{quote_id}/convert-to-invoice")
 async def convert_quote_to_invoice(quote_id: str, background_tasks: BackgroundTasks):
     """Convert accepted quote to invoice"""
@@ -1036,60 +5270,375 @@ async def convert_quote_to_invoice(quote_id: str, background_tasks: BackgroundTa
     if not quote:
         raise HTTPException(status_code=404, detail="Quote not found")
     
+    if quote.get("status") == "converting":
+        raise HTTPException(status_code=409, detail="Quote is already being converted")
     if quote.get("status") != "accepted":
         raise HTTPException(status_code=400, detail="Quote must be accepted before conversion")
     
-    # Generate invoice number
-    invoice_count = await db.invoices.count_documents({}) + 1
-    invoice_number = f"INV-{invoice_count:04d}"
-    
-    # Create invoice from quote
-    invoice_data = {
-        "id": str(uuid.uuid4()),
-        "invoice_number": invoice_number,
-        "customer_id": quote["customer_id"],
-        "customer_name": quote["customer_name"],
-        "items": quote["items"],
-        "subtotal": quote["subtotal"],
-        "tax_rate": quote["tax_rate"],
-        "tax_amount": quote["tax_amount"],
-        "total_amount": quote["total_amount"],
-        "invoice_date": datetime.now(timezone.utc).isoformat(),
-        "due_date": (datetime.now(timezone.utc) + timedelta(days=30)).isoformat(),
-        "status": "draft",
-        "notes": f"Basierend auf {quote['quote_number']}" + (f" - {quote.get('notes', '')}" if quote.get('notes') else ""),
-        "apply_tax": quote.get("apply_tax", True),  # Preserve tax setting from quote
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    
-    # Insert invoice
-    await db.invoices.insert_one(invoice_data)
+    converted = await convert_quotes([quote_id])
+    if not converted:
+        # A parallel request claimed the quote first
+        raise HTTPException(status_code=409, detail="Quote is already being converted")
     
-    # Update quote status and link to invoice
-    await db.quotes.update_one(
-        {"id": quote_id},
-        {"$set": {"status": "converted", "converted_to_invoice_id": invoice_data["id"]}}
-    )
+    result = converted[0]
     
     # Add background task for email sending if configured
     if SMTP_USERNAME and SMTP_PASSWORD:
-        background_tasks.add_task(send_invoice_email_task, invoice_data["id"])
+        background_tasks.add_task(send_invoice_email_task, result["invoice_id"])
     
-    logger.info(f"Quote {quote['quote_number']} converted to invoice {invoice_number}")
+    logger.info(f"Quote {result['quote_number']} converted to invoice {result['invoice_number']}")
     
     return {
         "message": "Quote successfully converted to invoice",
-        "invoice_id": invoice_data["id"],
-        "invoice_number": invoice_number
+        "invoice_id": result["invoice_id"],
+        "invoice_number": result["invoice_number"]
     }
 
+@api_router.post("/quotes/convert-batch")
+async def convert_quote_batch(batch_request: QuoteConversionBatchRequest, background_tasks: BackgroundTasks):
+    """Convert many accepted quotes (or all of them) to invoices in one pass"""
+    converted = await convert_quotes(batch_request.quote_ids, batch_request.limit)
+    
+    if SMTP_USERNAME and SMTP_PASSWORD:
+        for result in converted:
+            background_tasks.add_task(send_invoice_email_task, result["invoice_id"])
+    
+    skipped = []
+    if batch_request.quote_ids:
+        converted_ids = {result["quote_id"] for result in converted}
+        skipped_ids = [quote_id for quote_id in batch_request.quote_ids if quote_id not in converted_ids]
+        existing = await db.quotes.find(
+            {"id": {"$in": skipped_ids}}, {"_id": 0, "id": 1, "status": 1}
+        ).to_list(length=None)
+        statuses = {quote["id"]: quote["status"] for quote in existing}
+        skipped = [
+            {
+                "quote_id": quote_id,
+                "reason": f"status is {statuses[quote_id]}" if quote_id in statuses else "not found"
+            }
+            for quote_id in skipped_ids
+        ]
+    
+    logger.info(f"Batch conversion created {len(converted)} invoices")
+    return {"converted": converted, "skipped": skipped}
+
 @api_router.delete("/quotes/{quote_id}")
 async def delete_quote(quote_id: str):
     result = await db.quotes.delete_one({"id": quote_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Quote not found")
+    await record_deletion("quotes", quote_id)
     return {"message": "Quote deleted successfully"}
 
+# Request profiling
+# Two opt-in diagnostics, both written to a bounded ring of files in
+# PROFILE_DIR and listed under /api/admin/profiles (which, like all admin
+# endpoints, needs "Authorization: Bearer <PROFILE_TOKEN>"):
+# - a request sent with "X-Profile: <PROFILE_TOKEN>" is run under cProfile;
+#   the response carries X-Profile-Id. The token is only accepted as a header
+#   so it stays out of access logs. cProfile sees the whole event loop
+#   thread, so concurrent requests show up in it;
+# - with PROFILE_SLOW_REQUEST_MS set, a background thread samples the stacks of
+#   running requests, and requests slower than that keep their samples as
+#   folded stacks (flamegraph / speedscope input). Samples are attributed per
+#   request: on the event loop thread to the request whose task is running,
+#   on render pool threads to the request that submitted the work. The thread
+#   sleeps while no sampled request is in flight; streaming responses (SSE)
+#   stop being sampled once their headers are sent.
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_RING_SIZE = int(os.environ.get('PROFILE_RING_SIZE', 100))
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0))  # 0 disables the sampler
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 20))
+PROFILE_MAX_STACKS = 5000  # distinct stacks kept per request
+PROFILE_STACK_DEPTH = 64
+PROFILE_ID_PATTERN = re.compile(r"^\d{13}-[0-9a-f]{8}$")
+# Leaf frames of threads that are waiting, not working
+IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("queue.py", "get"), ("thread.py", "_worker")}
+# Samples of the request the current task is serving, read when work is handed to the render pool
+request_samples = contextvars.ContextVar("request_samples", default=None)
+
+class StackSampler:
+    """Samples the stacks of sampled requests while at least one is in flight"""
+    def __init__(self, interval_seconds: float):
+        self.interval = interval_seconds
+        self.requests = {}       # asyncio task -> Counter of folded stacks
+        self.thread_owners = {}  # render thread id -> (thread name, Counter of the request it works for)
+        self.loop = None
+        self.loop_thread = None
+        self.wake = threading.Event()
+        self.thread = None
+    
+    def request_started(self, task) -> Counter:
+        samples = Counter()
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = (threading.get_ident(), threading.current_thread().name)
+        self.requests[task] = samples
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+            self.thread.start()
+        self.wake.set()
+        return samples
+    
+    def request_finished(self, task):
+        self.requests.pop(task, None)
+    
+    def attributed(self, func):
+        """Wrap func so the thread that runs it is sampled for the current request"""
+        samples = request_samples.get()
+        if samples is None:
+            return func
+        
+        def run_for_request(*args):
+            thread_id = threading.get_ident()
+            self.thread_owners[thread_id] = (threading.current_thread().name, samples)
+            try:
+                return func(*args)
+            finally:
+                self.thread_owners.pop(thread_id, None)
+        return run_for_request
+    
+    @staticmethod
+    def fold(frame) -> Optional[str]:
+        code = frame.f_code
+        if (Path(code.co_filename).name, code.co_name) in IDLE_FRAMES:
+            return None
+        names = []
+        while frame is not None and len(names) < PROFILE_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{Path(code.co_filename).stem}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+    
+    def run(self):
+        while True:
+            if not self.requests:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            frames = sys._current_frames()
+            owners = list(self.thread_owners.items())
+            running = asyncio.current_task(self.loop)
+            if running in self.requests:
+                loop_thread_id, loop_thread_name = self.loop_thread
+                owners.append((loop_thread_id, (loop_thread_name, self.requests[running])))
+            for thread_id, (thread_name, samples) in owners:
+                frame = frames.get(thread_id)
+                stack = self.fold(frame) if frame is not None else None
+                if stack and (stack in samples or len(samples) < PROFILE_MAX_STACKS):
+                    samples[f"{thread_name};{stack}"] += 1
+            time.sleep(self.interval)
+
+stack_sampler = StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+profiling_state = {"active": False}  # only one cProfile profiler can run at a time
+
+def require_admin_token(authorization: Optional[str] = Header(None)):
+    """Admin endpoints need "Authorization: Bearer <PROFILE_TOKEN>" and are off without a token"""
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled, set PROFILE_TOKEN")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), PROFILE_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+def new_profile_id() -> str:
+    return f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+
+def write_profile(profile_id: str, meta: dict, report: str, raw_stats=None):
+    """Add an entry to the profile ring and drop the oldest beyond PROFILE_RING_SIZE"""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    if raw_stats is not None:
+        raw_stats.dump_stats(str(PROFILE_DIR / f"{profile_id}.prof"))
+    temp_path = PROFILE_DIR / f".{profile_id}.tmp"
+    temp_path.write_text(json.dumps({**meta, "report": report}), encoding="utf-8")
+    temp_path.replace(PROFILE_DIR / f"{profile_id}.json")
+    
+    entries = sorted(PROFILE_DIR.glob("*.json"))
+    for stale in entries[:max(0, len(entries) - PROFILE_RING_SIZE)]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix(".prof").unlink(missing_ok=True)
+
+def cprofile_report(profiler) -> str:
+    import pstats
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(60)
+    return output.getvalue()
+
+def requested_profile_token(scope) -> Optional[bytes]:
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            return value
+    return None
+
+class ProfilingMiddleware:
+    """ASGI middleware for on-demand cProfile runs and the slow-request sampler"""
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        profiler = None
+        token = requested_profile_token(scope) if PROFILE_TOKEN else None
+        if token and not profiling_state["active"] and hmac.compare_digest(token, PROFILE_TOKEN.encode()):
+            import cProfile
+            profiling_state["active"] = True
+            profiler = cProfile.Profile()
+        profile_id = new_profile_id() if profiler else None
+        response = {"status": None, "streaming": False}
+        task = asyncio.current_task()
+        samples = stack_sampler.request_started(task) if PROFILE_SLOW_REQUEST_MS > 0 else None
+        samples_token = request_samples.set(samples)
+        
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                headers = MutableHeaders(scope=message)
+                response["streaming"] = headers.get("content-type", "").startswith("text/event-stream")
+                if response["streaming"] and samples is not None:
+                    # Long-lived streams are not profiled, and must not keep the sampler awake
+                    stack_sampler.request_finished(task)
+                if profile_id:
+                    headers["X-Profile-Id"] = profile_id
+            await send(message)
+        
+        started = time.monotonic()
+        try:
+            if profiler:
+                profiler.enable()
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiling_state["active"] = False
+            finished = time.monotonic()
+            if samples is not None:
+                stack_sampler.request_finished(task)
+            request_samples.reset(samples_token)
+            duration_ms = (finished - started) * 1000
+            meta = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": response["status"],
+                "duration_ms": round(duration_ms, 1),
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }
+            if profiler:
+                await run_in_threadpool(
+                    write_profile, profile_id, {**meta, "id": profile_id, "kind": "cprofile"},
+                    cprofile_report(profiler), profiler
+                )
+            elif samples is not None and duration_ms >= PROFILE_SLOW_REQUEST_MS and not response["streaming"]:
+                # dict() copies in one step, the sampler thread may still add a last sample
+                stacks = Counter(dict(samples))
+                if stacks:
+                    sampled_id = new_profile_id()
+                    folded = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+                    await run_in_threadpool(
+                        write_profile, sampled_id,
+                        {**meta, "id": sampled_id, "kind": "sampled", "samples": sum(stacks.values())},
+                        folded
+                    )
+                    logger.warning(f"Slow request {scope['method']} {scope['path']} took {duration_ms:.0f} ms, profile {sampled_id}")
+
+# Health endpoint
+@api_router.get("/health")
+async def health():
+    """Liveness of this worker and its dependencies; 503 only if MongoDB is unreachable"""
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=5)
+        database = {"status": "ok"}
+    except Exception as e:
+        database = {"status": "unavailable", "error": f"{type(e).__name__}: {e}"}
+    spooled, dead = await run_in_threadpool(lambda: (mail_spool.count(), mail_spool.count(dead=True)))
+    smtp = {
+        "configured": bool(SMTP_USERNAME and SMTP_PASSWORD),
+        **smtp_breaker.snapshot(),
+        "spooled": spooled,
+        "dead_letters": dead
+    }
+    status = "ok"
+    if database["status"] != "ok":
+        status = "unavailable"
+    elif smtp["state"] != "closed" or spooled:
+        status = "degraded"
+    return JSONResponse(
+        status_code=503 if status == "unavailable" else 200,
+        content={"status": status, "instance": INSTANCE_ID, "database": database, "smtp": smtp}
+    )
+
+# Admin endpoints
+@api_router.get("/admin/metrics/templates", dependencies=[Depends(require_admin_token)])
+async def get_template_metrics():
+    """Render timings of the email templates since startup"""
+    return {
+        name: {
+            **stats,
+            "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+        }
+        for name, stats in template_render_stats.items()
+    }
+
+@api_router.get("/admin/metrics/queries", dependencies=[Depends(require_admin_token)])
+async def get_query_metrics(
+    sort_by: Literal["total_ms", "max_ms", "avg_ms", "count", "docs_returned"] = "total_ms",
+    limit: int = Query(20, ge=1, le=MONGO_QUERY_SHAPES_LIMIT)
+):
+    """Top query shapes since startup (or the last reset) on this worker"""
+    with query_stats.lock:
+        shapes = [
+            {
+                "shape": shape,
+                **stats,
+                "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+            }
+            for shape, stats in query_stats.shapes.items()
+        ]
+    shapes.sort(key=lambda entry: entry[sort_by], reverse=True)
+    return {"slow_query_ms": MONGO_SLOW_QUERY_MS, "shapes": shapes[:limit]}
+
+@api_router.delete("/admin/metrics/queries", dependencies=[Depends(require_admin_token)])
+async def reset_query_metrics():
+    query_stats.reset()
+    return {"message": "Query statistics reset"}
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin_token)])
+async def list_profiles(kind: Optional[Literal["cprofile", "sampled"]] = None, limit: int = Query(50, ge=1, le=1000)):
+    """Newest entries of the profile ring, without their reports"""
+    def read_entries():
+        entries = []
+        for path in sorted(PROFILE_DIR.glob("*.json"), reverse=True):
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue  # dropped from the ring while listing
+            entry.pop("report", None)
+            if kind is None or entry["kind"] == kind:
+                entries.append(entry)
+            if len(entries) >= limit:
+                break
+        return entries
+    return await run_in_threadpool(read_entries)
+
+@api_router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def get_profile(
+    profile_id: str,
+    profile_format: Literal["json", "text", "prof"] = Query("json", alias="format")
+):
+    """A profile as JSON, as plain text (pstats table or folded stacks) or as raw pstats data"""
+    path = PROFILE_DIR / f"{profile_id}.json"
+    if not PROFILE_ID_PATTERN.match(profile_id) or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if profile_format == "prof":
+        raw_path = path.with_suffix(".prof")
+        if not raw_path.exists():
+            raise HTTPException(status_code=404, detail="Only cProfile runs have raw stats")
+        return FileResponse(raw_path, media_type="application/octet-stream", filename=raw_path.name)
+    entry = json.loads(await run_in_threadpool(path.read_text, "utf-8"))
+    if profile_format == "text":
+        return Response(content=entry["report"], media_type="text/plain; charset=utf-8")
+    return entry
+
 # Include router
 app.include_router(api_router)
 
@@ -1100,6 +5649,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ProfilingMiddleware)
+
+# Collections whose documents are looked up by their "id" field
+ID_INDEXED_COLLECTIONS = ["customers", "invoices", "quotes", "todos", "recurring_invoices", "jobs", "dunning_notices"]
 
 # Configure logging
 logging.basicConfig(
@@ -1108,6 +5661,85 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def warm_up_resources():
+    """Open the Mongo connection pool and compile the email templates before
+    serving traffic"""
+    try:
+        hello = await client.admin.command("hello")
+        mongo_features["transactions"] = "setName" in hello or hello.get("msg") == "isdbgrid"
+    except Exception as e:
+        logger.error(f"MongoDB warm-up failed: {str(e)}")
+    load_email_templates()
+
+async def ensure_indexes():
+    for name in ID_INDEXED_COLLECTIONS:
+        await db[name].create_index("id", unique=True)
+    for name in SYNC_COLLECTIONS:
+        await db[name].create_index("updated_seq")
+    await db.sync_tombstones.create_index("updated_seq")
+    await db.sync_tombstones.create_index("deleted_at", expireAfterSeconds=SYNC_TOMBSTONE_TTL_DAYS * 86400)
+    await db.sync_checkpoints.create_index("created_at")
+    for name in CUSTOMER_DEPENDENT_COLLECTIONS:
+        await db[name].create_index("customer_id")
+    await db.invoices.create_index([("status", 1), ("due_date", 1)])
+    await db.dunning_notices.create_index("invoice_id")
+    await db.invoices.create_index("invoice_date")
+    await db.invoices.create_index([("customer_id", 1), ("invoice_date", 1)])
+    await db.payments.create_index("invoice_id")
+    await db.quotes.create_index([("status", 1), ("quote_date", 1)])
+    await db.invoices.create_index("converted_from_quote_id", sparse=True)
+    for collection in ARCHIVED_COLLECTIONS:
+        archive = db[f"{collection}_archive"]
+        await archive.create_index("id", unique=True)
+        await archive.create_index("customer_id")
+        if collection == "invoices":
+            await archive.create_index("invoice_date")
+            await archive.create_index([("customer_id", 1), ("invoice_date", 1)])
+        await archive.create_index("created_at")
+    await db.recurring_invoices.create_index([("active", 1), ("next_run_date", 1)])
+    await db.invoices.create_index(
+        [("recurring_invoice_id", 1), ("recurring_period", 1)],
+        unique=True,
+        partialFilterExpression={"recurring_invoice_id": {"$exists": True}}
+    )
+    await db.idempotency_keys.create_index(
+        "created_at",
+        expireAfterSeconds=IDEMPOTENCY_TTL_HOURS * 3600
+    )
+
+async def startup_resources(app: FastAPI):
+    global render_pool, email_service
+    query_stats.loop = asyncio.get_running_loop()
+    open_database()
+    app.state.db = db
+    email_service = app.state.email_service = EmailService()
+    render_pool = ThreadPoolExecutor(max_workers=PDF_RENDER_WORKERS, thread_name_prefix="pdf-render")
+    await warm_up_resources()
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Index creation failed: {str(e)}")
+    app.state.scheduler_task = None
+    if SCHEDULER_ENABLED:
+        app.state.scheduler_task = asyncio.create_task(run_scheduler())
+        logger.info(f"Scheduler started on worker {INSTANCE_ID}")
+
+async def shutdown_resources(app: FastAPI):
+    global render_pool, email_service
+    scheduler_task = getattr(app.state, "scheduler_task", None)
+    if scheduler_task:
+        scheduler_task.cancel()
+        try:
+            await scheduler_task
+        except asyncio.CancelledError:
+            pass
+        try:
+            await release_leadership()
+        except Exception as e:
+            logger.error(f"Failed to release scheduler lease: {str(e)}")
+    if render_pool is not None:
+        render_pool.shutdown(wait=False)
+        render_pool = None
+    close_database()
+    email_service = app.state.email_service = None
+    app.state.db = None
\ No newline at end of file
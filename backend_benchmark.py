@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+# server.py reads these at import time; the benchmark never touches MongoDB
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+COMPANY = dict(server.DEFAULT_COMPANY)
+CUSTOMER = {
+    "name": "Test Kunde GmbH",
+    "email": "test@kunde.de",
+    "address": "Teststraße 123",
+    "postal_code": "12345",
+    "city": "Berlin"
+}
+
+def make_invoice(item_count):
+    items = [
+        {
+            "description": f"Position {i} - Webentwicklung & Beratung",
+            "quantity": 1.5,
+            "unit_price": 85.0,
+            "total_price": 127.5
+        }
+        for i in range(item_count)
+    ]
+    subtotal = 127.5 * item_count
+    return {
+        "invoice_number": "INV-0001",
+        "items": items,
+        "subtotal": subtotal,
+        "tax_rate": 19.0,
+        "tax_amount": subtotal * 0.19,
+        "total_amount": subtotal * 1.19,
+        "invoice_date": "2026-09-01T00:00:00",
+        "due_date": "2026-10-01T00:00:00",
+        "apply_tax": True
+    }
+
+def baseline_generate_invoice_pdf(invoice, customer, company):
+    """EmailService.generate_invoice_pdf as it was before the cached fragments, kept as the reference"""
+    import io
+    from datetime import datetime
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    story = []
+    
+    story.append(Paragraph(f"<b>{company['company_name']}</b>", styles['Title']))
+    story.append(Paragraph(f"{company['address']}<br/>{company['postal_code']} {company['city']}", styles['Normal']))
+    story.append(Spacer(1, 20))
+    
+    story.append(Paragraph(f"<b>RECHNUNG {invoice['invoice_number']}</b>", styles['Heading1']))
+    story.append(Spacer(1, 12))
+    
+    story.append(Paragraph("<b>Rechnungsadresse:</b>", styles['Normal']))
+    story.append(Paragraph(f"{customer['name']}<br/>{customer['address']}<br/>{customer['postal_code']} {customer['city']}", styles['Normal']))
+    story.append(Spacer(1, 20))
+    
+    invoice_date = datetime.fromisoformat(invoice['invoice_date']).strftime('%d.%m.%Y')
+    due_date = datetime.fromisoformat(invoice['due_date']).strftime('%d.%m.%Y')
+    details_table = Table([
+        ['Rechnungsdatum:', invoice_date],
+        ['Fälligkeitsdatum:', due_date]
+    ], colWidths=[100, 100])
+    details_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ]))
+    story.append(details_table)
+    story.append(Spacer(1, 20))
+    
+    table_data = [['Pos.', 'Beschreibung', 'Menge', 'Einzelpreis', 'Gesamt']]
+    for i, item in enumerate(invoice['items'], 1):
+        table_data.append([
+            str(i),
+            item['description'],
+            f"{item['quantity']:.2f}",
+            f"€{item['unit_price']:.2f}",
+            f"€{item['total_price']:.2f}"
+        ])
+    items_table = Table(table_data, colWidths=[30, 200, 60, 80, 80])
+    items_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(items_table)
+    story.append(Spacer(1, 20))
+    
+    totals_table = Table([
+        ['Zwischensumme:', f"€{invoice['subtotal']:.2f}"],
+        ['MwSt. (19%):', f"€{invoice['tax_amount']:.2f}"],
+        ['<b>Gesamtbetrag:</b>', f"<b>€{invoice['total_amount']:.2f}</b>"]
+    ], colWidths=[300, 100])
+    totals_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
+    ]))
+    story.append(totals_table)
+    
+    story.append(Spacer(1, 30))
+    footer_text = f"""
+    <b>Zahlungshinweise:</b><br/>
+    Bitte überweisen Sie den Betrag bis zum {due_date}.<br/>
+    Bank: {company.get('bank_name', 'N/A')}<br/>
+    IBAN: {company.get('iban', 'N/A')}<br/>
+    BIC: {company.get('bic', 'N/A')}<br/>
+    Verwendungszweck: {invoice['invoice_number']}
+    """
+    story.append(Paragraph(footer_text, styles['Normal']))
+    
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+def clear_caches():
+    pdf_rendering = server.load_pdf_rendering()
+    pdf_rendering.get_pdf_styles.cache_clear()
+    pdf_rendering._build_company_pdf_fragments.cache_clear()
+
+def render_cold(invoice, customer, company):
+    clear_caches()
+    return server.render_invoice_pdf(invoice, customer, company)
+
+RENDERERS = {
+    "baseline": baseline_generate_invoice_pdf,
+    "cold fragment cache": render_cold,
+    "warm fragment cache": server.render_invoice_pdf,
+}
+
+def benchmark(item_count, rounds):
+    """Median per renderer; the renderers take turns each round so machine noise hits all of them alike"""
+    invoice = make_invoice(item_count)
+    timings = {name: [] for name in RENDERERS}
+    sizes = {}
+    for _ in range(rounds):
+        for name, render in RENDERERS.items():
+            started = time.perf_counter()
+            pdf = render(invoice, CUSTOMER, COMPANY)
+            timings[name].append((time.perf_counter() - started) * 1000)
+            sizes[name] = len(pdf.getvalue()) // 1024
+    medians = {}
+    for name, values in timings.items():
+        values.sort()
+        medians[name] = values[len(values) // 2]
+        label = f"{item_count} items, {name}"
+        print(f"{label:<40} median {medians[name]:8.2f} ms   min {values[0]:8.2f} ms   {sizes[name]} KB")
+    return medians
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"📄 Invoice PDF render benchmark ({rounds} rounds)")
+
+    regressions = 0
+    for item_count in (5, 300):
+        medians = benchmark(item_count, rounds)
+        baseline = medians["baseline"]
+        print(f"   Speedup over baseline: {baseline / medians['cold fragment cache']:.2f}x cold, "
+              f"{baseline / medians['warm fragment cache']:.2f}x warm")
+        if medians["warm fragment cache"] >= baseline:
+            print("   ❌ Warm render is not faster than the baseline")
+            regressions += 1
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
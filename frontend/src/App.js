@@ -319,38 +319,44 @@ const Dashboard = () => {
   const [upcomingTodos, setUpcomingTodos] = useState([]);
 
   useEffect(() => {
-    fetchDashboardData();
+    // The stream is the only data source: a 'snapshot' event seeds the whole
+    // dashboard on every (re)connect, 'delta' events then carry the changes
+    const source = new EventSource(`${API}/dashboard/stream`);
+    const applySnapshot = (event) => {
+      const data = JSON.parse(event.data);
+      setStats(data.stats);
+      setTopCustomers(data.top_customers);
+      setMonthlyRevenue(data.monthly_revenue);
+      setUpcomingTodos(getUpcomingTodos(data.pending_todos));
+    };
+    const applyDelta = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.stats) setStats((previous) => ({ ...previous, ...data.stats }));
+      if (data.top_customers) setTopCustomers(data.top_customers);
+      if (data.monthly_revenue) setMonthlyRevenue(data.monthly_revenue);
+      if (data.pending_todos) setUpcomingTodos(getUpcomingTodos(data.pending_todos));
+    };
+    source.addEventListener('snapshot', applySnapshot);
+    source.addEventListener('delta', applyDelta);
+    source.onerror = () => {
+      // EventSource reconnects by itself; CLOSED means it gave up
+      if (source.readyState === EventSource.CLOSED) {
+        toast.error('Fehler beim Laden der Dashboard-Daten');
+      }
+    };
+
+    return () => source.close();
   }, []);
 
-  const fetchDashboardData = async () => {
-    try {
-      const [customersRes, revenueRes, statsRes, todosRes] = await Promise.all([
-        axios.get(`${API}/dashboard/top-customers`),
-        axios.get(`${API}/dashboard/monthly-revenue`),
-        axios.get(`${API}/dashboard/stats`),
-        axios.get(`${API}/todos?status=pending`)
-      ]);
-      
-      setTopCustomers(customersRes.data);
-      setMonthlyRevenue(revenueRes.data);
-      setStats(statsRes.data);
-      
-      // Get upcoming todos (next 5)
-      const sortedTodos = todosRes.data
-        .sort((a, b) => new Date(`${a.due_date}T${a.due_time}`) - new Date(`${b.due_date}T${b.due_time}`))
-        .slice(0, 5);
-      setUpcomingTodos(sortedTodos);
-    } catch (error) {
-      console.error('Error fetching dashboard data:', error);
-      toast.error('Fehler beim Laden der Dashboard-Daten');
-    }
-  };
+  // Get upcoming todos (next 5)
+  const getUpcomingTodos = (todos) => todos
+    .sort((a, b) => new Date(`${a.due_date}T${a.due_time}`) - new Date(`${b.due_date}T${b.due_time}`))
+    .slice(0, 5);
 
   const markTodoCompleted = async (todoId) => {
     try {
       await axios.put(`${API}/todos/${todoId}`, { status: 'completed' });
       toast.success('ToDo als erledigt markiert');
-      fetchDashboardData();
     } catch (error) {
       console.error('Error updating todo:', error);
       toast.error('Fehler beim Aktualisieren des ToDos');
@@ -529,7 +535,6 @@ const Dashboard = () => {
                 </DialogHeader>
                 <InvoiceForm onSuccess={() => {
                   setShowInvoiceDialog(false);
-                  fetchDashboardData();
                 }} />
               </DialogContent>
             </Dialog>
@@ -1388,9 +1393,10 @@ const InvoicesPage = () => {
     fetchCustomers();
   }, []);
 
+  // The list only needs the summary; items are loaded when an invoice is opened
   const fetchInvoices = async () => {
     try {
-      const response = await axios.get(`${API}/invoices`);
+      const response = await axios.get(`${API}/invoices?view=summary`);
       setInvoices(response.data);
     } catch (error) {
       console.error('Error fetching invoices:', error);
@@ -1398,6 +1404,17 @@ const InvoicesPage = () => {
     }
   };
 
+  const openInvoice = async (invoiceId, print = false) => {
+    try {
+      const response = await axios.get(`${API}/invoices/${invoiceId}`);
+      setSelectedInvoice(response.data);
+      setShowPrintDialog(print);
+    } catch (error) {
+      console.error('Error fetching invoice:', error);
+      toast.error('Fehler beim Laden der Rechnung');
+    }
+  };
+
   const fetchCompanyData = async () => {
     try {
       const response = await axios.get(`${API}/company`);
@@ -1482,7 +1499,7 @@ const InvoicesPage = () => {
                   <div className="flex items-center space-x-6 text-sm text-slate-400">
                     <span>Datum: {new Date(invoice.invoice_date).toLocaleDateString('de-DE')}</span>
                     <span>Fällig: {new Date(invoice.due_date).toLocaleDateString('de-DE')}</span>
-                    <span>{invoice.items.length} Position(en)</span>
+                    <span>{invoice.item_count} Position(en)</span>
                   </div>
                 </div>
                 <div className="text-right space-y-2">
@@ -1503,7 +1520,7 @@ const InvoicesPage = () => {
                     <Button
                       variant="outline"
                       size="sm"
-                      onClick={() => setSelectedInvoice(invoice)}
+                      onClick={() => openInvoice(invoice.id)}
                       className="border-slate-600 text-slate-200 hover:bg-slate-700"
                     >
                       <Eye className="h-4 w-4" />
@@ -1511,10 +1528,7 @@ const InvoicesPage = () => {
                     <Button
                       variant="outline"
                       size="sm"
-                      onClick={() => {
-                        setSelectedInvoice(invoice);
-                        setShowPrintDialog(true);
-                      }}
+                      onClick={() => openInvoice(invoice.id, true)}
                       className="border-slate-600 text-slate-200 hover:bg-slate-700"
                     >
                       <Printer className="h-4 w-4" />
@@ -1925,9 +1939,10 @@ const QuotesPage = () => {
     fetchCompanyData();
   }, []);
 
+  // The list only needs the summary; items are loaded when a quote is opened
   const fetchQuotes = async () => {
     try {
-      const response = await axios.get(`${API}/quotes`);
+      const response = await axios.get(`${API}/quotes?view=summary`);
       setQuotes(response.data);
     } catch (error) {
       console.error('Error fetching quotes:', error);
@@ -1935,6 +1950,17 @@ const QuotesPage = () => {
     }
   };
 
+  const openQuote = async (quoteId, print = false) => {
+    try {
+      const response = await axios.get(`${API}/quotes/${quoteId}`);
+      setSelectedQuote(response.data);
+      setShowPrintDialog(print);
+    } catch (error) {
+      console.error('Error fetching quote:', error);
+      toast.error('Fehler beim Laden des Angebots');
+    }
+  };
+
   const fetchCustomers = async () => {
     try {
       const response = await axios.get(`${API}/customers`);
@@ -2035,7 +2061,7 @@ const QuotesPage = () => {
                   <div className="flex items-center space-x-6 text-sm text-slate-400">
                     <span>Datum: {new Date(quote.quote_date).toLocaleDateString('de-DE')}</span>
                     <span>Gültig bis: {new Date(quote.valid_until).toLocaleDateString('de-DE')}</span>
-                    <span>{quote.items.length} Position(en)</span>
+                    <span>{quote.item_count} Position(en)</span>
                   </div>
                 </div>
                 <div className="text-right space-y-2">
@@ -2070,7 +2096,7 @@ const QuotesPage = () => {
                     <Button
                       variant="outline"
                       size="sm"
-                      onClick={() => setSelectedQuote(quote)}
+                      onClick={() => openQuote(quote.id)}
                       className="border-slate-600 text-slate-200 hover:bg-slate-700"
                     >
                       <Eye className="h-4 w-4" />
@@ -2079,10 +2105,7 @@ const QuotesPage = () => {
                     <Button
                       variant="outline"
                       size="sm"
-                      onClick={() => {
-                        setSelectedQuote(quote);
-                        setShowPrintDialog(true);
-                      }}
+                      onClick={() => openQuote(quote.id, true)}
                       className="border-slate-600 text-slate-200 hover:bg-slate-700"
                     >
                       <Printer className="h-4 w-4" />
@@ -0,0 +1,74 @@
+"""Shared fixtures for the API behaviour tests.
+
+The app runs in-process through Starlette's TestClient on an in-memory MongoDB
+(mongomock-motor), with the scheduler switched off so tests trigger background
+work themselves. Each test gets an empty database.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+@pytest.fixture
+def server():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "api_test")
+    os.environ["SCHEDULER_ENABLED"] = "false"
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    import server as server_module
+
+    # The lifespan opens the database through this factory; one in-memory
+    # client per test keeps the data across app restarts within the test
+    mongo_client = mongomock_motor.AsyncMongoMockClient()
+    server_module.create_database_client = lambda: mongo_client
+    server_module.payment_delay_model.update(built_at=float("-inf"), model=None)
+    return server_module
+
+
+@pytest.fixture
+def api(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+def create_customer(api, name="Muster GmbH", **fields):
+    payload = {"name": name, "email": "kunde@example.de", "address": "Hauptstr. 1",
+               "postal_code": "10115", "city": "Berlin", **fields}
+    response = api.post("/api/customers", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create_invoice(api, customer_id, invoice_date="2026-09-15", quantity=1, unit_price=100.0, **fields):
+    payload = {
+        "customer_id": customer_id,
+        "items": [{"type": "service", "unit": "h", "description": "Beratung",
+                   "quantity": quantity, "unit_price": unit_price}],
+        "invoice_date": invoice_date,
+        "due_date": invoice_date,
+        **fields
+    }
+    response = api.post("/api/invoices", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def create_quote(api, customer_id, quote_date="2026-09-01", unit_price=250.0):
+    payload = {
+        "customer_id": customer_id,
+        "items": [{"type": "service", "unit": "h", "description": "Planung",
+                   "quantity": 2, "unit_price": unit_price}],
+        "quote_date": quote_date,
+        "valid_until": quote_date
+    }
+    response = api.post("/api/quotes", json=payload)
+    assert response.status_code == 200, response.text
+    return response.json()
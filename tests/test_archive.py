@@ -0,0 +1,108 @@
+"""Archived invoices stay part of reports and stay reachable by id."""
+from datetime import datetime, timedelta, timezone
+
+from tests.conftest import create_customer, create_invoice
+
+
+def mark_paid(api, invoice, paid_at):
+    response = api.put(f"/api/invoices/{invoice['id']}/status", json={"status": "paid", "paid_at": paid_at})
+    assert response.status_code == 200, response.text
+
+
+def run_archive(api, server, as_of=None):
+    async def archive():
+        job = await server.create_job("archive-run")
+        await server.run_archive_job(job.id, as_of)
+        return await server.db.invoices_archive.count_documents({})
+    return api.portal.call(archive)
+
+
+def test_vat_report_counts_archived_invoices(api, server):
+    customer = create_customer(api)
+    paid = create_invoice(api, customer["id"], invoice_date="2024-05-10", unit_price=100.0)
+    mark_paid(api, paid, "2024-05-20")
+    open_invoice = create_invoice(api, customer["id"], invoice_date="2024-05-12", unit_price=50.0)
+    api.put(f"/api/invoices/{open_invoice['id']}/status", json={"status": "sent"})
+
+    assert run_archive(api, server) == 1
+
+    report = api.get("/api/reports/vat", params={"period": "2024-05"}).json()
+    assert report["closed"] is True
+    assert report["invoice_count"] == 2
+    assert report["taxable_revenue"] == 150.0
+    assert report["total_tax"] == 28.5
+
+
+def test_open_vat_period_keeps_invoices_archived_since_last_refresh(api, server):
+    customer = create_customer(api)
+    today = datetime.now(timezone.utc).date().isoformat()
+    invoice = create_invoice(api, customer["id"], invoice_date=today, unit_price=200.0)
+    mark_paid(api, invoice, today)
+    period = today[:7]
+
+    before = api.get("/api/reports/vat", params={"period": period}).json()
+    assert before["closed"] is False and before["total_tax"] == 38.0
+
+    assert run_archive(api, server, as_of=datetime.now(timezone.utc) + timedelta(days=400)) == 1
+    after = api.get("/api/reports/vat", params={"period": period}).json()
+    assert after["invoice_count"] == 1
+    assert after["total_tax"] == 38.0
+
+
+def test_reports_frozen_by_an_older_version_are_recomputed(api, server):
+    customer = create_customer(api)
+    invoice = create_invoice(api, customer["id"], invoice_date="2024-03-05", unit_price=100.0)
+    api.put(f"/api/invoices/{invoice['id']}/status", json={"status": "sent"})
+    api.portal.call(lambda: server.db.vat_reports.insert_one({
+        "_id": "2024-03", "closed": True, "report": {"period": "2024-03", "invoice_count": 0, "total_tax": 0.0}
+    }))
+
+    report = api.get("/api/reports/vat", params={"period": "2024-03"}).json()
+    assert report["invoice_count"] == 1
+    assert report["total_tax"] == 19.0
+
+
+def test_aging_report_as_of_a_past_date_includes_archived_invoices(api, server):
+    customer = create_customer(api)
+    invoice = create_invoice(api, customer["id"], invoice_date="2023-01-10", unit_price=100.0)
+    mark_paid(api, invoice, "2023-06-30")
+    assert run_archive(api, server) == 1
+
+    report = api.get("/api/reports/aging", params={"as_of": "2023-03-01"}).json()
+    assert report["total_open"] == 119.0
+    assert report["customers"][0]["customer_id"] == customer["id"]
+
+
+def test_archived_invoice_keeps_its_einvoice(api, server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "ARTIFACT_DIR", tmp_path)
+    customer = create_customer(api)
+    invoice = create_invoice(api, customer["id"], invoice_date="2023-01-10")
+    mark_paid(api, invoice, "2023-01-30")
+    assert run_archive(api, server) == 1
+
+    response = api.get(f"/api/invoices/{invoice['id']}/einvoice")
+    assert response.status_code == 200
+    assert invoice["invoice_number"].encode() in response.content
+
+    batch = api.post("/api/invoices/einvoice-batch", json={"invoice_ids": [invoice["id"]]}).json()
+    job = api.get(f"/api/jobs/{batch['job_id']}").json()
+    assert job["status"] == "completed"
+    assert [artifact["invoice_id"] for artifact in job["result"]["artifacts"]] == [invoice["id"]]
+
+
+def test_archived_invoice_of_a_deleted_customer_keeps_its_einvoice(api, server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "ARTIFACT_DIR", tmp_path)
+    customer = create_customer(api, address="Lindenweg 7")
+    invoice = create_invoice(api, customer["id"], invoice_date="2023-01-10")
+    mark_paid(api, invoice, "2023-01-30")
+    assert run_archive(api, server) == 1
+    assert api.delete(f"/api/customers/{customer['id']}").status_code == 200
+
+    response = api.get(f"/api/invoices/{invoice['id']}/einvoice")
+    assert response.status_code == 200
+    assert b"Muster GmbH" in response.content
+    assert b"Lindenweg 7" in response.content
+
+    batch = api.post("/api/invoices/einvoice-batch", json={"invoice_ids": [invoice["id"]]}).json()
+    job = api.get(f"/api/jobs/{batch['job_id']}").json()
+    assert [artifact["invoice_id"] for artifact in job["result"]["artifacts"]] == [invoice["id"]]
@@ -0,0 +1,65 @@
+"""Response compression on /api routes: negotiated encoding, Vary header, off-loop compression."""
+import gzip
+import threading
+
+import pytest
+
+from tests.conftest import create_customer
+
+
+@pytest.fixture
+def many_customers(api):
+    for i in range(20):
+        create_customer(api, name=f"Kunde {i:02d} mit einem recht langen Namen")
+
+
+def test_large_json_is_gzipped_with_vary(api, many_customers):
+    response = api.get("/api/customers", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()) == 20
+
+
+async def current_thread():
+    return threading.current_thread()
+
+
+def test_compression_runs_off_the_event_loop(api, server, many_customers, monkeypatch):
+    threads = []
+    compress_body = server.compress_body
+
+    def recording_compress_body(body, encoding):
+        threads.append(threading.current_thread())
+        return compress_body(body, encoding)
+
+    monkeypatch.setattr(server, "compress_body", recording_compress_body)
+    loop_thread = api.portal.call(current_thread)
+    response = api.get("/api/customers", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert threads and threads[0] is not loop_thread
+
+
+def test_brotli_is_preferred_when_available(api, server, many_customers):
+    if server.brotli is None:
+        pytest.skip("brotli is not installed")
+    response = api.get("/api/customers", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_identity_and_small_responses_are_not_compressed(api, many_customers):
+    response = api.get("/api/customers", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+
+    small = api.get("/api/todos", headers={"Accept-Encoding": "gzip"})
+    assert small.json() == []
+    assert "content-encoding" not in small.headers
+    assert "Accept-Encoding" in small.headers["vary"]
+
+
+def test_gzip_body_round_trips(server):
+    body = b'{"items": [' + b'"x",' * 1000 + b'"x"]}'
+    assert gzip.decompress(server.compress_body(body, "gzip")) == body
@@ -0,0 +1,82 @@
+"""Customer renames and deletions fan out to invoices, quotes and todos in a background job."""
+from tests.conftest import create_customer, create_invoice, create_quote
+
+
+def rename(api, customer, name):
+    payload = {key: customer[key] for key in ("email", "address", "postal_code", "city")}
+    response = api.put(f"/api/customers/{customer['id']}", json={**payload, "name": name})
+    assert response.status_code == 200, response.text
+    return response
+
+
+def create_todo(api, customer_id):
+    response = api.post("/api/todos", json={
+        "title": "Rückruf", "customer_id": customer_id, "due_date": "2026-10-01", "due_time": "09:00"
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_rename_fans_out_to_invoices_and_quotes(api, server, monkeypatch):
+    monkeypatch.setattr(server, "CUSTOMER_PROPAGATION_BATCH_SIZE", 1)  # exercise several batches
+    customer = create_customer(api, name="Alt GmbH")
+    other = create_customer(api, name="Andere AG")
+    invoices = [create_invoice(api, customer["id"]) for _ in range(2)]
+    quote = create_quote(api, customer["id"])
+    todo = create_todo(api, customer["id"])
+    untouched = create_invoice(api, other["id"])
+    cursor = api.get("/api/sync").json()["cursor"]
+
+    response = rename(api, customer, "Neu GmbH")
+
+    job = api.get(f"/api/jobs/{response.headers['X-Job-Id']}").json()
+    assert job["status"] == "completed"
+    assert (job["total"], job["succeeded"]) == (4, 4)
+    for invoice in invoices:
+        assert api.get(f"/api/invoices/{invoice['id']}").json()["customer_name"] == "Neu GmbH"
+    assert api.get(f"/api/quotes/{quote['id']}").json()["customer_name"] == "Neu GmbH"
+    assert api.get(f"/api/todos/{todo['id']}").json()["customer_name"] == "Neu GmbH"
+    assert api.get(f"/api/invoices/{untouched['id']}").json()["customer_name"] == "Andere AG"
+
+    # The renamed documents reach offline clients through the sync delta
+    delta = api.get("/api/sync", params={"since": cursor}).json()
+    assert sorted(doc["id"] for doc in delta["changes"]["invoices"]) == sorted(invoice["id"] for invoice in invoices)
+    assert [doc["id"] for doc in delta["changes"]["quotes"]] == [quote["id"]]
+
+
+def test_unchanged_name_starts_no_job(api):
+    customer = create_customer(api, name="Gleich GmbH")
+    create_invoice(api, customer["id"])
+    assert "X-Job-Id" not in rename(api, customer, "Gleich GmbH").headers
+
+
+def test_superseded_rename_stops_without_writing_the_stale_name(api, server):
+    customer = create_customer(api, name="Alt GmbH")
+    invoice = create_invoice(api, customer["id"])
+    rename(api, customer, "Neu GmbH")
+
+    async def propagate_stale_name():
+        job = await server.create_job("customer-name-propagation")
+        await server.propagate_customer_name(job.id, customer["id"], "Zwischenname GmbH")
+        return job.id
+
+    job_id = api.portal.call(propagate_stale_name)
+    assert api.get(f"/api/jobs/{job_id}").json()["result"] == {"superseded": True}
+    assert api.get(f"/api/invoices/{invoice['id']}").json()["customer_name"] == "Neu GmbH"
+
+
+def test_deleted_customer_keeps_invoices_and_unlinks_todos(api):
+    customer = create_customer(api)
+    invoice = create_invoice(api, customer["id"])
+    quote = create_quote(api, customer["id"])
+    todo = create_todo(api, customer["id"])
+
+    response = api.delete(f"/api/customers/{customer['id']}")
+    assert response.status_code == 200
+    assert api.get(f"/api/jobs/{response.json()['job_id']}").json()["status"] == "completed"
+
+    kept_invoice = api.get(f"/api/invoices/{invoice['id']}").json()
+    assert kept_invoice["customer_deleted"] is True
+    assert kept_invoice["customer_name"] == customer["name"]
+    assert api.get(f"/api/quotes/{quote['id']}").json()["customer_deleted"] is True
+    assert api.get(f"/api/todos/{todo['id']}").json()["customer_id"] is None
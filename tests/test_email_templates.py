@@ -0,0 +1,51 @@
+"""Email templates: compiled once at startup, escaped for HTML, render times recorded."""
+import pytest
+
+pytest.importorskip("jinja2")
+
+TODO_CONTEXT = {
+    "todo": {"title": "Angebot <b>nachfassen</b>", "description": "Tom & Jerry"},
+    "customer": {"name": "Muster GmbH"},
+    "company": {"company_name": "Muster & Co"},
+    "due_date": "01.10.2026",
+    "due_time": "09:00",
+}
+
+
+def test_templates_are_compiled_at_startup(server, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(server, "compiled_templates", {})
+    with TestClient(server.app):
+        assert sorted(server.compiled_templates) == sorted(server.EMAIL_TEMPLATES)
+
+        def no_compiling():
+            raise AssertionError("template compiled again")
+
+        # Rendering reuses the compiled template instead of loading it again
+        monkeypatch.setattr(server, "get_jinja_env", no_compiling)
+        assert "Muster GmbH" in server.render_template("todo_reminder_email.txt", **TODO_CONTEXT)
+
+
+def test_html_templates_escape_user_text(server):
+    html = server.render_template("todo_reminder_email.html", **TODO_CONTEXT)
+    assert "Angebot &lt;b&gt;nachfassen&lt;/b&gt;" in html
+    assert "Tom &amp; Jerry" in html
+    assert "Muster &amp; Co" in html
+
+    text = server.render_template("todo_reminder_email.txt", **TODO_CONTEXT)
+    assert "ToDo-Erinnerung: Angebot <b>nachfassen</b>" in text
+    assert "Beschreibung: Tom & Jerry" in text
+
+
+def test_render_times_are_reported(api, server, monkeypatch):
+    monkeypatch.setattr(server, "template_render_stats", {})
+    monkeypatch.setattr(server, "PROFILE_TOKEN", "s3cret")
+    for _ in range(3):
+        server.render_template("todo_reminder_email.txt", **TODO_CONTEXT)
+
+    metrics = api.get("/api/admin/metrics/templates", headers={"Authorization": "Bearer s3cret"}).json()
+    stats = metrics["todo_reminder_email.txt"]
+    assert stats["count"] == 3
+    assert stats["max_ms"] <= stats["total_ms"]
+    assert stats["avg_ms"] == pytest.approx(stats["total_ms"] / 3)
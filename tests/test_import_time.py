@@ -0,0 +1,52 @@
+"""Cold start budget for the backend.
+
+Imports server.py in a fresh interpreter under ``python -X importtime`` and
+checks the cumulative import time against IMPORT_TIME_BUDGET_MS. Subsystems
+that only some requests need (PDF rendering, email, forecasting) must stay
+out of the import entirely, so they are checked by module name as well.
+"""
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", 1500))
+LAZY_MODULES = ("reportlab", "jinja2", "aiosmtplib", "PIL", "numpy", "pdf_rendering")
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile_server_import():
+    """Return ({module: cumulative_us}, loaded top-level packages) for a fresh import"""
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "import_time_test")
+    env["SCHEDULER_ENABLED"] = "false"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import sys, server; print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return cumulative, set(result.stdout.split())
+
+
+def test_heavy_subsystems_are_not_imported():
+    _, loaded = profile_server_import()
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    assert not eager, f"imported at startup, should load on first use: {eager}"
+
+
+def test_server_import_within_budget():
+    cumulative, _ = profile_server_import()
+    total_ms = cumulative["server"] / 1000
+    slowest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:15]
+    profile = "\n".join(f"{us / 1000:9.1f} ms  {name}" for name, us in slowest)
+    assert total_ms <= IMPORT_TIME_BUDGET_MS, (
+        f"importing server took {total_ms:.0f} ms (budget {IMPORT_TIME_BUDGET_MS:.0f} ms)\n{profile}"
+    )
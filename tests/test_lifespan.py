@@ -0,0 +1,61 @@
+"""Application lifespan and scheduler leader election."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+
+def test_app_can_be_started_again_after_shutdown(server):
+    for _ in range(2):
+        with TestClient(server.app) as api:
+            assert server.render_pool is not None
+            rendered = api.portal.call(server.run_in_render_pool, sum, [1, 2, 3])
+            assert rendered == 6
+        assert server.render_pool is None
+
+
+def test_only_one_worker_holds_the_scheduler_lease(api, server):
+    async def elect():
+        assert await server.try_acquire_leadership()
+        # Renewing our own lease keeps it
+        assert await server.try_acquire_leadership()
+        await server.db.leases.update_one({"_id": "scheduler"}, {"$set": {"holder": "other-worker"}})
+        taken = await server.try_acquire_leadership()
+        # An expired lease is taken over
+        await server.db.leases.update_one(
+            {"_id": "scheduler"}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        recovered = await server.try_acquire_leadership()
+        await server.release_leadership()
+        return taken, recovered, await server.db.leases.count_documents({})
+
+    assert api.portal.call(elect) == (False, True, 0)
+
+
+def test_scheduler_runs_jobs_only_while_leader(api, server, monkeypatch):
+    runs = []
+
+    async def probe():
+        runs.append(datetime.now(timezone.utc))
+
+    monkeypatch.setattr(server, "scheduled_jobs", [{"name": "probe", "interval": 3600, "job": probe}])
+
+    async def run_scheduler_briefly():
+        task = asyncio.create_task(server.run_scheduler())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    api.portal.call(lambda: server.db.leases.insert_one({
+        "_id": "scheduler", "holder": "other-worker",
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)
+    }))
+    api.portal.call(run_scheduler_briefly)
+    assert runs == []
+
+    api.portal.call(lambda: server.db.leases.delete_many({}))
+    api.portal.call(run_scheduler_briefly)
+    assert len(runs) == 1
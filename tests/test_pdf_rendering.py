@@ -0,0 +1,67 @@
+"""Invoice PDF layout: long invoices paginate with the header and page footer on every page."""
+import pytest
+
+
+@pytest.fixture
+def recording_canvas():
+    canvas_module = pytest.importorskip("reportlab.pdfgen.canvas")
+
+    class RecordingCanvas(canvas_module.Canvas):
+        """Canvas that keeps the strings drawn on each page"""
+        pages = []
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            RecordingCanvas.pages = [[]]
+
+        def drawString(self, x, y, text, *args, **kwargs):
+            RecordingCanvas.pages[-1].append(text)
+            return super().drawString(x, y, text, *args, **kwargs)
+
+        def drawRightString(self, x, y, text, *args, **kwargs):
+            RecordingCanvas.pages[-1].append(text)
+            return super().drawRightString(x, y, text, *args, **kwargs)
+
+        def drawCentredString(self, x, y, text, *args, **kwargs):
+            RecordingCanvas.pages[-1].append(text)
+            return super().drawCentredString(x, y, text, *args, **kwargs)
+
+        def showPage(self):
+            super().showPage()
+            RecordingCanvas.pages.append([])
+
+    return RecordingCanvas
+
+
+def test_long_invoice_repeats_header_and_footer_on_every_page(server, recording_canvas):
+    items = [
+        {"description": f"Position {i}", "quantity": 1.0, "unit_price": 10.0, "total_price": 10.0}
+        for i in range(1, 301)
+    ]
+    invoice = {
+        "invoice_number": "INV-0300",
+        "items": items,
+        "subtotal": 3000.0,
+        "tax_rate": 19.0,
+        "tax_amount": 570.0,
+        "total_amount": 3570.0,
+        "invoice_date": "2026-09-01T00:00:00",
+        "due_date": "2026-10-01T00:00:00",
+        "apply_tax": True,
+    }
+    customer = {"name": "Kunde GmbH", "address": "Weg 1", "postal_code": "12345", "city": "Berlin"}
+    company = {**server.DEFAULT_COMPANY, "company_name": "Muster & Co"}
+
+    pdf = server.render_invoice_pdf(invoice, customer, company, canvasmaker=recording_canvas)
+    assert pdf.getvalue().startswith(b"%PDF")
+
+    pages = [strings for strings in recording_canvas.pages if strings]
+    assert len(pages) > 1
+    for number, strings in enumerate(pages, 1):
+        assert "Beschreibung" in strings and "Einzelpreis" in strings
+        assert "Muster & Co" in strings
+        assert f"Seite {number}" in strings
+
+    drawn_positions = [text for strings in pages for text in strings if text.startswith("Position ")]
+    assert drawn_positions == [f"Position {i}" for i in range(1, 301)]
+    assert "€3570.00" in pages[-1]
@@ -0,0 +1,116 @@
+"""Request profiling: opt-in sampler with per-request attribution, token-protected admin endpoints."""
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+
+def burn_cpu_for_a(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def burn_cpu_for_b(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+@pytest.fixture
+def sampled_app(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "PROFILE_SLOW_REQUEST_MS", 1)
+    monkeypatch.setattr(server, "PROFILE_DIR", tmp_path)
+    monkeypatch.setattr(server.stack_sampler, "interval", 0.002)
+    app = FastAPI()
+
+    @app.get("/a")
+    async def endpoint_a():
+        for _ in range(5):
+            burn_cpu_for_a(0.02)
+            await asyncio.sleep(0)
+        return {}
+
+    @app.get("/b")
+    async def endpoint_b():
+        for _ in range(5):
+            burn_cpu_for_b(0.02)
+            await asyncio.sleep(0)
+        return {}
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            yield "event: ping\ndata: {}\n\n"
+            await asyncio.sleep(0.01)
+            yield f"event: sampled\ndata: {len(server.stack_sampler.requests)}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return server.ProfilingMiddleware(app)
+
+
+def request_concurrently(app, *paths):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.get(path) for path in paths))
+    return asyncio.run(run())
+
+
+def sampled_profiles(directory):
+    profiles = [json.loads(path.read_text()) for path in directory.glob("*.json")]
+    return {profile["path"]: profile["report"] for profile in profiles}
+
+
+def test_samples_are_attributed_to_their_own_request(sampled_app, tmp_path):
+    responses = request_concurrently(sampled_app, "/a", "/b")
+    assert [response.status_code for response in responses] == [200, 200]
+
+    reports = sampled_profiles(tmp_path)
+    assert "burn_cpu_for_a" in reports["/a"] and "burn_cpu_for_b" not in reports["/a"]
+    assert "burn_cpu_for_b" in reports["/b"] and "burn_cpu_for_a" not in reports["/b"]
+
+
+def test_streaming_responses_stop_being_sampled(sampled_app, server, tmp_path):
+    response = request_concurrently(sampled_app, "/stream")[0]
+    assert "event: sampled\ndata: 0" in response.text
+    assert server.stack_sampler.requests == {}
+    assert sampled_profiles(tmp_path) == {}
+
+
+def test_sampler_is_off_by_default(api, server, monkeypatch):
+    assert server.PROFILE_SLOW_REQUEST_MS == 0
+
+    def fail(task):
+        raise AssertionError("sampler started")
+
+    monkeypatch.setattr(server.stack_sampler, "request_started", fail)
+    assert api.get("/api/customers").status_code == 200
+
+
+def test_admin_endpoints_require_the_profile_token(api, server, monkeypatch):
+    assert api.get("/api/admin/profiles").status_code == 403
+
+    monkeypatch.setattr(server, "PROFILE_TOKEN", "s3cret")
+    assert api.get("/api/admin/profiles").status_code == 401
+    assert api.get("/api/admin/metrics/queries", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    authorized = {"Authorization": "Bearer s3cret"}
+    assert api.get("/api/admin/metrics/queries", headers=authorized).status_code == 200
+    assert api.get("/api/admin/profiles/0000000000000-00000000", headers=authorized).status_code == 404
+
+
+def test_profile_token_is_only_accepted_as_a_header(api, server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(server, "PROFILE_DIR", tmp_path)
+
+    assert "X-Profile-Id" not in api.get("/api/customers", params={"_profile": "s3cret"}).headers
+    # Non-ASCII header values are compared as bytes instead of failing the request
+    response = api.get("/api/customers", headers={"X-Profile": "gehe\xefm".encode("latin-1")})
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+    assert "X-Profile-Id" in api.get("/api/customers", headers={"X-Profile": "s3cret"}).headers
@@ -0,0 +1,98 @@
+"""Quote-to-invoice conversion: one invoice per quote, no gaps in the numbering."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from tests.conftest import create_customer, create_quote
+
+YIELDING_METHODS = ("find_one", "update_many", "insert_many", "bulk_write", "find_one_and_update")
+
+
+@pytest.fixture
+def interleaved(server, monkeypatch):
+    """Make every collection call yield to the event loop first, as a real
+    driver does, so concurrent requests interleave between database calls"""
+    collection_class = type(server.db.quotes)
+    for name in YIELDING_METHODS:
+        original = getattr(collection_class, name)
+
+        def make_yielding(original):
+            async def yielding(self, *args, **kwargs):
+                await asyncio.sleep(0)
+                return await original(self, *args, **kwargs)
+            return yielding
+
+        monkeypatch.setattr(collection_class, name, make_yielding(original))
+
+
+def accepted_quote(api):
+    customer = create_customer(api)
+    quote = create_quote(api, customer["id"])
+    assert api.put(f"/api/quotes/{quote['id']}/status", json={"status": "accepted"}).status_code == 200
+    return quote
+
+
+def converted_invoices(api, server, quote_id):
+    return api.portal.call(lambda: server.db.invoices.find(
+        {"converted_from_quote_id": quote_id}, {"_id": 0}
+    ).to_list(length=None))
+
+
+def test_parallel_conversions_create_one_invoice(api, server, interleaved):
+    quote = accepted_quote(api)
+
+    async def convert_twice():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post(f"/api/quotes/{quote['id']}/convert-to-invoice") for _ in range(2)
+            ))
+
+    responses = api.portal.call(convert_twice)
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    invoices = converted_invoices(api, server, quote["id"])
+    assert len(invoices) == 1
+    assert api.get(f"/api/quotes/{quote['id']}").json()["status"] == "converted"
+
+
+def test_failed_conversion_hands_its_invoice_number_back(api, server, monkeypatch):
+    quote = accepted_quote(api)
+    collection_class = type(server.db.invoices)
+    original_insert_many = collection_class.insert_many
+
+    async def failing_insert_many(self, *args, **kwargs):
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(collection_class, "insert_many", failing_insert_many)
+    with pytest.raises(RuntimeError):
+        api.post(f"/api/quotes/{quote['id']}/convert-to-invoice")
+    assert api.get(f"/api/quotes/{quote['id']}").json()["status"] == "accepted"
+
+    monkeypatch.setattr(collection_class, "insert_many", original_insert_many)
+    retried = api.post(f"/api/quotes/{quote['id']}/convert-to-invoice")
+    assert retried.status_code == 200
+    assert retried.json()["invoice_number"] == "INV-0001"
+
+
+def test_stale_claims_are_settled(api, server):
+    finished = accepted_quote(api)
+    abandoned = accepted_quote(api)
+    claimed_at = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+
+    async def crash_mid_conversion():
+        await server.db.quotes.update_many(
+            {"id": {"$in": [finished["id"], abandoned["id"]]}},
+            {"$set": {"status": "converting", "conversion_claim": "crashed", "conversion_claimed_at": claimed_at}}
+        )
+        # The worker wrote the invoice of the first quote before it died
+        quote = await server.db.quotes.find_one({"id": finished["id"]})
+        await server.db.invoices.insert_one(server.build_invoice_from_quote(quote, "INV-0001", 1))
+        await server.recover_stale_conversions()
+
+    api.portal.call(crash_mid_conversion)
+    invoice = converted_invoices(api, server, finished["id"])[0]
+    assert api.get(f"/api/quotes/{finished['id']}").json()["converted_to_invoice_id"] == invoice["id"]
+    assert api.get(f"/api/quotes/{finished['id']}").json()["status"] == "converted"
+    assert api.get(f"/api/quotes/{abandoned['id']}").json()["status"] == "accepted"
@@ -0,0 +1,61 @@
+"""Recurring invoices: template tax rate, date validation, gapless numbering."""
+from tests.conftest import create_customer
+
+
+def create_recurring(api, customer_id, start_date="2026-08-01", **fields):
+    payload = {
+        "customer_id": customer_id,
+        "items": [{"type": "service", "unit": "Monat", "description": "Wartung",
+                   "quantity": 1, "unit_price": 200.0}],
+        "start_date": start_date,
+        **fields
+    }
+    return api.post("/api/recurring-invoices", json=payload)
+
+
+def invoice_counter(api, server):
+    counter = api.portal.call(lambda: server.db.counters.find_one({"_id": "invoice_number"}))
+    return counter["value"] if counter else 0
+
+
+def test_totals_use_the_template_tax_rate(api):
+    customer = create_customer(api)
+    response = create_recurring(api, customer["id"], tax_rate=7.0)
+    assert response.status_code == 200, response.text
+    recurring = response.json()
+    assert recurring["tax_rate"] == 7.0
+    assert recurring["tax_amount"] == 14.0
+    assert recurring["total_amount"] == 214.0
+
+    updated = api.put(f"/api/recurring-invoices/{recurring['id']}", json={"tax_rate": 19.0}).json()
+    assert updated["tax_amount"] == 38.0
+    assert updated["total_amount"] == 238.0
+
+
+def test_malformed_dates_are_rejected(api):
+    customer = create_customer(api)
+    assert create_recurring(api, customer["id"], start_date="01.08.2026").status_code == 400
+    assert api.post("/api/recurring-invoices/run", params={"as_of": "gestern"}).status_code == 400
+
+    recurring = create_recurring(api, customer["id"]).json()
+    response = api.put(f"/api/recurring-invoices/{recurring['id']}", json={"next_run_date": "bald"})
+    assert response.status_code == 400
+
+
+def test_rerun_over_billed_periods_reserves_no_numbers(api, server):
+    customer = create_customer(api)
+    recurring = create_recurring(api, customer["id"]).json()
+    assert api.post("/api/recurring-invoices/run", params={"as_of": "2026-09-15"}).status_code == 200
+    assert invoice_counter(api, server) == 2
+
+    # A crashed run: invoices were written but next_run_date never advanced
+    api.portal.call(lambda: server.db.recurring_invoices.update_one(
+        {"id": recurring["id"]}, {"$set": {"next_run_date": "2026-08-01T00:00:00"}}
+    ))
+    assert api.post("/api/recurring-invoices/run", params={"as_of": "2026-10-15"}).status_code == 200
+
+    invoices = api.portal.call(lambda: server.db.invoices.find(
+        {"recurring_invoice_id": recurring["id"]}, {"_id": 0}
+    ).sort("recurring_period", 1).to_list(length=None))
+    assert [invoice["invoice_number"][-3:] for invoice in invoices] == ["001", "002", "003"]
+    assert invoice_counter(api, server) == 3
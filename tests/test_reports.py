@@ -0,0 +1,32 @@
+"""Reports take "today" from the UTC clock, not the server's local time."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+UTC_NOW = datetime(2026, 10, 19, 23, 30, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def berlin_clock(server, monkeypatch):
+    """Freeze the clock shortly before midnight UTC on a server running on
+    Berlin time, where the local date is already the next day"""
+    class BerlinDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            if tz is None:
+                return (UTC_NOW + timedelta(hours=2)).replace(tzinfo=None)
+            return UTC_NOW.astimezone(tz)
+
+    monkeypatch.setattr(server, "datetime", BerlinDatetime)
+
+
+def test_aging_report_defaults_to_the_utc_date(api, berlin_clock):
+    report = api.get("/api/reports/aging").json()
+    assert report["as_of"] == "2026-10-19"
+
+
+def test_vat_period_closes_by_the_utc_date(api, server, berlin_clock, monkeypatch):
+    # September closes at midnight UTC starting 2026-10-20
+    monkeypatch.setattr(server, "VAT_CLOSE_AFTER_DAYS", 19)
+    report = api.get("/api/reports/vat", params={"period": "2026-09"}).json()
+    assert report["closed"] is False
@@ -0,0 +1,111 @@
+"""Delta sync: /api/sync returns exactly what changed after the cursor."""
+from datetime import datetime, timedelta, timezone
+
+from tests.conftest import create_customer, create_invoice
+
+
+def test_delta_returns_only_documents_changed_after_cursor(api):
+    customer = create_customer(api)
+    invoices = [create_invoice(api, customer["id"]) for _ in range(5)]
+
+    full = api.get("/api/sync").json()
+    assert len(full["changes"]["invoices"]) == 5
+
+    changed = invoices[2]["id"]
+    assert api.put(f"/api/invoices/{changed}/status", json={"status": "sent"}).status_code == 200
+
+    delta = api.get("/api/sync", params={"since": full["cursor"]}).json()
+    assert [invoice["id"] for invoice in delta["changes"]["invoices"]] == [changed]
+    assert delta["changes"]["customers"] == []
+    assert delta["cursor"] > full["cursor"]
+
+    again = api.get("/api/sync", params={"since": delta["cursor"]}).json()
+    assert all(not documents for documents in again["changes"].values())
+
+
+def test_cursor_stays_below_writes_in_flight(api, server):
+    customer = create_customer(api)
+    before = api.get("/api/sync").json()["cursor"]
+
+    async def write_late():
+        async with server.sync_write() as slow_seq:
+            # A faster write reserves and lands while the slow one is pending
+            async with server.sync_write() as fast_seq:
+                await server.db.customers.update_one(
+                    {"id": customer["id"]}, {"$set": {"city": "Hamburg", "updated_seq": fast_seq}}
+                )
+            held_back = await server.current_sync_seq(floor=before)
+            await server.db.customers.update_one(
+                {"id": customer["id"]}, {"$set": {"address": "Elbchaussee 1", "updated_seq": slow_seq}}
+            )
+        return slow_seq, held_back, await server.current_sync_seq(floor=before)
+
+    slow_seq, held_back, released = api.portal.call(write_late)
+    assert held_back == slow_seq - 1
+    assert released == slow_seq + 1
+
+    delta = api.get("/api/sync", params={"since": held_back}).json()
+    assert [changed["address"] for changed in delta["changes"]["customers"]] == ["Elbchaussee 1"]
+
+
+def test_archived_documents_are_reported_as_deleted(api):
+    customer = create_customer(api)
+    invoice = create_invoice(api, customer["id"], invoice_date="2023-03-01")
+    api.put(f"/api/invoices/{invoice['id']}/status", json={"status": "paid", "paid_at": "2023-03-20"})
+    cursor = api.get("/api/sync").json()["cursor"]
+
+    assert api.post("/api/archive/run").status_code == 200
+
+    delta = api.get("/api/sync", params={"since": cursor}).json()
+    assert delta["deleted"]["invoices"] == [invoice["id"]]
+    assert delta["changes"]["invoices"] == []
+
+
+def test_a_write_moves_the_counter_document_once(api, server, monkeypatch):
+    customer = create_customer(api)
+    counter_calls = []
+    collection_class = type(server.db.counters)
+    for name in ("find_one_and_update", "update_one"):
+        original = getattr(collection_class, name)
+
+        def make_counting(name, original):
+            async def counting(self, *args, **kwargs):
+                if self.name == "counters":
+                    counter_calls.append(name)
+                return await original(self, *args, **kwargs)
+            return counting
+
+        monkeypatch.setattr(collection_class, name, make_counting(name, original))
+
+    assert api.put(f"/api/customers/{customer['id']}", json={**customer, "city": "Köln"}).status_code == 200
+    assert counter_calls == ["find_one_and_update"]
+
+
+def test_cursor_older_than_the_tombstone_window_gets_a_full_resync(api, server):
+    customer = create_customer(api)
+    stale_cursor = api.get("/api/sync").json()["cursor"]
+    removed = create_customer(api, name="Alt GmbH")
+    assert api.delete(f"/api/customers/{removed['id']}").status_code == 200
+
+    current = api.get("/api/sync").json()["cursor"]
+    delta = api.get("/api/sync", params={"since": stale_cursor}).json()
+    assert delta["full_resync"] is False
+    assert delta["deleted"]["customers"] == [removed["id"]]
+
+    # The window has passed since the stale cursor; its tombstone may be gone
+    now = datetime.now(timezone.utc)
+    api.portal.call(lambda: server.db.sync_checkpoints.insert_many([
+        {"seq": stale_cursor, "created_at": now - timedelta(days=server.SYNC_TOMBSTONE_TTL_DAYS + 1)},
+        {"seq": current, "created_at": now - timedelta(days=1)},
+    ]))
+    resync = api.get("/api/sync", params={"since": stale_cursor}).json()
+    assert resync["full_resync"] is True
+    assert [changed["id"] for changed in resync["changes"]["customers"]] == [customer["id"]]
+
+    assert api.get("/api/sync", params={"since": current}).json()["full_resync"] is False
+
+
+def test_tombstones_expire(api, server):
+    indexes = api.portal.call(server.db.sync_tombstones.index_information)
+    ttl = [index for index in indexes.values() if "expireAfterSeconds" in index]
+    assert [index["key"] for index in ttl] == [[("deleted_at", 1)]]
@@ -0,0 +1,71 @@
+"""Due ToDo reminders are claimed atomically, so concurrent checks send each one once."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+class SentMails(list):
+    """Todo ids of the reminders sent, `outcome` decides what sending returns"""
+
+
+@pytest.fixture
+def due_todo(api):
+    response = api.post("/api/todos", json={"title": "Rückruf", "due_date": "2026-01-01", "due_time": "08:00"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def sent_mails(server, monkeypatch):
+    sent = SentMails()
+    outcome = {"success": True}
+
+    async def send_todo_reminder_email(todo, customer, company):
+        await asyncio.sleep(0.01)  # let a concurrent check run in between
+        sent.append(todo["id"])
+        return outcome["success"]
+
+    monkeypatch.setattr(server.email_service, "send_todo_reminder_email", send_todo_reminder_email)
+    sent.outcome = outcome
+    return sent
+
+
+def test_concurrent_checks_send_each_reminder_once(api, server, due_todo, sent_mails):
+    async def two_workers():
+        await asyncio.gather(server.check_due_todos_task(), server.send_todo_reminder_task(due_todo["id"]))
+
+    api.portal.call(two_workers)
+    assert sent_mails == [due_todo["id"]]
+    todo = api.get(f"/api/todos/{due_todo['id']}").json()
+    assert todo["reminder_sent"] is True
+
+    # The manual trigger does not send it again either
+    assert api.get("/api/todos/due/check").status_code == 200
+    assert sent_mails == [due_todo["id"]]
+
+
+def test_failed_send_releases_the_claim(api, server, due_todo, sent_mails):
+    sent_mails.outcome["success"] = False
+    api.portal.call(server.send_todo_reminder_task, due_todo["id"])
+    todo = api.portal.call(server.db.todos.find_one, {"id": due_todo["id"]})
+    assert todo["reminder_sent"] is False
+    assert "reminder_claimed_at" not in todo
+
+    sent_mails.outcome["success"] = True
+    api.portal.call(server.send_todo_reminder_task, due_todo["id"])
+    assert sent_mails == [due_todo["id"]] * 2
+
+
+def test_stale_claims_are_taken_over(api, server, due_todo, sent_mails):
+    fresh = datetime.now(timezone.utc).isoformat()
+    stale = (datetime.now(timezone.utc) - timedelta(minutes=server.REMINDER_CLAIM_TIMEOUT_MINUTES + 1)).isoformat()
+
+    async def claim_at(claimed_at):
+        await server.db.todos.update_one({"id": due_todo["id"]}, {"$set": {"reminder_claimed_at": claimed_at}})
+        await server.send_todo_reminder_task(due_todo["id"])
+
+    api.portal.call(claim_at, fresh)
+    assert sent_mails == []
+    api.portal.call(claim_at, stale)
+    assert sent_mails == [due_todo["id"]]